@@ -1,2 +1,2 @@
-from .bcwallet import cli
-from .bcwallet import invoke_cli
+from .launcher import cli
+from .launcher import invoke_cli
@@ -0,0 +1,4 @@
+# python -m bcwallet
+from .launcher import invoke_cli
+
+invoke_cli()
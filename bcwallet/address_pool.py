@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+# Unused receiving/change addresses registered (with /derive) and verified
+# client-side ahead of time, so a send or "Show new receiving addresses" is
+# served from memory instead of waiting on BlockCypher
+#
+# Nothing is registered until an address is first taken from a subchain: that
+# one is registered on the spot (as without a pool) and the subchain is then
+# filled in the background. From then on it is topped back up to size whenever
+# it drops below low_water. If a subchain runs dry (e.g. a refill failed),
+# addresses are registered on the spot again.
+#
+# Addresses still in the pool on quit were registered but never handed out,
+# so they are skipped for good. Because only sessions that hand out an address
+# fill the pool, that leaves a gap of at most size addresses after the last
+# address handed out, which is why --address-pool is capped below the gap
+# limit (idle sessions leave no gap at all).
+
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+import threading
+
+
+class AddressPool(object):
+    '''
+    Pre-registered, pre-verified unused addresses per subchain
+
+    register_addresses(subchain_index, num_addrs) must return a list of
+    verified AddressPath records (as register_unused_addresses does).
+    '''
+
+    def __init__(self, register_addresses, size, low_water=None, subchain_indices=(0, 1)):
+        assert size > 0, size
+        if low_water is None:
+            low_water = (size + 1) // 2
+        assert 0 < low_water <= size, low_water
+
+        self.register_addresses = register_addresses
+        self.size = size
+        self.low_water = low_water
+        self.addresses = dict((x, deque()) for x in subchain_indices)
+
+        # subchain_index -> AsyncResult of the refill in flight
+        self.refills = {}
+        self.lock = threading.Lock()
+
+        # one refill at a time, so refills don't compete for the same connections
+        self.refill_pool = ThreadPool(processes=1)
+
+    def _refill(self, subchain_index):
+        with self.lock:
+            num_addrs = self.size - len(self.addresses[subchain_index])
+        if num_addrs > 0:
+            new_addresses = self.register_addresses(subchain_index, num_addrs)
+            with self.lock:
+                self.addresses[subchain_index].extend(new_addresses)
+
+    def _start_refill(self, subchain_index):
+        # caller holds self.lock
+        pending = self.refills.get(subchain_index)
+        if pending is None or pending.ready():
+            self.refills[subchain_index] = self.refill_pool.apply_async(self._refill, (subchain_index, ))
+
+    def take(self, subchain_index, num_addrs=1):
+        '''
+        num_addrs unused addresses of subchain_index, each handed out only once
+        '''
+        assert subchain_index in self.addresses, subchain_index
+        assert num_addrs > 0, num_addrs
+
+        with self.lock:
+            pooled = self.addresses[subchain_index]
+            taken = [pooled.popleft() for _ in range(min(num_addrs, len(pooled)))]
+
+        if len(taken) < num_addrs:
+            # first use (or the pool ran dry), register the rest now
+            taken.extend(self.register_addresses(subchain_index, num_addrs - len(taken)))
+
+        with self.lock:
+            if len(self.addresses[subchain_index]) < self.low_water:
+                self._start_refill(subchain_index)
+
+        return taken
+
+    def has_subchain(self, subchain_index):
+        return subchain_index in self.addresses
+
+    def close(self):
+        '''
+        Stop any refill in flight and wait for the worker thread to exit
+        '''
+        self.refill_pool.terminate()
+        self.refill_pool.join()
@@ -6,7 +6,31 @@ from bitmerchant.network import BlockCypherTestNet
 
 from bitmerchant.wallet import Wallet
 
+from binascii import hexlify
+from binascii import unhexlify
+
+from collections import deque
+from collections import OrderedDict
+
+import multiprocessing
+import signal
+import threading
+
+from blockcypher import api as blockcypher_api
+from blockcypher.api import RateLimitError
+from blockcypher.api import TIMEOUT_IN_SECONDS
+from blockcypher.constants import COIN_SYMBOL_MAPPINGS
 from blockcypher.utils import is_valid_coin_symbol, is_valid_hash, coin_symbol_from_mkey
+from blockcypher.utils import get_blockcypher_walletname_from_mpub
+
+from .ec_backend import derive_child_infos
+from .ec_backend import derive_child_keys
+from .ec_backend import make_tx_signatures
+
+from .http_session import session_get
+
+from .key_encoding import pubkeys_to_addresses
+from .key_encoding import privkeys_to_wifs
 
 # collection of blockchain/crypto utilities and helper methods
 
@@ -18,76 +42,559 @@ COIN_SYMBOL_TO_BMERCHANT_NETWORK = {
         'bcy': BlockCypherTestNet,
         }
 
+# (chain_code, pubkeyhex, is_private, chain_int) -> chain wallet node
+CHAIN_WALLET_CACHE = {}
+
+# master_key -> deserialized master wallet
+MASTER_WALLET_CACHE = {}
+
+# max number of verified address paths kept for the session
+VERIFIED_ADDRESS_CACHE_SIZE = 10000
+
+# (master_key, path) -> verified child key info, least recently used first
+VERIFIED_ADDRESS_CACHE = OrderedDict()
+
+# the cache is also filled from background threads (see address_pool)
+VERIFIED_ADDRESS_CACHE_LOCK = threading.Lock()
+
+# max addresses per semicolon-batched /addrs call
+ADDRESS_BATCH_SIZE = 100
+
+# number of children each worker process derives per task
+DERIVATION_CHUNK_SIZE = 250
+
+# serialized chain key -> chain wallet node (per worker process)
+WORKER_CHAIN_WALLETS = {}
+
+# inputs signed per job when signing in parallel
+SIGNATURE_CHUNK_SIZE = 25
+
+# approximate signed P2PKH transaction sizes (compressed pubkeys)
+TX_OVERHEAD_BYTES = 10
+P2PKH_INPUT_BYTES = 148
+P2PKH_OUTPUT_BYTES = 34
+
 
 def guess_network_from_mkey(mkey):
     cs = coin_symbol_from_mkey(mkey)
     return COIN_SYMBOL_TO_BMERCHANT_NETWORK.get(cs)
 
 
+class WalletContext(object):
+    '''
+    Identity of the booted wallet, derived once per session
+
+    Serializing the master key and hashing it into a wallet name are not free,
+    so everything that only depends on the master key is computed up front.
+    '''
+
+    def __init__(self, wallet_obj):
+        self.wallet_obj = wallet_obj
+        self.mpub = wallet_obj.serialize_b58(private=False)
+        if wallet_obj.private_key:
+            self.mpriv = wallet_obj.serialize_b58(private=True)
+        else:
+            self.mpriv = None
+        self.wallet_name = get_blockcypher_walletname_from_mpub(
+                mpub=self.mpub,
+                subchain_indices=[0, 1],
+                )
+        self.coin_symbol = str(coin_symbol_from_mkey(self.mpub))
+        self.network = guess_network_from_mkey(self.mpub)
+
+    @property
+    def has_private_key(self):
+        return self.mpriv is not None
+
+    @property
+    def master_key(self):
+        '''
+        The most powerful serialized key available (mpriv if present)
+        '''
+        return self.mpriv or self.mpub
+
+
+def get_chain_wallet(wallet_obj, chain_int):
+    '''
+    Derive the m/chain_int node of wallet_obj once and cache it for the session
+
+    Walking children from the cached chain node means each child costs a single
+    derivation step instead of re-deriving the whole path from the master key.
+    '''
+    cache_key = (
+            wallet_obj.chain_code,
+            wallet_obj.get_public_key_hex(compressed=True),
+            bool(wallet_obj.private_key),
+            chain_int,
+            )
+    if cache_key not in CHAIN_WALLET_CACHE:
+        CHAIN_WALLET_CACHE[cache_key] = wallet_obj.get_child(chain_int, is_prime=False)
+    return CHAIN_WALLET_CACHE[cache_key]
+
+
+def make_derivation_pool(jobs):
+    '''
+    A process pool for derive_address_rows, for callers that derive many
+    ranges (the caller terminates it)
+    '''
+    return multiprocessing.Pool(processes=jobs, initializer=_init_derivation_worker)
+
+
+def derive_address_rows(wallet_obj, chain_int, start, stop, jobs=1, chunk_size=DERIVATION_CHUNK_SIZE, pool=None):
+    '''
+    Yield (index, address, wif) for m/chain_int/k with start <= k < stop
+
+    wif is None if wallet_obj has no private key.
+
+    With jobs > 1 the index range is split into chunk_size chunks that are
+    derived across a process pool (unless it's a single chunk). Only the
+    serialized chain key is shipped to the workers, and rows are yielded in
+    path order. The pool is started for this call unless one from
+    make_derivation_pool is passed in.
+    '''
+    chain_wallet = get_chain_wallet(wallet_obj=wallet_obj, chain_int=chain_int)
+
+    if jobs <= 1 or stop - start <= chunk_size:
+        for chunk_start in range(start, stop, chunk_size):
+            chunk_stop = min(chunk_start + chunk_size, stop)
+            for row in _derive_chain_rows(chain_wallet, chunk_start, chunk_stop):
+                yield row
+        return
+
+    chain_key = chain_wallet.serialize_b58(private=bool(chain_wallet.private_key))
+
+    own_pool = pool is None
+    if own_pool:
+        pool = make_derivation_pool(jobs)
+    try:
+        # bound the number of chunks in flight so memory stays flat
+        pending = deque()
+        for chunk_start in range(start, stop, chunk_size):
+            chunk_stop = min(chunk_start + chunk_size, stop)
+            pending.append(pool.apply_async(_derive_address_chunk,
+                (chain_key, chunk_start, chunk_stop)))
+            if len(pending) >= jobs * 4:
+                for row in pending.popleft().get():
+                    yield row
+        while pending:
+            for row in pending.popleft().get():
+                yield row
+    finally:
+        if own_pool:
+            pool.terminate()
+            pool.join()
+
+
+def _init_derivation_worker():
+    # let the parent process handle ctrl-c (also used by the signing pool)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _derive_address_chunk(chain_key, start, stop):
+    if chain_key not in WORKER_CHAIN_WALLETS:
+        WORKER_CHAIN_WALLETS[chain_key] = Wallet.deserialize(
+                chain_key,
+                network=guess_network_from_mkey(chain_key),
+                )
+    return _derive_chain_rows(WORKER_CHAIN_WALLETS[chain_key], start, stop)
+
+
+def _derive_chain_rows(chain_wallet, start, stop):
+    # addresses and WIFs of the whole range are encoded in one batch
+    child_infos = derive_child_infos(chain_wallet=chain_wallet, indices=range(start, stop))
+    return [(index, child_info['address'], child_info.get('wif'))
+            for index, child_info in zip(range(start, stop), child_infos)]
+
+
+def sign_tx_digests(txs_to_sign, privkey_list, pubkey_list, jobs=1):
+    '''
+    make_tx_signatures, with the inputs spread across a process pool when
+    jobs > 1
+
+    Signatures are returned in txs_to_sign order, and since signing uses
+    deterministic (RFC6979) k values they match the serial result exactly.
+    '''
+    assert len(privkey_list) == len(pubkey_list) == len(txs_to_sign)
+
+    if jobs <= 1 or len(txs_to_sign) <= SIGNATURE_CHUNK_SIZE:
+        return make_tx_signatures(
+                txs_to_sign=txs_to_sign,
+                privkey_list=privkey_list,
+                pubkey_list=pubkey_list,
+                )
+
+    chunks = []
+    for chunk_start in range(0, len(txs_to_sign), SIGNATURE_CHUNK_SIZE):
+        chunk_stop = chunk_start + SIGNATURE_CHUNK_SIZE
+        chunks.append((
+            txs_to_sign[chunk_start:chunk_stop],
+            privkey_list[chunk_start:chunk_stop],
+            pubkey_list[chunk_start:chunk_stop],
+            ))
+
+    pool = multiprocessing.Pool(
+            processes=min(jobs, len(chunks)),
+            initializer=_init_derivation_worker,
+            )
+    try:
+        # map keeps chunk order
+        signature_chunks = pool.map(_sign_chunk, chunks)
+    finally:
+        pool.terminate()
+        pool.join()
+
+    return [sig for signature_chunk in signature_chunks for sig in signature_chunk]
+
+
+def _sign_chunk(chunk):
+    txs_to_sign, privkey_list, pubkey_list = chunk
+    return make_tx_signatures(
+            txs_to_sign=txs_to_sign,
+            privkey_list=privkey_list,
+            pubkey_list=pubkey_list,
+            )
+
+
 def get_tx_url(tx_hash, coin_symbol):
     assert is_valid_coin_symbol(coin_symbol), coin_symbol
     assert is_valid_hash(tx_hash), tx_hash
     return 'https://live.blockcypher.com/%s/tx/%s/' % (coin_symbol, tx_hash)
 
 
+def chunk_iterable(iterable, chunk_size):
+    '''
+    Yield lists of up to chunk_size consecutive items from iterable
+    '''
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def estimate_p2pkh_tx_size(num_inputs, num_outputs):
+    '''
+    Approximate size (in bytes) of a signed P2PKH transaction
+    '''
+    return TX_OVERHEAD_BYTES + num_inputs * P2PKH_INPUT_BYTES + num_outputs * P2PKH_OUTPUT_BYTES
+
+
+def estimate_individual_fees(batched_fees, num_inputs, num_outputs, num_payments):
+    '''
+    Estimate what num_payments would cost sent one transaction at a time (at
+    the same fee per byte as the batched transaction), assuming the smallest
+    possible individual transaction: 1 input, 1 payment and 1 change output.
+    '''
+    fee_per_byte = float(batched_fees) / estimate_p2pkh_tx_size(num_inputs, num_outputs)
+    return int(num_payments * fee_per_byte * estimate_p2pkh_tx_size(1, 2))
+
+
+# TODO: move to blockcypher python library
+def get_addresses_overview(address_list, coin_symbol='btc', api_key=None):
+    '''
+    Batched version of blockcypher's get_address_overview
+
+    Hits /addrs/addr1;addr2;.../balance and returns a list of overview dicts
+    (final_balance, n_tx, total_received, etc) in the same order as address_list.
+    '''
+    assert is_valid_coin_symbol(coin_symbol), coin_symbol
+    assert 0 < len(address_list) <= ADDRESS_BATCH_SIZE, len(address_list)
+
+    url = '%s/%s/%s/%s/addrs/%s/balance' % (
+            blockcypher_api.BLOCKCYPHER_DOMAIN,
+            blockcypher_api.ENDPOINT_VERSION,
+            COIN_SYMBOL_MAPPINGS[coin_symbol]['blockcypher_code'],
+            COIN_SYMBOL_MAPPINGS[coin_symbol]['blockcypher_network'],
+            ';'.join([str(addr) for addr in address_list]),
+            )
+
+    params = {}
+    if api_key:
+        params['token'] = api_key
+
+    r = session_get(url, params=params, verify=True, timeout=TIMEOUT_IN_SECONDS)
+    if r.status_code == 429:
+        raise RateLimitError('Status Code 429', r.text)
+
+    response = r.json()
+    if type(response) is dict:
+        # API returns a single object (not a list) for a batch of one
+        if 'error' in response:
+            raise Exception(response['error'])
+        response = [response, ]
+
+    overview_dict = dict([(x.get('address'), x) for x in response])
+    for address in address_list:
+        if address not in overview_dict:
+            raise Exception('No balance returned for %s' % address)
+    return [overview_dict[address] for address in address_list]
+
+
+def get_total_balances(address_list, coin_symbol='btc', api_key=None):
+    '''
+    Batched version of blockcypher's get_total_balance
+
+    Returns a dict of address -> balance (in satoshis) including confirmed and
+    unconfirmed transactions, with one API call per ADDRESS_BATCH_SIZE addresses.
+    '''
+    balances = {}
+    for address_chunk in chunk_iterable(address_list, ADDRESS_BATCH_SIZE):
+        overviews = get_addresses_overview(
+                address_list=address_chunk,
+                coin_symbol=coin_symbol,
+                api_key=api_key,
+                )
+        for overview in overviews:
+            balances[overview['address']] = overview['final_balance']
+    return balances
+
+
+def get_master_wallet(master_key, network):
+    '''
+    Deserialize master_key once per session
+    '''
+    if master_key not in MASTER_WALLET_CACHE:
+        MASTER_WALLET_CACHE[master_key] = Wallet.deserialize(master_key, network=network)
+    return MASTER_WALLET_CACHE[master_key]
+
+
+def parse_chain_path(path):
+    '''
+    Turn a non-hardened m/chain/index path into (chain_int, index)
+
+    Returns None for any other kind of path.
+    '''
+    parts = path.split('/')
+    if len(parts) != 3 or parts[0] != 'm':
+        return None
+    if not (parts[1].isdigit() and parts[2].isdigit()):
+        return None
+    return int(parts[1]), int(parts[2])
+
+
+class AddressPath(object):
+    '''
+    A client-side verified address and its keys
+
+    Keys are kept as raw bytes and the path as (chain_int, index), so a large
+    set of these takes about a third of the memory of the equivalent dicts
+    (about 355 vs 1060 bytes per verified address). The hex, WIF and path
+    strings are only built when they're accessed, and to_dict() gives the
+    old {'pub_address', 'path', 'pubkeyhex', 'wif', 'privkeyhex'} dict.
+    '''
+
+    __slots__ = ('chain_int', 'index', 'address', 'pubkey', 'privkey', 'network', 'other_path')
+
+    def __init__(self, path, address, pubkey, privkey=None, network=None):
+        assert privkey is None or network, network
+        chain_path = parse_chain_path(path)
+        if chain_path:
+            self.chain_int, self.index = chain_path
+            self.other_path = None
+        else:
+            # e.g. a hardened path, kept as is
+            self.chain_int, self.index = None, None
+            self.other_path = path
+        self.address = address
+        self.pubkey = pubkey
+        self.privkey = privkey
+        self.network = network
+
+    def __repr__(self):
+        return '<AddressPath %s %s>' % (self.path, self.address)
+
+    @property
+    def path(self):
+        if self.other_path is not None:
+            return self.other_path
+        return 'm/%d/%d' % (self.chain_int, self.index)
+
+    @property
+    def pubkeyhex(self):
+        return hexlify(self.pubkey)
+
+    @property
+    def privkeyhex(self):
+        if self.privkey is None:
+            return None
+        return hexlify(self.privkey)
+
+    @property
+    def wif(self):
+        if self.privkey is None:
+            return None
+        return privkeys_to_wifs([self.privkey], self.network)[0]
+
+    def to_dict(self):
+        address_path_dict = {
+                'pub_address': self.address,
+                'path': self.path,
+                'pubkeyhex': self.pubkeyhex,
+                }
+        if self.privkey is not None:
+            address_path_dict['wif'] = self.wif
+            address_path_dict['privkeyhex'] = self.privkeyhex
+        return address_path_dict
+
+
+def wallet_to_address_path(path, child_wallet):
+    if child_wallet.private_key:
+        privkey = unhexlify(child_wallet.get_private_key_hex())
+    else:
+        privkey = None
+    return AddressPath(
+            path=path,
+            address=child_wallet.to_address(),
+            pubkey=unhexlify(child_wallet.get_public_key_hex(compressed=True)),
+            privkey=privkey,
+            network=child_wallet.network,
+            )
+
+
+def get_verified_child_infos(master_key, network, paths):
+    '''
+    Derive an AddressPath (with the private key if master_key has it) for each
+    of paths
+
+    Results are kept in a bounded LRU cache for the session. Misses are
+    derived from the cached chain node rather than from the master key, and
+    the addresses of the misses on each chain are encoded in one batch.
+    '''
+    with VERIFIED_ADDRESS_CACHE_LOCK:
+        address_paths = [VERIFIED_ADDRESS_CACHE.pop((master_key, path), None) for path in paths]
+
+    if None in address_paths:
+        wallet_obj = get_master_wallet(master_key=master_key, network=network)
+
+    # chain_int -> [(position in paths, child index), ...] of the misses
+    chain_misses = {}
+    for cnt, path in enumerate(paths):
+        if address_paths[cnt] is not None:
+            continue
+        chain_path = parse_chain_path(path)
+        if chain_path:
+            chain_int, index = chain_path
+            chain_misses.setdefault(chain_int, []).append((cnt, index))
+        else:
+            address_paths[cnt] = wallet_to_address_path(path, wallet_obj.get_child_for_path(path))
+
+    for chain_int, misses in chain_misses.items():
+        chain_wallet = get_chain_wallet(wallet_obj=wallet_obj, chain_int=chain_int)
+        child_keys = derive_child_keys(
+                chain_wallet=chain_wallet,
+                indices=[child_index for _, child_index in misses],
+                )
+        addresses = pubkeys_to_addresses([pubkey for pubkey, _ in child_keys], network)
+        for (cnt, _), (pubkey, privkey), address in zip(misses, child_keys, addresses):
+            address_paths[cnt] = AddressPath(
+                    path=paths[cnt],
+                    address=address,
+                    pubkey=pubkey,
+                    privkey=privkey,
+                    network=network,
+                    )
+
+    # (re)insert as most recently used
+    with VERIFIED_ADDRESS_CACHE_LOCK:
+        for path, address_path in zip(paths, address_paths):
+            VERIFIED_ADDRESS_CACHE[(master_key, path)] = address_path
+        while len(VERIFIED_ADDRESS_CACHE) > VERIFIED_ADDRESS_CACHE_SIZE:
+            VERIFIED_ADDRESS_CACHE.popitem(last=False)
+
+    return address_paths
+
+
+def preload_verified_address_paths(master_key, address_paths):
+    '''
+    Seed the verified address cache with previously verified public info
+
+    address_paths is a list of {'path', 'address', 'pubkeyhex'} dicts.
+    '''
+    with VERIFIED_ADDRESS_CACHE_LOCK:
+        for address_path in address_paths:
+            cache_key = (master_key, address_path['path'])
+            if cache_key not in VERIFIED_ADDRESS_CACHE:
+                VERIFIED_ADDRESS_CACHE[cache_key] = AddressPath(
+                        path=address_path['path'],
+                        address=address_path['address'],
+                        pubkey=unhexlify(address_path['pubkeyhex']),
+                        )
+        while len(VERIFIED_ADDRESS_CACHE) > VERIFIED_ADDRESS_CACHE_SIZE:
+            VERIFIED_ADDRESS_CACHE.popitem(last=False)
+
+
+def get_verified_address_paths(master_key):
+    '''
+    Public info ({'path', 'address', 'pubkeyhex'}) for cached paths of master_key
+    '''
+    address_paths = []
+    with VERIFIED_ADDRESS_CACHE_LOCK:
+        cached_items = VERIFIED_ADDRESS_CACHE.items()
+    for (cached_master_key, path), address_path in cached_items:
+        if cached_master_key == master_key:
+            address_paths.append({
+                'path': path,
+                'address': address_path.address,
+                'pubkeyhex': address_path.pubkeyhex,
+                })
+    return address_paths
+
+
 def verify_and_fill_address_paths_from_bip32key(address_paths, master_key, network):
     '''
     Take address paths and verifies their accuracy client-side.
 
-    Also fills in all the available metadata (WIF, public key, etc)
+    Returns an AddressPath for each, with all the available metadata (WIF,
+    public key, etc). Use address_paths_to_dicts for the old dicts.
     '''
 
     assert network, network
 
-    wallet_obj = Wallet.deserialize(master_key, network=network)
+    verified_address_paths = get_verified_child_infos(
+            master_key=master_key,
+            network=network,
+            paths=[address_path['path'] for address_path in address_paths],
+            )
 
-    address_paths_cleaned = []
-
-    for address_path in address_paths:
+    for address_path, verified_address_path in zip(address_paths, verified_address_paths):
         path = address_path['path']
         input_address = address_path['address']
-        child_wallet = wallet_obj.get_child_for_path(path)
 
-        if child_wallet.to_address() != input_address:
+        if verified_address_path.address != input_address:
             err_msg = 'Client Side Verification Fail for %s on %s:\n%s != %s' % (
                     path,
                     master_key,
-                    child_wallet.to_address(),
+                    verified_address_path.address,
                     input_address,
                     )
             raise Exception(err_msg)
 
-        pubkeyhex = child_wallet.get_public_key_hex(compressed=True)
-
         server_pubkeyhex = address_path.get('public')
-        if server_pubkeyhex and server_pubkeyhex != pubkeyhex:
+        if server_pubkeyhex and server_pubkeyhex != verified_address_path.pubkeyhex:
             err_msg = 'Client Side Verification Fail for %s on %s:\n%s != %s' % (
                     path,
                     master_key,
-                    pubkeyhex,
+                    verified_address_path.pubkeyhex,
                     server_pubkeyhex,
                     )
             raise Exception(err_msg)
 
-        address_path_cleaned = {
-            'pub_address': input_address,
-            'path': path,
-            'pubkeyhex': pubkeyhex,
-            }
+    return verified_address_paths
 
-        if child_wallet.private_key:
-            privkeyhex = child_wallet.get_private_key_hex()
-            address_path_cleaned['wif'] = child_wallet.export_to_wif()
-            address_path_cleaned['privkeyhex'] = privkeyhex
-        address_paths_cleaned.append(address_path_cleaned)
 
-    return address_paths_cleaned
+def address_paths_to_dicts(address_paths):
+    '''
+    AddressPath records as {'pub_address', 'path', 'pubkeyhex', 'wif',
+    'privkeyhex'} dicts (wif/privkeyhex only with a private key)
+    '''
+    return [address_path.to_dict() for address_path in address_paths]
 
 
-def hexkeypair_list_to_dict(hexkeypair_list):
-    hexkeypair_dict = {}
-    for hexkeypair in hexkeypair_list:
-        pub_address = hexkeypair['pub_address']
-        hexkeypair.pop('pub_address')
-        hexkeypair_dict[pub_address] = hexkeypair
-    return hexkeypair_dict
+def hexkeypair_list_to_dict(address_paths):
+    '''
+    AddressPath records keyed by address
+    '''
+    return dict((address_path.address, address_path) for address_path in address_paths)
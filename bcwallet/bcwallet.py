@@ -1,30 +1,24 @@
 # -*- coding: utf-8 -*-
 
 import sys
-import argparse
-import pkg_resources
+import atexit
+import csv
+import json
+import time
 import traceback
 
+from collections import OrderedDict
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+
 # just for printing
 from clint.textui import puts, colored, indent
 
 from bitmerchant.wallet import Wallet
 
-from blockcypher.api import create_hd_wallet
-from blockcypher.api import get_wallet_transactions
-from blockcypher.api import get_wallet_addresses
-from blockcypher.api import get_wallet_balance
-from blockcypher.api import derive_hd_address
-from blockcypher.api import create_unsigned_tx
-from blockcypher.api import verify_unsigned_tx
-from blockcypher.api import get_input_addresses
-from blockcypher.api import make_tx_signatures
-from blockcypher.api import broadcast_signed_transaction
-from blockcypher.api import get_total_balance
-from blockcypher.api import get_blockchain_overview
-
-from blockcypher.utils import get_blockcypher_walletname_from_mpub
-from blockcypher.utils import coin_symbol_from_mkey
+from blockcypher import api as blockcypher_api
+from blockcypher.api import RateLimitError
+
 from blockcypher.utils import format_crypto_units
 from blockcypher.utils import from_satoshis
 from blockcypher.utils import to_satoshis
@@ -34,17 +28,26 @@ from blockcypher.utils import uses_only_hash_chars
 
 from blockcypher.constants import COIN_SYMBOL_MAPPINGS
 
+from . import bc_utils
 from .bc_utils import guess_network_from_mkey
-from .bc_utils import verify_and_fill_address_paths_from_bip32key
 from .bc_utils import get_tx_url
 from .bc_utils import hexkeypair_list_to_dict
+from .bc_utils import derive_address_rows
+from .bc_utils import chunk_iterable
+from .bc_utils import ADDRESS_BATCH_SIZE
 from .bc_utils import COIN_SYMBOL_TO_BMERCHANT_NETWORK
+from .bc_utils import WalletContext
+from .bc_utils import preload_verified_address_paths
+from .bc_utils import get_verified_address_paths
+from .bc_utils import estimate_individual_fees
+from .bc_utils import parse_chain_path
 
 from .cl_utils import debug_print
 from .cl_utils import choice_prompt
 from .cl_utils import get_public_wallet_url
 from .cl_utils import get_crypto_address
 from .cl_utils import get_wif_obj
+from .cl_utils import get_file_path
 from .cl_utils import get_crypto_qty
 from .cl_utils import get_int
 from .cl_utils import confirm
@@ -60,23 +63,121 @@ from .cl_utils import print_bcwallet_piped_priv_cat_opening
 from .cl_utils import print_bcwallet_basic_pub_opening
 from .cl_utils import print_childprivkey_warning
 from .cl_utils import print_keys_not_saved
-from .cl_utils import UNIT_CHOICES
 from .cl_utils import BCWALLET_PRIVPIPE_EXPLANATION
 from .cl_utils import BCWALLET_PRIVPIPE_CAT_EXPLANATION
 from .cl_utils import BCWALLET_PIPE_ENCRYPTION_EXPLANATION
 from .cl_utils import DEFAULT_PROMPT
-from .cl_utils import EXPLAINER_COPY
+from .cl_utils import get_payouts_from_csv
+
+from .launcher import get_arg_parser
+from .launcher import BCWALLET_VERSION
+from .launcher import EXPLAINER_COPY
+from .launcher import BIP32_MAX_INDEX
+from .launcher import DEFAULT_GAP_LIMIT
+from .launcher import MAX_ADDRESS_POOL_SIZE
+from .launcher import OFFLINE_COMMANDS
+
+from .discovery import discover_used_addresses
+
+from .portfolio import read_portfolio_file
+from .portfolio import fetch_portfolio
+from .portfolio import get_portfolio_totals
+
+from .watcher import WalletWatcher
+from .watcher import PENDING_EVENT
+from .watcher import NEW_EVENT
+from .watcher import CONFIRMED_EVENT
+from .watcher import CONFIRMATION_EVENT
+from .watcher import DOUBLE_SPEND_EVENT
+from .watcher import DROPPED_EVENT
+
+from .ec_backend import get_backend_name
+from .ec_backend import run_self_test
+
+from .offline_tx import make_unsigned_record
+from .offline_tx import get_change_satoshis
+from .offline_tx import make_signed_record
+from .offline_tx import record_to_unsigned_tx
+from .offline_tx import write_offline_txs
+from .offline_tx import read_offline_tx_header
+from .offline_tx import iter_offline_tx_records
+from .offline_tx import OfflineTxFormatError
+from .offline_tx import UNSIGNED_KIND
+from .offline_tx import SIGNED_KIND
+
+from .pub_cache import PublicDataCache
+
+from .address_pool import AddressPool
+
+from .http_session import install_shared_session
+from .http_session import set_api_base
+
+from .instrumentation import enable_profile
+from .instrumentation import instrumented
+from .instrumentation import print_session_summary
+from .instrumentation import write_profile
 
 from .version_checker import get_latest_bcwallet_version
 from .version_checker import GITHUB_URL
 
 from tzlocal import get_localzone
 
+# BlockCypher calls, plus the local verification and signing steps of a send,
+# are timed for the session summary (and --profile)
+create_hd_wallet = instrumented('api', blockcypher_api.create_hd_wallet)
+get_wallet_transactions = instrumented('api', blockcypher_api.get_wallet_transactions)
+get_wallet_addresses = instrumented('api', blockcypher_api.get_wallet_addresses)
+get_wallet_balance = instrumented('api', blockcypher_api.get_wallet_balance)
+derive_hd_address = instrumented('api', blockcypher_api.derive_hd_address)
+create_unsigned_tx = instrumented('api', blockcypher_api.create_unsigned_tx)
+broadcast_signed_transaction = instrumented('api', blockcypher_api.broadcast_signed_transaction)
+get_total_balance = instrumented('api', blockcypher_api.get_total_balance)
+get_blockchain_overview = instrumented('api', blockcypher_api.get_blockchain_overview)
+get_total_balances = instrumented('api', bc_utils.get_total_balances)
+
+verify_unsigned_tx = instrumented('crypto', blockcypher_api.verify_unsigned_tx)
+get_input_addresses = instrumented('crypto', blockcypher_api.get_input_addresses)
+verify_and_fill_address_paths_from_bip32key = instrumented('crypto', bc_utils.verify_and_fill_address_paths_from_bip32key)
+sign_tx_digests = instrumented('crypto', bc_utils.sign_tx_digests)
+
 # Globals that can be overwritten at startup
 VERBOSE_MODE = False
 USER_ONLINE = False
 BLOCKCYPHER_API_KEY = ''
 UNIT_CHOICE = ''
+DERIVATION_JOBS = 1
+PUB_CACHE_ENABLED = False
+
+# PublicDataCache for this session (opt-in, watch-only wallets only)
+PUB_CACHE = None
+
+# unused addresses kept ready per subchain (0 for none, see --address-pool)
+ADDRESS_POOL_SIZE = 0
+
+# AddressPool for this session (once the wallet is registered)
+ADDRESS_POOL = None
+
+# payments staged to be sent together in one transaction, as
+# {'address': '1abc...', 'value': 10000} outputs
+PAYMENT_QUEUE = []
+
+# max payments per transaction for non-interactive sends
+BATCH_SEND_MAX_OUTPUTS = 200
+
+# write buffer for `bcwallet dump` exports
+EXPORT_BUFFER_SIZE = 2**20
+
+# txrefs to fetch per page of transaction history
+TXN_PAGE_SIZE = 50
+
+# most txrefs BlockCypher returns in one wallet transactions call
+MAX_TXN_LIMIT = 2000
+
+# how long to wait on each concurrent startup request
+STARTUP_TIMEOUT_IN_SECONDS = 15
+
+# set once the HTTP session, API server and instrumentation are set up
+SESSION_CONFIGURED = False
 
 
 def verbose_print(to_print):
@@ -93,27 +194,26 @@ def is_connected_to_blockcypher():
         return False
 
 
-def display_balance_info(wallet_obj, verbose=False):
+def display_balance_info(wallet_ctx, verbose=False, wallet_details=None):
+    '''
+    Fetch and display the wallet balance
+
+    Pass in wallet_details (a get_wallet_balance response) to skip the fetch.
+    '''
     if not USER_ONLINE:
         return
 
-    mpub = wallet_obj.serialize_b58(private=False)
+    coin_symbol = wallet_ctx.coin_symbol
 
-    wallet_name = get_blockcypher_walletname_from_mpub(
-            mpub=mpub,
-            subchain_indices=[0, 1],
-            )
-
-    verbose_print('Wallet Name: %s' % wallet_name)
-    verbose_print('API Key: %s' % BLOCKCYPHER_API_KEY)
-
-    coin_symbol = coin_symbol_from_mkey(mpub)
+    if wallet_details is None:
+        verbose_print('Wallet Name: %s' % wallet_ctx.wallet_name)
+        verbose_print('API Key: %s' % BLOCKCYPHER_API_KEY)
 
-    wallet_details = get_wallet_balance(
-            wallet_name=wallet_name,
-            api_key=BLOCKCYPHER_API_KEY,
-            coin_symbol=coin_symbol,
-            )
+        wallet_details = get_wallet_balance(
+                wallet_name=wallet_ctx.wallet_name,
+                api_key=BLOCKCYPHER_API_KEY,
+                coin_symbol=coin_symbol,
+                )
     verbose_print(wallet_details)
 
     puts('-' * 70 + '\n')
@@ -144,54 +244,40 @@ def display_balance_info(wallet_obj, verbose=False):
     puts(colored.green(tx_string + '\n'))
 
     puts('More info:')
-    puts(colored.blue(get_public_wallet_url(mpub)))
+    puts(colored.blue(get_public_wallet_url(wallet_ctx.mpub)))
     puts()
 
     return wallet_details['final_balance']
 
 
-def get_addresses_on_both_chains(wallet_obj, used=None, zero_balance=None):
+def get_addresses_on_both_chains(wallet_ctx, used=None, zero_balance=None):
     '''
     Get addresses across both subchains based on the filter criteria passed in
 
-    Returns a list of dicts of the following form:
-        [
-            {'address': '1abc123...', 'path': 'm/0/9', 'pubkeyhex': '0123456...'},
-            ...,
-        ]
+    Returns a list of {'index': 0, 'chain_addresses': [AddressPath, ...]}
+    dicts, one per subchain with addresses
 
-    Dicts may also contain WIF and privkeyhex if wallet_obj has private key
+    The AddressPaths also have the WIF and privkeyhex if the wallet has a
+    private key
     '''
-    mpub = wallet_obj.serialize_b58(private=False)
-
-    wallet_name = get_blockcypher_walletname_from_mpub(
-            mpub=mpub,
-            subchain_indices=[0, 1],
-            )
-
     wallet_addresses = get_wallet_addresses(
-            wallet_name=wallet_name,
+            wallet_name=wallet_ctx.wallet_name,
             api_key=BLOCKCYPHER_API_KEY,
             is_hd_wallet=True,
             used=used,
             zero_balance=zero_balance,
-            coin_symbol=coin_symbol_from_mkey(mpub),
+            coin_symbol=wallet_ctx.coin_symbol,
             )
     verbose_print('wallet_addresses:')
     verbose_print(wallet_addresses)
 
-    if wallet_obj.private_key:
-        master_key = wallet_obj.serialize_b58(private=True)
-    else:
-        master_key = mpub
-
     chains_address_paths_cleaned = []
     for chain in wallet_addresses['chains']:
         if chain['chain_addresses']:
             chain_address_paths = verify_and_fill_address_paths_from_bip32key(
                     address_paths=chain['chain_addresses'],
-                    master_key=master_key,
-                    network=guess_network_from_mkey(mpub),
+                    master_key=wallet_ctx.master_key,
+                    network=wallet_ctx.network,
                     )
             chain_address_paths_cleaned = {
                     'index': chain['index'],
@@ -202,15 +288,11 @@ def get_addresses_on_both_chains(wallet_obj, used=None, zero_balance=None):
     return chains_address_paths_cleaned
 
 
-def register_unused_addresses(wallet_obj, subchain_index, num_addrs=1):
+def register_unused_addresses(wallet_ctx, subchain_index, num_addrs=1):
     '''
     Hit /derive to register new unused_addresses on a subchain_index and verify them client-side
 
-    Returns a list of dicts of the following form:
-        [
-            {'address': '1abc123...', 'path': 'm/0/9', 'public': '0123456...'},
-            ...,
-        ]
+    Returns a list of AddressPath records (see bc_utils)
     '''
 
     verbose_print('register_unused_addresses called on subchain %s for %s addrs' % (
@@ -222,21 +304,13 @@ def register_unused_addresses(wallet_obj, subchain_index, num_addrs=1):
     assert type(num_addrs) is int, num_addrs
     assert num_addrs > 0
 
-    mpub = wallet_obj.serialize_b58(private=False)
-    coin_symbol = coin_symbol_from_mkey(mpub)
-    wallet_name = get_blockcypher_walletname_from_mpub(
-            mpub=mpub,
-            subchain_indices=[0, 1],
-            )
-    network = guess_network_from_mkey(mpub)
-
     # register new address(es)
     derivation_response = derive_hd_address(
             api_key=BLOCKCYPHER_API_KEY,
-            wallet_name=wallet_name,
+            wallet_name=wallet_ctx.wallet_name,
             num_addresses=num_addrs,
             subchain_index=subchain_index,
-            coin_symbol=coin_symbol,
+            coin_symbol=wallet_ctx.coin_symbol,
             )
 
     verbose_print('derivation_response:')
@@ -247,39 +321,64 @@ def register_unused_addresses(wallet_obj, subchain_index, num_addrs=1):
     # verify new addresses client-side
     full_address_paths = verify_and_fill_address_paths_from_bip32key(
             address_paths=address_paths,
-            master_key=mpub,
-            network=network,
+            master_key=wallet_ctx.mpub,
+            network=wallet_ctx.network,
             )
 
     return full_address_paths
 
 
-def get_unused_receiving_addresses(wallet_obj, num_addrs=1):
+def start_address_pool(wallet_ctx, subchain_indices=(0, 1)):
+    '''
+    Set up the unused address pool (if enabled)
+
+    Subchains are only filled once an address is first taken from them, so
+    sessions that never need one don't register (and skip) any addresses.
+    The wallet must be registered with BlockCypher.
+    '''
+    global ADDRESS_POOL
+    if not ADDRESS_POOL_SIZE or ADDRESS_POOL:
+        return
+    ADDRESS_POOL = AddressPool(
+            register_addresses=lambda subchain_index, num_addrs: register_unused_addresses(
+                wallet_ctx=wallet_ctx,
+                subchain_index=subchain_index,
+                num_addrs=num_addrs,
+                ),
+            size=ADDRESS_POOL_SIZE,
+            subchain_indices=subchain_indices,
+            )
+
+
+def get_unused_receiving_addresses(wallet_ctx, num_addrs=1):
+    if ADDRESS_POOL and ADDRESS_POOL.has_subchain(0):
+        return ADDRESS_POOL.take(subchain_index=0, num_addrs=num_addrs)
 
     return register_unused_addresses(
-            wallet_obj=wallet_obj,
+            wallet_ctx=wallet_ctx,
             subchain_index=0,  # external chain
             num_addrs=num_addrs,
             )
 
 
-def get_unused_change_addresses(wallet_obj, num_addrs=1):
+def get_unused_change_addresses(wallet_ctx, num_addrs=1):
+    if ADDRESS_POOL and ADDRESS_POOL.has_subchain(1):
+        return ADDRESS_POOL.take(subchain_index=1, num_addrs=num_addrs)
+
     return register_unused_addresses(
-            wallet_obj=wallet_obj,
+            wallet_ctx=wallet_ctx,
             subchain_index=1,  # internal chain
             num_addrs=num_addrs,
             )
 
 
-def display_new_receiving_addresses(wallet_obj):
+def display_new_receiving_addresses(wallet_ctx):
 
     if not USER_ONLINE:
         puts(colored.red('BlockCypher connection needed to see which addresses have been used.'))
         puts(colored.red('You may dump all your addresses offline by selecting option 0.'))
         return
 
-    mpub = wallet_obj.serialize_b58(private=False)
-
     puts('How many receiving addreses keys do you want to see (max 5 at a time)?')
     puts('Enter "b" to go back.\n')
 
@@ -298,7 +397,7 @@ def display_new_receiving_addresses(wallet_obj):
     verbose_print('num_addrs:\n%s' % num_addrs)
 
     unused_receiving_addresses = get_unused_receiving_addresses(
-            wallet_obj=wallet_obj,
+            wallet_ctx=wallet_ctx,
             num_addrs=num_addrs,
             )
 
@@ -309,19 +408,190 @@ def display_new_receiving_addresses(wallet_obj):
         addr_str = 'Address'
 
     puts('Unused %s Receiving %s - (for others to send you funds):' % (
-        COIN_SYMBOL_MAPPINGS[coin_symbol_from_mkey(mpub)]['currency_abbrev'],
+        COIN_SYMBOL_MAPPINGS[wallet_ctx.coin_symbol]['currency_abbrev'],
         addr_str,
         ))
 
     for unused_receiving_address in unused_receiving_addresses:
         with indent(2):
             puts(colored.green('%s (path is %s)' % (
-                unused_receiving_address['pub_address'],
-                unused_receiving_address['path'],
+                unused_receiving_address.address,
+                unused_receiving_address.path,
                 )))
 
 
-def display_recent_txs(wallet_obj):
+def get_block_txrefs(wallet_ctx, block_height, txn_limit, omit_addresses=False):
+    '''
+    Fetch all of a wallet's txrefs in one block, doubling the limit (up to
+    MAX_TXN_LIMIT) until they fit
+
+    Returns (txrefs, has_more), has_more meaning the block still didn't fit
+    '''
+    while True:
+        txn_limit = min(txn_limit * 2, MAX_TXN_LIMIT)
+        wallet_details = get_wallet_transactions(
+                wallet_name=wallet_ctx.wallet_name,
+                api_key=BLOCKCYPHER_API_KEY,
+                coin_symbol=wallet_ctx.coin_symbol,
+                before_bh=block_height + 1,
+                after_bh=block_height - 1,
+                txn_limit=txn_limit,
+                omit_addresses=omit_addresses,
+                )
+        verbose_print(wallet_details)
+        has_more = bool(wallet_details.get('hasMore'))
+        if not has_more or txn_limit >= MAX_TXN_LIMIT:
+            return wallet_details.get('txrefs', []), has_more
+
+
+def get_wallet_txref_pages(wallet_ctx, txn_limit=None, after_bh=None, omit_addresses=False):
+    '''
+    Generator that walks a wallet's transaction history one API page at a time
+
+    Yields (txrefs, has_more) tuples, newest first. Unconfirmed txrefs are
+    included on the first page only. If after_bh is set only transactions
+    above that block height are returned. omit_addresses leaves the wallet's
+    address list out of the responses.
+
+    Pages are split on block boundaries so a transaction's txrefs are never
+    split across two pages: txrefs from the lowest block in a page are held
+    back and refetched at the top of the next page. A block that doesn't fit
+    in one page is fetched whole with get_block_txrefs.
+    '''
+    if txn_limit is None:
+        txn_limit = TXN_PAGE_SIZE
+
+    before_bh = None
+    is_first_page = True
+    while True:
+        wallet_details = get_wallet_transactions(
+                wallet_name=wallet_ctx.wallet_name,
+                api_key=BLOCKCYPHER_API_KEY,
+                coin_symbol=wallet_ctx.coin_symbol,
+                before_bh=before_bh,
+                after_bh=after_bh,
+                txn_limit=txn_limit,
+                omit_addresses=omit_addresses,
+                )
+        verbose_print(wallet_details)
+
+        if is_first_page:
+            txrefs = wallet_details.get('unconfirmed_txrefs', [])
+            is_first_page = False
+        else:
+            txrefs = []
+
+        confirmed_txrefs = wallet_details.get('txrefs', [])
+        has_more = bool(wallet_details.get('hasMore')) and bool(confirmed_txrefs)
+
+        if has_more:
+            lowest_bh = min([x['block_height'] for x in confirmed_txrefs])
+            page_txrefs = [x for x in confirmed_txrefs if x['block_height'] > lowest_bh]
+            if page_txrefs:
+                # refetch the (possibly partial) lowest block on the next page
+                confirmed_txrefs = page_txrefs
+                before_bh = lowest_bh + 1
+            else:
+                # a single block holds more than a full page, so refetch just
+                # that block with a bigger limit and then move past it
+                confirmed_txrefs, block_has_more = get_block_txrefs(
+                        wallet_ctx=wallet_ctx,
+                        block_height=lowest_bh,
+                        txn_limit=txn_limit,
+                        omit_addresses=omit_addresses,
+                        )
+                if block_has_more:
+                    puts(colored.red('Block %s has more than %s transactions for this wallet, only the first %s are shown.' % (
+                        lowest_bh,
+                        len(confirmed_txrefs),
+                        len(confirmed_txrefs),
+                        )))
+                before_bh = lowest_bh
+
+        yield txrefs + confirmed_txrefs, has_more
+
+        if not has_more:
+            break
+
+
+def get_cached_wallet_txref_pages(wallet_ctx, pub_cache, txn_limit=None):
+    '''
+    Like get_wallet_txref_pages, but only fetches transactions newer than
+    what's in pub_cache and then streams the rest of the history from disk
+    '''
+    if txn_limit is None:
+        txn_limit = TXN_PAGE_SIZE
+
+    cached_bh = pub_cache.get_cached_block_height()
+    verbose_print('Cached block height: %s' % cached_bh)
+
+    highest_stored_bh = cached_bh
+    api_pages = get_wallet_txref_pages(
+            wallet_ctx=wallet_ctx,
+            txn_limit=txn_limit,
+            after_bh=cached_bh,
+            )
+    for txrefs, has_more in api_pages:
+        stored_bh = pub_cache.store_txrefs(txrefs)
+        if stored_bh is not None and (highest_stored_bh is None or stored_bh > highest_stored_bh):
+            highest_stored_bh = stored_bh
+
+        if not has_more:
+            # the whole delta has been seen, so it's safe to advance the cursor
+            if highest_stored_bh != cached_bh:
+                pub_cache.set_cached_block_height(highest_stored_bh)
+            has_more = cached_bh is not None
+        yield txrefs, has_more
+
+    if cached_bh is None:
+        return
+
+    cached_pages = pub_cache.iter_txref_pages(page_size=txn_limit, max_bh=cached_bh)
+    txrefs = next(cached_pages, None)
+    while txrefs is not None:
+        next_txrefs = next(cached_pages, None)
+        yield txrefs, next_txrefs is not None
+        txrefs = next_txrefs
+
+
+def print_tx_object(tx_object, coin_symbol, local_tz):
+    if tx_object.get('confirmed_at'):
+        tx_time = tx_object['confirmed_at']
+    else:
+        tx_time = tx_object['received_at']
+    net_satoshis_tx = sum(tx_object['txns_satoshis_list'])
+    conf_str = ''
+    has_confirmations = False
+    if tx_object.get('confirmed_at'):
+        if tx_object.get('confirmations'):
+            has_confirmations = True
+            if tx_object.get('confirmations') <= 6:
+                conf_str = ' (%s confirmations)' % tx_object.get('confirmations')
+            else:
+                conf_str = ' (6+ confirmations)'
+    else:
+        conf_str = ' (0 confirmations!)'
+    print_str = '%s: %s%s %s in TX hash %s%s' % (
+            tx_time.astimezone(local_tz).strftime("%Y-%m-%d %H:%M %Z"),
+            '+' if net_satoshis_tx > 0 else '',
+            format_crypto_units(
+                input_quantity=net_satoshis_tx,
+                input_type='satoshi',
+                output_type=UNIT_CHOICE,
+                coin_symbol=coin_symbol,
+                print_cs=True,
+                ),
+            'received' if net_satoshis_tx > 0 else 'sent',
+            tx_object['tx_hash'],
+            conf_str,
+            )
+    if has_confirmations:
+        puts(colored.green(print_str))
+    else:
+        puts(colored.yellow(print_str))
+
+
+def display_recent_txs(wallet_ctx):
     if not USER_ONLINE:
         puts(colored.red('BlockCypher connection needed to find transactions related to your addresses.'))
         puts(colored.red('You may dump all your addresses while offline by selecting option 0.'))
@@ -330,85 +600,233 @@ def display_recent_txs(wallet_obj):
     local_tz = get_localzone()
 
     # Show overall balance info
-    display_balance_info(wallet_obj=wallet_obj)
+    display_balance_info(wallet_ctx=wallet_ctx)
 
-    mpub = wallet_obj.serialize_b58(private=False)
-    wallet_name = get_blockcypher_walletname_from_mpub(
-            mpub=mpub,
-            subchain_indices=[0, 1],
-            )
+    if PUB_CACHE:
+        txref_pages = get_cached_wallet_txref_pages(
+                wallet_ctx=wallet_ctx,
+                pub_cache=PUB_CACHE,
+                )
+    else:
+        txref_pages = get_wallet_txref_pages(wallet_ctx=wallet_ctx)
+
+    txs_displayed = 0
+    for txrefs, has_more in txref_pages:
+        for tx_object in flatten_txns_by_hash(txrefs, nesting=False):
+            print_tx_object(
+                    tx_object=tx_object,
+                    coin_symbol=wallet_ctx.coin_symbol,
+                    local_tz=local_tz,
+                    )
+            txs_displayed += 1
 
-    wallet_details = get_wallet_transactions(
-            wallet_name=wallet_name,
+        if has_more:
+            puts('\nShow older transactions?')
+            if not confirm(user_prompt=DEFAULT_PROMPT, default=True):
+                break
+
+    if not txs_displayed:
+        puts('No Transactions')
+
+
+# watch events after which the balance may have changed
+BALANCE_EVENTS = (NEW_EVENT, CONFIRMED_EVENT, DOUBLE_SPEND_EVENT, DROPPED_EVENT)
+
+
+def print_watch_event(event, tx_object, coin_symbol, local_tz):
+    tx_hash = tx_object['tx_hash']
+    if event in (PENDING_EVENT, NEW_EVENT):
+        print_tx_object(
+                tx_object=tx_object,
+                coin_symbol=coin_symbol,
+                local_tz=local_tz,
+                )
+    elif event == CONFIRMED_EVENT:
+        puts(colored.green('TX hash %s confirmed in block %s' % (tx_hash, tx_object['block_height'])))
+    elif event == CONFIRMATION_EVENT:
+        puts(colored.green('TX hash %s now has %s confirmations' % (tx_hash, tx_object['confirmations'])))
+    elif event == DOUBLE_SPEND_EVENT:
+        puts(colored.red('TX hash %s is being double spent, it may never confirm!' % tx_hash))
+    elif event == DROPPED_EVENT:
+        puts(colored.red('TX hash %s is no longer seen by BlockCypher (double spent or dropped?)' % tx_hash))
+
+
+def print_watch_balance(wallet_ctx, previous_balances=None):
+    '''
+    Fetch the balance and print it unless it's still previous_balances
+
+    Returns the (final_balance, unconfirmed_balance) fetched.
+    '''
+    wallet_details = get_wallet_balance(
+            wallet_name=wallet_ctx.wallet_name,
             api_key=BLOCKCYPHER_API_KEY,
-            coin_symbol=coin_symbol_from_mkey(mpub),
+            coin_symbol=wallet_ctx.coin_symbol,
             )
     verbose_print(wallet_details)
 
-    # TODO: pagination for lots of transactions
+    balances = (wallet_details['final_balance'], wallet_details['unconfirmed_balance'])
+    if balances == previous_balances:
+        return balances
 
-    txs = wallet_details.get('unconfirmed_txrefs', []) + wallet_details.get('txrefs', [])
+    balance_str = 'Balance: %s' % format_crypto_units(
+            input_quantity=wallet_details['final_balance'],
+            input_type='satoshi',
+            output_type=UNIT_CHOICE,
+            coin_symbol=wallet_ctx.coin_symbol,
+            print_cs=True,
+            )
+    if wallet_details['unconfirmed_balance']:
+        balance_str += ' (%s unconfirmed)' % format_crypto_units(
+                input_quantity=wallet_details['unconfirmed_balance'],
+                input_type='satoshi',
+                output_type=UNIT_CHOICE,
+                coin_symbol=wallet_ctx.coin_symbol,
+                print_cs=True,
+                )
+    puts(colored.green(balance_str))
+    return balances
 
-    if txs:
-        for tx_object in flatten_txns_by_hash(txs, nesting=False):
-            if tx_object.get('confirmed_at'):
-                tx_time = tx_object['confirmed_at']
-            else:
-                tx_time = tx_object['received_at']
-            net_satoshis_tx = sum(tx_object['txns_satoshis_list'])
-            conf_str = ''
-            has_confirmations = False
-            if tx_object.get('confirmed_at'):
-                if tx_object.get('confirmations'):
-                    has_confirmations = True
-                    if tx_object.get('confirmations') <= 6:
-                        conf_str = ' (%s confirmations)' % tx_object.get('confirmations')
-                    else:
-                        conf_str = ' (6+ confirmations)'
-            else:
-                conf_str = ' (0 confirmations!)'
-            print_str = '%s: %s%s %s in TX hash %s%s' % (
-                    tx_time.astimezone(local_tz).strftime("%Y-%m-%d %H:%M %Z"),
-                    '+' if net_satoshis_tx > 0 else '',
-                    format_crypto_units(
-                        input_quantity=net_satoshis_tx,
-                        input_type='satoshi',
-                        output_type=UNIT_CHOICE,
-                        coin_symbol=coin_symbol_from_mkey(mpub),
-                        print_cs=True,
-                        ),
-                    'received' if net_satoshis_tx > 0 else 'sent',
-                    tx_object['tx_hash'],
-                    conf_str,
-                    )
-            if has_confirmations:
-                puts(colored.green(print_str))
-            else:
-                puts(colored.yellow(print_str))
-    else:
-        puts('No Transactions')
 
+def watch_wallet(wallet_ctx, interval):
+    '''
+    Non-interactive: poll for new transactions and confirmations until
+    ctrl-c, printing only what changed (and the new balance after a change)
+
+    Each poll fetches unconfirmed transactions and those of the last few
+    blocks over the shared keep-alive connection, never the full history.
+
+    Returns True when stopped with ctrl-c.
+    '''
+    if not USER_ONLINE:
+        puts(colored.red('BlockCypher connection needed to watch for transactions.'))
+        return False
+
+    coin_symbol = wallet_ctx.coin_symbol
+    local_tz = get_localzone()
+
+    # Instruct blockcypher to track the wallet by pubkey (no-op if it already does)
+    verbose_print(create_hd_wallet(
+        wallet_name=wallet_ctx.wallet_name,
+        xpubkey=wallet_ctx.mpub,
+        api_key=BLOCKCYPHER_API_KEY,
+        coin_symbol=coin_symbol,
+        subchain_indices=[0, 1],
+        ))
+
+    watcher = WalletWatcher(tip_height=get_blockchain_overview(
+        coin_symbol=coin_symbol,
+        api_key=BLOCKCYPHER_API_KEY,
+        )['height'])
+
+    puts('Watching %s for transactions every %ss (ctrl-c to stop)...\n' % (
+        wallet_ctx.wallet_name,
+        interval,
+        ))
+    balances = print_watch_balance(wallet_ctx=wallet_ctx)
+
+    try:
+        while True:
+            try:
+                txrefs = []
+                txref_pages = get_wallet_txref_pages(
+                        wallet_ctx=wallet_ctx,
+                        after_bh=watcher.get_after_bh(),
+                        omit_addresses=True,
+                        )
+                for page_txrefs, _ in txref_pages:
+                    txrefs.extend(page_txrefs)
+
+                events = watcher.update(txrefs)
+                for event, tx_object in events:
+                    print_watch_event(
+                            event=event,
+                            tx_object=tx_object,
+                            coin_symbol=coin_symbol,
+                            local_tz=local_tz,
+                            )
+                if [x for x in events if x[0] in BALANCE_EVENTS]:
+                    balances = print_watch_balance(
+                            wallet_ctx=wallet_ctx,
+                            previous_balances=balances,
+                            )
+            except RateLimitError:
+                puts(colored.red('Rate limited by BlockCypher, consider a longer --interval.'))
+            except Exception as e:
+                # keep watching through transient API/connection errors
+                puts(colored.red('Could not fetch transactions: %s' % e))
+                verbose_print(traceback.format_exc())
+
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        puts('\nStopped watching.')
+        return True
+
+
+def sign_unsigned_tx(wallet_ctx, unsigned_tx):
+    '''
+    Find (and verify client-side) the keys for every input of unsigned_tx and
+    sign it locally
+
+    Returns (tx_signatures, pubkeyhex_list)
+    '''
+    input_addresses = get_input_addresses(unsigned_tx)
+    verbose_print('input_addresses')
+    verbose_print(input_addresses)
+
+    address_paths = [{'path': x['hd_path'], 'address': x['addresses'][0]} for x in unsigned_tx['tx']['inputs']]
 
-def send_funds(wallet_obj, change_address=None, destination_address=None, dest_satoshis=None, tx_preference=None):
+    # be sure all addresses returned
+    address_paths_filled = verify_and_fill_address_paths_from_bip32key(
+            address_paths=address_paths,
+            master_key=wallet_ctx.mpriv,
+            network=wallet_ctx.network,
+            )
+
+    verbose_print('adress_paths_filled:')
+    verbose_print(address_paths_filled)
+    hexkeypair_dict = hexkeypair_list_to_dict(address_paths_filled)
+
+    verbose_print('hexkeypair_dict:')
+    verbose_print(hexkeypair_dict)
+
+    if len(hexkeypair_dict.keys()) != len(set(input_addresses)):
+        notfound_addrs = set(input_addresses) - set(hexkeypair_dict.keys())
+        err_msg = "Couldn't find %s traversing bip32 key" % notfound_addrs
+        raise Exception('Traversal Fail: %s' % err_msg)
+
+    privkeyhex_list = [hexkeypair_dict[x].privkeyhex for x in input_addresses]
+    pubkeyhex_list = [hexkeypair_dict[x].pubkeyhex for x in input_addresses]
+
+    verbose_print('Private Key List: %s' % privkeyhex_list)
+    verbose_print('Public Key List: %s' % pubkeyhex_list)
+
+    # sign locally
+    tx_signatures = sign_tx_digests(
+            txs_to_sign=unsigned_tx['tosign'],
+            privkey_list=privkeyhex_list,
+            pubkey_list=pubkeyhex_list,
+            jobs=DERIVATION_JOBS,
+            )
+    verbose_print('TX Signatures: %s' % tx_signatures)
+
+    return tx_signatures, pubkeyhex_list
+
+
+def send_funds(wallet_ctx, change_address=None, destination_address=None, dest_satoshis=None, tx_preference=None):
     if not USER_ONLINE:
         puts(colored.red('BlockCypher connection needed to fetch unspents and broadcast signed transaction.'))
         puts(colored.red('You may dump all your addresses and private keys while offline by selecting option 0 on the home screen.'))
         return
 
-    mpub = wallet_obj.serialize_b58(private=False)
-    if not wallet_obj.private_key:
-        print_pubwallet_notice(mpub=mpub)
+    if not wallet_ctx.has_private_key:
+        print_pubwallet_notice(mpub=wallet_ctx.mpub)
         return
 
-    coin_symbol = str(coin_symbol_from_mkey(mpub))
+    coin_symbol = wallet_ctx.coin_symbol
     verbose_print(coin_symbol)
 
-    wallet_name = get_blockcypher_walletname_from_mpub(
-            mpub=mpub,
-            subchain_indices=[0, 1],
-            )
     wallet_details = get_wallet_transactions(
-            wallet_name=wallet_name,
+            wallet_name=wallet_ctx.wallet_name,
             api_key=BLOCKCYPHER_API_KEY,
             coin_symbol=coin_symbol,
             )
@@ -418,8 +836,6 @@ def send_funds(wallet_obj, change_address=None, destination_address=None, dest_s
         puts(colored.red("0 balance. You can't send funds if you don't have them available!"))
         return
 
-    mpriv = wallet_obj.serialize_b58(private=True)
-
     if not destination_address:
         display_shortname = COIN_SYMBOL_MAPPINGS[coin_symbol]['display_shortname']
         puts('\nWhat %s address do you want to send to?' % display_shortname)
@@ -471,7 +887,7 @@ def send_funds(wallet_obj, change_address=None, destination_address=None, dest_s
                     )
 
     inputs = [{
-            'wallet_name': wallet_name,
+            'wallet_name': wallet_ctx.wallet_name,
             'wallet_token': BLOCKCYPHER_API_KEY,
             }, ]
     outputs = [{
@@ -486,9 +902,9 @@ def send_funds(wallet_obj, change_address=None, destination_address=None, dest_s
         sweep_funds = False
         if not change_address:
             change_address = get_unused_change_addresses(
-                    wallet_obj=wallet_obj,
+                    wallet_ctx=wallet_ctx,
                     num_addrs=1,
-                    )[0]['pub_address']
+                    )[0].address
 
     if not tx_preference:
         tx_preference = txn_preference_chooser(user_prompt=DEFAULT_PROMPT)
@@ -530,7 +946,7 @@ def send_funds(wallet_obj, change_address=None, destination_address=None, dest_s
             puts('Would you like to send the max you can instead?')
             if confirm(user_prompt=DEFAULT_PROMPT, default=False):
                 return send_funds(
-                        wallet_obj=wallet_obj,
+                        wallet_ctx=wallet_ctx,
                         change_address=change_address,
                         destination_address=destination_address,
                         dest_satoshis=-1,  # sweep
@@ -561,44 +977,10 @@ def send_funds(wallet_obj, change_address=None, destination_address=None, dest_s
         # Abandon
         return
 
-    input_addresses = get_input_addresses(unsigned_tx)
-    verbose_print('input_addresses')
-    verbose_print(input_addresses)
-
-    address_paths = [{'path': x['hd_path'], 'address': x['addresses'][0]} for x in unsigned_tx['tx']['inputs']]
-
-    # be sure all addresses returned
-    address_paths_filled = verify_and_fill_address_paths_from_bip32key(
-            address_paths=address_paths,
-            master_key=mpriv,
-            network=guess_network_from_mkey(mpriv),
-            )
-
-    verbose_print('adress_paths_filled:')
-    verbose_print(address_paths_filled)
-    hexkeypair_dict = hexkeypair_list_to_dict(address_paths_filled)
-
-    verbose_print('hexkeypair_dict:')
-    verbose_print(hexkeypair_dict)
-
-    if len(hexkeypair_dict.keys()) != len(set(input_addresses)):
-        notfound_addrs = set(input_addresses) - set(hexkeypair_dict.keys())
-        err_msg = "Couldn't find %s traversing bip32 key" % notfound_addrs
-        raise Exception('Traversal Fail: %s' % err_msg)
-
-    privkeyhex_list = [hexkeypair_dict[x]['privkeyhex'] for x in input_addresses]
-    pubkeyhex_list = [hexkeypair_dict[x]['pubkeyhex'] for x in input_addresses]
-
-    verbose_print('Private Key List: %s' % privkeyhex_list)
-    verbose_print('Public Key List: %s' % pubkeyhex_list)
-
-    # sign locally
-    tx_signatures = make_tx_signatures(
-            txs_to_sign=unsigned_tx['tosign'],
-            privkey_list=privkeyhex_list,
-            pubkey_list=pubkeyhex_list,
+    tx_signatures, pubkeyhex_list = sign_unsigned_tx(
+            wallet_ctx=wallet_ctx,
+            unsigned_tx=unsigned_tx,
             )
-    verbose_print('TX Signatures: %s' % tx_signatures)
 
     # final confirmation before broadcast
 
@@ -642,76 +1024,769 @@ def send_funds(wallet_obj, change_address=None, destination_address=None, dest_s
     verbose_print('Broadcast TX Details:')
     verbose_print(broadcasted_tx)
 
-    if 'errors' in broadcasted_tx:
-        puts(colored.red('TX Error(s): Tx May NOT Have Been Broadcast'))
-        for error in broadcasted_tx['errors']:
-            puts(colored.red(error['error']))
+    if 'errors' in broadcasted_tx:
+        puts(colored.red('TX Error(s): Tx May NOT Have Been Broadcast'))
+        for error in broadcasted_tx['errors']:
+            puts(colored.red(error['error']))
+        return
+
+    tx_hash = broadcasted_tx['tx']['hash']
+    tx_url = get_tx_url(
+            tx_hash=tx_hash,
+            coin_symbol=coin_symbol,
+            )
+    puts(colored.green('Transaction %s Broadcast' % tx_hash))
+    puts(colored.blue(tx_url))
+
+    # Display updated wallet balance info
+    display_balance_info(wallet_ctx=wallet_ctx)
+
+
+def print_payment_queue(coin_symbol):
+    for cnt, output in enumerate(PAYMENT_QUEUE):
+        with indent(2):
+            puts(colored.cyan('%s: %s to %s' % (
+                cnt+1,
+                format_crypto_units(
+                    input_quantity=output['value'],
+                    input_type='satoshi',
+                    output_type=UNIT_CHOICE,
+                    coin_symbol=coin_symbol,
+                    print_cs=True,
+                    ),
+                output['address'],
+                )))
+
+
+def queue_payment(wallet_ctx):
+    '''
+    Stage a payment to be sent later with the rest of PAYMENT_QUEUE
+    '''
+    coin_symbol = wallet_ctx.coin_symbol
+    display_shortname = COIN_SYMBOL_MAPPINGS[coin_symbol]['display_shortname']
+
+    puts('\nWhat %s address do you want to send to?' % display_shortname)
+    puts('Enter "b" to go back.\n')
+    destination_address = get_crypto_address(coin_symbol=coin_symbol, quit_ok=True)
+    if destination_address is False:
+        return
+
+    curr_symbol = get_curr_symbol(
+            coin_symbol=coin_symbol,
+            output_type=UNIT_CHOICE,
+            )
+    puts('\nHow much (in %s) do you want to send?' % curr_symbol)
+    puts('Enter "b" to go back.\n')
+    dest_crypto_qty = get_crypto_qty(
+            max_num=None,
+            input_type=UNIT_CHOICE,
+            user_prompt=DEFAULT_PROMPT,
+            quit_ok=True,
+            )
+    if dest_crypto_qty is False:
+        return
+    if dest_crypto_qty == -1:
+        puts(colored.red('Sweeping is not supported in the payment queue, use Basic send instead.'))
+        return
+
+    PAYMENT_QUEUE.append({
+        'address': destination_address,
+        'value': to_satoshis(
+            input_quantity=dest_crypto_qty,
+            input_type=UNIT_CHOICE,
+            ),
+        })
+    puts(colored.green('Payment queued (%s queued).' % len(PAYMENT_QUEUE)))
+
+
+def send_payment_queue(wallet_ctx, tx_preference=None):
+    '''
+    Flush PAYMENT_QUEUE as one transaction (one output per payment + change)
+    '''
+    if not USER_ONLINE:
+        puts(colored.red('BlockCypher connection needed to fetch unspents and broadcast signed transaction.'))
+        return
+
+    if not wallet_ctx.has_private_key:
+        print_pubwallet_notice(mpub=wallet_ctx.mpub)
+        return
+
+    if not PAYMENT_QUEUE:
+        puts(colored.red('No payments queued.'))
+        return
+
+    coin_symbol = wallet_ctx.coin_symbol
+    outputs = list(PAYMENT_QUEUE)
+
+    change_address = get_unused_change_addresses(
+            wallet_ctx=wallet_ctx,
+            num_addrs=1,
+            )[0].address
+
+    if not tx_preference:
+        tx_preference = txn_preference_chooser(user_prompt=DEFAULT_PROMPT)
+
+    verbose_print('Outputs:')
+    verbose_print(outputs)
+    verbose_print('Change Address: %s' % change_address)
+    verbose_print('TX Preference: %s' % tx_preference)
+
+    unsigned_tx = create_unsigned_tx(
+        inputs=[{
+            'wallet_name': wallet_ctx.wallet_name,
+            'wallet_token': BLOCKCYPHER_API_KEY,
+            }, ],
+        outputs=outputs,
+        change_address=change_address,
+        preference=tx_preference,
+        coin_symbol=coin_symbol,
+        api_key=BLOCKCYPHER_API_KEY,
+        # will verify in the next step,
+        # that way if there is an error here we can display that to user
+        verify_tosigntx=False,
+        include_tosigntx=True,
+        )
+    verbose_print('Unsigned TX:')
+    verbose_print(unsigned_tx)
+
+    if 'errors' in unsigned_tx:
+        puts(colored.red('TX Error(s): Tx NOT Signed or Broadcast'))
+        for error in unsigned_tx['errors']:
+            puts(colored.red(error['error']))
+        return
+
+    # Verify TX requested to sign is as expected
+    tx_is_correct, err_msg = verify_unsigned_tx(
+            unsigned_tx=unsigned_tx,
+            outputs=outputs,
+            sweep_funds=False,
+            change_address=change_address,
+            coin_symbol=coin_symbol,
+            )
+    if not tx_is_correct:
+        puts(colored.red('TX Error: Tx NOT Signed or Broadcast'))
+        puts(colored.red(err_msg))
+        return
+
+    tx_signatures, pubkeyhex_list = sign_unsigned_tx(
+            wallet_ctx=wallet_ctx,
+            unsigned_tx=unsigned_tx,
+            )
+
+    # final confirmation before broadcast
+    batched_fees = unsigned_tx['tx']['fees']
+    individual_fees = estimate_individual_fees(
+            batched_fees=batched_fees,
+            num_inputs=len(unsigned_tx['tx']['inputs']),
+            num_outputs=len(unsigned_tx['tx']['outputs']),
+            num_payments=len(outputs),
+            )
+    total_satoshis = sum(x['value'] for x in outputs)
+
+    puts('\nPayments:')
+    print_payment_queue(coin_symbol=coin_symbol)
+    puts()
+    puts('Fee for all %s payments in one transaction: %s' % (
+        len(outputs),
+        format_crypto_units(
+            input_quantity=batched_fees,
+            input_type='satoshi',
+            output_type=UNIT_CHOICE,
+            coin_symbol=coin_symbol,
+            print_cs=True,
+            ),
+        ))
+    puts('Estimated fees if sent individually: %s' % format_crypto_units(
+        input_quantity=individual_fees,
+        input_type='satoshi',
+        output_type=UNIT_CHOICE,
+        coin_symbol=coin_symbol,
+        print_cs=True,
+        ))
+    puts("Send %s with a fee of %s (%s%% of the amount you're sending)?" % (
+        format_crypto_units(
+            input_quantity=total_satoshis,
+            input_type='satoshi',
+            output_type=UNIT_CHOICE,
+            coin_symbol=coin_symbol,
+            print_cs=True,
+            ),
+        format_crypto_units(
+            input_quantity=batched_fees,
+            input_type='satoshi',
+            output_type=UNIT_CHOICE,
+            coin_symbol=coin_symbol,
+            print_cs=True,
+            ),
+        round(100.0 * batched_fees / total_satoshis, 4),
+        ))
+
+    if not confirm(user_prompt=DEFAULT_PROMPT, default=True):
+        puts(colored.red('Transaction Not Broadcast!'))
+        return
+
+    broadcasted_tx = broadcast_signed_transaction(
+            unsigned_tx=unsigned_tx,
+            signatures=tx_signatures,
+            pubkeys=pubkeyhex_list,
+            coin_symbol=coin_symbol,
+            api_key=BLOCKCYPHER_API_KEY,
+    )
+    verbose_print('Broadcast TX Details:')
+    verbose_print(broadcasted_tx)
+
+    if 'errors' in broadcasted_tx:
+        puts(colored.red('TX Error(s): Tx May NOT Have Been Broadcast'))
+        for error in broadcasted_tx['errors']:
+            puts(colored.red(error['error']))
+        return
+
+    # sent, so empty the queue
+    del PAYMENT_QUEUE[:]
+
+    tx_hash = broadcasted_tx['tx']['hash']
+    tx_url = get_tx_url(
+            tx_hash=tx_hash,
+            coin_symbol=coin_symbol,
+            )
+    puts(colored.green('Transaction %s Broadcast' % tx_hash))
+    puts(colored.blue(tx_url))
+
+    # Display updated wallet balance info
+    display_balance_info(wallet_ctx=wallet_ctx)
+
+
+def payment_queue_chooser(wallet_ctx):
+    while True:
+        puts('\n%s payment(s) queued:' % len(PAYMENT_QUEUE))
+        print_payment_queue(coin_symbol=wallet_ctx.coin_symbol)
+        puts('\nWhat do you want to do?:')
+        with indent(2):
+            puts(colored.cyan('1: Add a payment to the queue'))
+            puts(colored.cyan('2: Send all queued payments in one transaction'))
+            puts(colored.cyan('3: Remove a payment from the queue'))
+            puts(colored.cyan('\nb: Go Back\n'))
+
+        choice = choice_prompt(
+                user_prompt=DEFAULT_PROMPT,
+                acceptable_responses=range(1, 3+1),
+                quit_ok=True,
+                default_input='1',
+                show_default=True,
+                )
+        verbose_print('Choice: %s' % choice)
+
+        if choice is False:
+            return
+        elif choice == '1':
+            queue_payment(wallet_ctx=wallet_ctx)
+        elif choice == '2':
+            return send_payment_queue(wallet_ctx=wallet_ctx)
+        elif choice == '3':
+            if not PAYMENT_QUEUE:
+                puts(colored.red('No payments queued.'))
+                continue
+            puts('Which payment do you want to remove?')
+            to_remove = get_int(
+                    max_int=len(PAYMENT_QUEUE),
+                    user_prompt=DEFAULT_PROMPT,
+                    quit_ok=True,
+                    )
+            if to_remove:
+                PAYMENT_QUEUE.pop(to_remove-1)
+
+
+def batch_send_from_file(wallet_ctx, filename, tx_preference):
+    '''
+    Non-interactive: pay every (address, amount) row of a CSV file
+
+    Payments are grouped into transactions of up to BATCH_SEND_MAX_OUTPUTS
+    outputs, each created, verified, signed locally and broadcast without
+    any prompts.
+
+    Returns True if every transaction was broadcast.
+    '''
+    if not USER_ONLINE:
+        puts(colored.red('BlockCypher connection needed to fetch unspents and broadcast signed transaction.'))
+        return False
+
+    if not wallet_ctx.has_private_key:
+        puts(colored.red('A master PRIVATE key is needed to sign transactions.'))
+        return False
+
+    coin_symbol = wallet_ctx.coin_symbol
+
+    try:
+        payouts = get_payouts_from_csv(
+                filename=filename,
+                coin_symbol=coin_symbol,
+                input_type=UNIT_CHOICE,
+                )
+    except (IOError, ValueError) as e:
+        puts(colored.red('Invalid payouts file %s: %s' % (filename, e)))
+        return False
+
+    if not payouts:
+        puts(colored.red('No payments found in %s' % filename))
+        return False
+
+    verbose_print('Payouts:')
+    verbose_print(payouts)
+
+    # Instruct blockcypher to track the wallet by pubkey (no-op if it already does)
+    verbose_print(create_hd_wallet(
+        wallet_name=wallet_ctx.wallet_name,
+        xpubkey=wallet_ctx.mpub,
+        api_key=BLOCKCYPHER_API_KEY,
+        coin_symbol=coin_symbol,
+        subchain_indices=[0, 1],
+        ))
+    # only change addresses are needed here
+    start_address_pool(wallet_ctx=wallet_ctx, subchain_indices=(1, ))
+
+    all_broadcast = True
+    for outputs in chunk_iterable(payouts, BATCH_SEND_MAX_OUTPUTS):
+        change_address = get_unused_change_addresses(
+                wallet_ctx=wallet_ctx,
+                num_addrs=1,
+                )[0].address
+
+        unsigned_tx = create_unsigned_tx(
+            inputs=[{
+                'wallet_name': wallet_ctx.wallet_name,
+                'wallet_token': BLOCKCYPHER_API_KEY,
+                }, ],
+            outputs=outputs,
+            change_address=change_address,
+            preference=tx_preference,
+            coin_symbol=coin_symbol,
+            api_key=BLOCKCYPHER_API_KEY,
+            verify_tosigntx=False,
+            include_tosigntx=True,
+            )
+        verbose_print('Unsigned TX:')
+        verbose_print(unsigned_tx)
+
+        if 'errors' in unsigned_tx:
+            puts(colored.red('TX Error(s): Tx NOT Signed or Broadcast (%s payments)' % len(outputs)))
+            for error in unsigned_tx['errors']:
+                puts(colored.red(error['error']))
+            all_broadcast = False
+            continue
+
+        tx_is_correct, err_msg = verify_unsigned_tx(
+                unsigned_tx=unsigned_tx,
+                outputs=outputs,
+                sweep_funds=False,
+                change_address=change_address,
+                coin_symbol=coin_symbol,
+                )
+        if not tx_is_correct:
+            puts(colored.red('TX Error: Tx NOT Signed or Broadcast (%s payments)' % len(outputs)))
+            puts(colored.red(err_msg))
+            all_broadcast = False
+            continue
+
+        tx_signatures, pubkeyhex_list = sign_unsigned_tx(
+                wallet_ctx=wallet_ctx,
+                unsigned_tx=unsigned_tx,
+                )
+
+        broadcasted_tx = broadcast_signed_transaction(
+                unsigned_tx=unsigned_tx,
+                signatures=tx_signatures,
+                pubkeys=pubkeyhex_list,
+                coin_symbol=coin_symbol,
+                api_key=BLOCKCYPHER_API_KEY,
+        )
+        verbose_print('Broadcast TX Details:')
+        verbose_print(broadcasted_tx)
+
+        if 'errors' in broadcasted_tx:
+            puts(colored.red('TX Error(s): Tx May NOT Have Been Broadcast (%s payments)' % len(outputs)))
+            for error in broadcasted_tx['errors']:
+                puts(colored.red(error['error']))
+            all_broadcast = False
+            continue
+
+        puts(colored.green('Transaction %s Broadcast (%s payments, fee of %s)' % (
+            broadcasted_tx['tx']['hash'],
+            len(outputs),
+            format_crypto_units(
+                input_quantity=unsigned_tx['tx']['fees'],
+                input_type='satoshi',
+                output_type=UNIT_CHOICE,
+                coin_symbol=coin_symbol,
+                print_cs=True,
+                ),
+            )))
+
+    return all_broadcast
+
+
+def print_offline_tx_record(record, coin_symbol):
+    for output in record['outputs']:
+        with indent(2):
+            puts(colored.cyan('%s to %s' % (
+                format_crypto_units(
+                    input_quantity=output['value'],
+                    input_type='satoshi',
+                    output_type=UNIT_CHOICE,
+                    coin_symbol=coin_symbol,
+                    print_cs=True,
+                    ),
+                output['address'],
+                )))
+    if record['change_address']:
+        with indent(2):
+            puts('Change: %s to %s (%s)' % (
+                format_crypto_units(
+                    input_quantity=get_change_satoshis(record),
+                    input_type='satoshi',
+                    output_type=UNIT_CHOICE,
+                    coin_symbol=coin_symbol,
+                    print_cs=True,
+                    ),
+                record['change_address'],
+                record['change_path'],
+                ))
+    with indent(2):
+        puts('Fee: %s' % format_crypto_units(
+            input_quantity=record['tx']['fees'],
+            input_type='satoshi',
+            output_type=UNIT_CHOICE,
+            coin_symbol=coin_symbol,
+            print_cs=True,
+            ))
+
+
+def generate_offline_tx(wallet_ctx):
+    if not USER_ONLINE:
+        puts(colored.red('BlockCypher connection needed to fetch unspents for signing.'))
+        return
+
+    coin_symbol = wallet_ctx.coin_symbol
+
+    if PAYMENT_QUEUE:
+        puts('Include all %s queued payments in this transaction?' % len(PAYMENT_QUEUE))
+        print_payment_queue(coin_symbol=coin_symbol)
+        if not confirm(user_prompt=DEFAULT_PROMPT, default=True):
+            puts(colored.red('Transaction Not Generated!'))
+            return
+    else:
+        queue_payment(wallet_ctx=wallet_ctx)
+        if not PAYMENT_QUEUE:
+            puts(colored.red('Transaction Not Generated!'))
+            return
+    outputs = list(PAYMENT_QUEUE)
+
+    change_address_path = get_unused_change_addresses(
+            wallet_ctx=wallet_ctx,
+            num_addrs=1,
+            )[0]
+    change_address = change_address_path.address
+
+    tx_preference = txn_preference_chooser(user_prompt=DEFAULT_PROMPT)
+
+    unsigned_tx = create_unsigned_tx(
+        inputs=[{
+            'wallet_name': wallet_ctx.wallet_name,
+            'wallet_token': BLOCKCYPHER_API_KEY,
+            }, ],
+        outputs=outputs,
+        change_address=change_address,
+        preference=tx_preference,
+        coin_symbol=coin_symbol,
+        api_key=BLOCKCYPHER_API_KEY,
+        # verified below (and again when signing offline)
+        verify_tosigntx=False,
+        include_tosigntx=True,
+        )
+    verbose_print('Unsigned TX:')
+    verbose_print(unsigned_tx)
+
+    if 'errors' in unsigned_tx:
+        puts(colored.red('TX Error(s): Tx NOT Generated'))
+        for error in unsigned_tx['errors']:
+            puts(colored.red(error['error']))
+        return
+
+    tx_is_correct, err_msg = verify_unsigned_tx(
+            unsigned_tx=unsigned_tx,
+            outputs=outputs,
+            sweep_funds=False,
+            change_address=change_address,
+            coin_symbol=coin_symbol,
+            )
+    if not tx_is_correct:
+        puts(colored.red('TX Error: Tx NOT Generated'))
+        puts(colored.red(err_msg))
+        return
+
+    record = make_unsigned_record(
+            unsigned_tx=unsigned_tx,
+            outputs=outputs,
+            change_address=change_address,
+            change_path=change_address_path.path,
+            )
+
+    puts('\nTransaction to sign offline:')
+    print_offline_tx_record(record=record, coin_symbol=coin_symbol)
+
+    puts('\nWhere do you want to save it?')
+    filename = get_file_path(
+            user_prompt=DEFAULT_PROMPT,
+            default_input='bcwallet-unsigned-tx.jsonl',
+            quit_ok=True,
+            )
+    if filename is False:
+        puts(colored.red('Transaction Not Saved!'))
+        return
+
+    write_offline_txs(
+            filename=filename,
+            kind=UNSIGNED_KIND,
+            coin_symbol=coin_symbol,
+            mpub=wallet_ctx.mpub,
+            records=[record],
+            )
+
+    # saved for signing, so empty the queue
+    del PAYMENT_QUEUE[:]
+
+    puts(colored.green('Unsigned transaction saved to %s' % filename))
+    puts('Move it to your offline machine and sign it with bcwallet booted from your master PRIVATE key (Send > Offline transaction signing > Sign transaction offline).')
+
+
+def verify_change_path(wallet_ctx, change_address, change_path):
+    '''
+    Re-derive change_path client-side and check it gives change_address
+
+    Returns (is_correct, err_msg) like verify_unsigned_tx
+    '''
+    if not change_path or not parse_chain_path(change_path):
+        return False, 'Change address %s has no wallet path (%s)' % (change_address, change_path)
+    try:
+        verify_and_fill_address_paths_from_bip32key(
+                address_paths=[{'path': change_path, 'address': change_address}],
+                master_key=wallet_ctx.mpub,
+                network=wallet_ctx.network,
+                )
+    except Exception as e:
+        return False, 'Change address %s does not belong to this wallet: %s' % (change_address, e)
+    return True, ''
+
+
+def sign_tx_offline(wallet_ctx):
+
+    if not wallet_ctx.has_private_key:
+        puts(colored.red("bcwallet was booted using a master PUBLIC key %s so it cannot sign transactions.\nPlease load bcwallet with your master PRIVATE key like this:"))
+        priv_to_display = '%s123...' % first4mprv_from_mpub(
+                mpub=wallet_ctx.mpub)
+        print_bcwallet_basic_priv_opening(priv_to_display=priv_to_display)
+        puts(BCWALLET_PRIVPIPE_EXPLANATION)
+        print_bcwallet_piped_priv_opening(priv_to_display=priv_to_display)
+        puts(BCWALLET_PRIVPIPE_CAT_EXPLANATION)
+        print_bcwallet_piped_priv_cat_opening()
+        puts(BCWALLET_PIPE_ENCRYPTION_EXPLANATION)
+        return
+
+    else:
+        if USER_ONLINE:
+            # double check in case we booted online and then disconnected
+            if is_connected_to_blockcypher():
+                puts(colored.red("Why are you trying to sign a transaction offline while connected to the internet?"))
+                puts(colored.red('This feature is for developers to spend funds on their cold wallet without exposing their private keys to an internet connected machine.'))
+                puts(colored.red("If you didn't mean to enter your master PRIVATE key on an internet connected machine, you may want to consider moving your funds to a cold wallet.\n"))
+
+    coin_symbol = wallet_ctx.coin_symbol
+
+    puts('Which file of unsigned transactions do you want to sign?')
+    unsigned_filename = get_file_path(
+            user_prompt=DEFAULT_PROMPT,
+            must_exist=True,
+            quit_ok=True,
+            )
+    if unsigned_filename is False:
+        return
+
+    # First pass: verify every transaction (client-side, no network needed)
+    try:
+        header = read_offline_tx_header(filename=unsigned_filename, kind=UNSIGNED_KIND)
+        if header.get('coin_symbol') != coin_symbol or header.get('mpub') != wallet_ctx.mpub:
+            puts(colored.red('%s was generated for a different wallet, Tx(s) NOT Signed' % unsigned_filename))
+            return
+
+        # signed as held here, so the file can't change between review and signing
+        verified_records = []
+        num_txs, total_satoshis, total_change, total_fees = 0, 0, 0, 0
+        for record in iter_offline_tx_records(filename=unsigned_filename, kind=UNSIGNED_KIND):
+            num_txs += 1
+            tx_is_correct, err_msg = verify_unsigned_tx(
+                    unsigned_tx=record_to_unsigned_tx(record),
+                    outputs=record['outputs'],
+                    sweep_funds=record['sweep_funds'],
+                    change_address=record['change_address'],
+                    coin_symbol=coin_symbol,
+                    )
+            if tx_is_correct and record['change_address']:
+                # the change must go back to this wallet
+                tx_is_correct, err_msg = verify_change_path(
+                        wallet_ctx=wallet_ctx,
+                        change_address=record['change_address'],
+                        change_path=record['change_path'],
+                        )
+            if not tx_is_correct:
+                puts(colored.red('TX Error in transaction #%s: Tx(s) NOT Signed' % num_txs))
+                puts(colored.red(err_msg))
+                return
+            puts('\nTransaction #%s:' % num_txs)
+            print_offline_tx_record(record=record, coin_symbol=coin_symbol)
+            total_satoshis += sum(x['value'] for x in record['outputs'])
+            total_change += get_change_satoshis(record)
+            total_fees += record['tx']['fees']
+            verified_records.append(record)
+    except (IOError, OfflineTxFormatError) as e:
+        puts(colored.red('Could not read %s: %s' % (unsigned_filename, e)))
+        return
+
+    if not num_txs:
+        puts(colored.red('No transactions found in %s' % unsigned_filename))
+        return
+
+    puts('\nSign %s transaction(s) sending %s (%s back to this wallet as change) with fees of %s?' % (
+        num_txs,
+        format_crypto_units(
+            input_quantity=total_satoshis,
+            input_type='satoshi',
+            output_type=UNIT_CHOICE,
+            coin_symbol=coin_symbol,
+            print_cs=True,
+            ),
+        format_crypto_units(
+            input_quantity=total_change,
+            input_type='satoshi',
+            output_type=UNIT_CHOICE,
+            coin_symbol=coin_symbol,
+            print_cs=True,
+            ),
+        format_crypto_units(
+            input_quantity=total_fees,
+            input_type='satoshi',
+            output_type=UNIT_CHOICE,
+            coin_symbol=coin_symbol,
+            print_cs=True,
+            ),
+        ))
+    if not confirm(user_prompt=DEFAULT_PROMPT, default=True):
+        puts(colored.red('Tx(s) NOT Signed!'))
+        return
+
+    puts('\nWhere do you want to save the signed transaction(s)?')
+    signed_filename = get_file_path(
+            user_prompt=DEFAULT_PROMPT,
+            default_input=unsigned_filename.replace('unsigned', 'signed') if 'unsigned' in unsigned_filename else 'bcwallet-signed-tx.jsonl',
+            quit_ok=True,
+            )
+    if signed_filename is False:
+        puts(colored.red('Tx(s) NOT Signed!'))
         return
 
-    tx_hash = broadcasted_tx['tx']['hash']
-    tx_url = get_tx_url(
-            tx_hash=tx_hash,
+    # Second pass: sign exactly what was verified and confirmed above
+    def get_signed_records():
+        for record in verified_records:
+            tx_signatures, pubkeyhex_list = sign_unsigned_tx(
+                    wallet_ctx=wallet_ctx,
+                    unsigned_tx=record_to_unsigned_tx(record),
+                    )
+            yield make_signed_record(
+                    unsigned_record=record,
+                    signatures=tx_signatures,
+                    pubkeys=pubkeyhex_list,
+                    )
+
+    num_signed = write_offline_txs(
+            filename=signed_filename,
+            kind=SIGNED_KIND,
             coin_symbol=coin_symbol,
+            mpub=wallet_ctx.mpub,
+            records=get_signed_records(),
             )
-    puts(colored.green('Transaction %s Broadcast' % tx_hash))
-    puts(colored.blue(tx_url))
 
-    # Display updated wallet balance info
-    display_balance_info(wallet_obj=wallet_obj)
+    puts(colored.green('%s signed transaction(s) saved to %s' % (num_signed, signed_filename)))
+    puts('Move it to your online machine and broadcast it with bcwallet (Send > Offline transaction signing > Broadcast transaction previously signed offline).')
 
 
-def generate_offline_tx(wallet_obj):
+def broadcast_signed_tx(wallet_ctx):
     if not USER_ONLINE:
-        puts(colored.red('BlockCypher connection needed to fetch unspents for signing.'))
+        puts(colored.red('BlockCypher connection needed to broadcast signed transaction.'))
         return
 
-    # TODO: implement
-    puts(colored.red('Feature Coming Soon'))
+    coin_symbol = wallet_ctx.coin_symbol
 
+    puts('Which file of signed transactions do you want to broadcast?')
+    signed_filename = get_file_path(
+            user_prompt=DEFAULT_PROMPT,
+            must_exist=True,
+            quit_ok=True,
+            )
+    if signed_filename is False:
+        return
 
-def sign_tx_offline(wallet_obj):
+    try:
+        header = read_offline_tx_header(filename=signed_filename, kind=SIGNED_KIND)
+        if header.get('coin_symbol') != coin_symbol:
+            puts(colored.red('%s contains %s transactions, Tx(s) NOT Broadcast' % (
+                signed_filename,
+                header.get('coin_symbol'),
+                )))
+            return
+        num_txs = sum(1 for _ in iter_offline_tx_records(filename=signed_filename, kind=SIGNED_KIND))
+    except (IOError, OfflineTxFormatError) as e:
+        puts(colored.red('Could not read %s: %s' % (signed_filename, e)))
+        return
 
-    if wallet_obj.private_key is None:
-        puts(colored.red("bcwallet was booted using a master PUBLIC key %s so it cannot sign transactions.\nPlease load bcwallet with your master PRIVATE key like this:"))
-        priv_to_display = '%s123...' % first4mprv_from_mpub(
-                mpub=wallet_obj.serialize_b58(private=False))
-        print_bcwallet_basic_priv_opening(priv_to_display=priv_to_display)
-        puts(BCWALLET_PRIVPIPE_EXPLANATION)
-        print_bcwallet_piped_priv_opening(priv_to_display=priv_to_display)
-        puts(BCWALLET_PRIVPIPE_CAT_EXPLANATION)
-        print_bcwallet_piped_priv_cat_opening()
-        puts(BCWALLET_PIPE_ENCRYPTION_EXPLANATION)
+    if not num_txs:
+        puts(colored.red('No transactions found in %s' % signed_filename))
         return
 
-    else:
-        if USER_ONLINE:
-            # double check in case we booted online and then disconnected
-            if is_connected_to_blockcypher():
-                puts(colored.red("Why are you trying to sign a transaction offline while connected to the internet?"))
-                puts(colored.red('This feature is for developers to spend funds on their cold wallet without exposing their private keys to an internet connected machine.'))
-                puts(colored.red("If you didn't mean to enter your master PRIVATE key on an internet connected machine, you may want to consider moving your funds to a cold wallet.\n"))
+    puts('Broadcast %s signed transaction(s)?' % num_txs)
+    if not confirm(user_prompt=DEFAULT_PROMPT, default=True):
+        puts(colored.red('Tx(s) NOT Broadcast!'))
+        return
 
-    # TODO: implement
-    puts(colored.red('Feature Coming Soon'))
+    for cnt, record in enumerate(iter_offline_tx_records(filename=signed_filename, kind=SIGNED_KIND)):
+        broadcasted_tx = broadcast_signed_transaction(
+                unsigned_tx=record_to_unsigned_tx(record),
+                signatures=record['signatures'],
+                pubkeys=record['pubkeys'],
+                coin_symbol=coin_symbol,
+                api_key=BLOCKCYPHER_API_KEY,
+        )
+        verbose_print('Broadcast TX Details:')
+        verbose_print(broadcasted_tx)
 
+        if 'errors' in broadcasted_tx:
+            puts(colored.red('TX Error(s): Tx #%s May NOT Have Been Broadcast' % (cnt+1)))
+            for error in broadcasted_tx['errors']:
+                puts(colored.red(error['error']))
+            continue
 
-def broadcast_signed_tx(wallet_obj):
-    if not USER_ONLINE:
-        puts(colored.red('BlockCypher connection needed to broadcast signed transaction.'))
-        return
+        tx_hash = broadcasted_tx['tx']['hash']
+        puts(colored.green('Transaction %s Broadcast' % tx_hash))
+        puts(colored.blue(get_tx_url(tx_hash=tx_hash, coin_symbol=coin_symbol)))
 
-    # TODO: implement
-    puts(colored.red('Feature Coming Soon'))
+    # Display updated wallet balance info
+    display_balance_info(wallet_ctx=wallet_ctx)
 
 
-def sweep_funds_from_privkey(wallet_obj):
+def sweep_funds_from_privkey(wallet_ctx):
     if not USER_ONLINE:
         puts(colored.red('BlockCypher connection needed to fetch unspents and broadcast signed transaction.'))
         return
 
-    mpub = wallet_obj.serialize_b58(private=False)
-    coin_symbol = str(coin_symbol_from_mkey(mpub))
-    network = guess_network_from_mkey(mpub)
+    coin_symbol = wallet_ctx.coin_symbol
+    network = wallet_ctx.network
 
     puts('Enter a private key (in WIF format) to send from:')
     puts('Enter "b" to go back.\n')
@@ -728,9 +1803,9 @@ def sweep_funds_from_privkey(wallet_obj):
     verbose_print('Inputs:\n%s' % inputs)
 
     dest_addr = get_unused_receiving_addresses(
-            wallet_obj=wallet_obj,
+            wallet_ctx=wallet_ctx,
             num_addrs=1,
-            )[0]['pub_address']
+            )[0].address
 
     outputs = [{
             'address': dest_addr,
@@ -782,10 +1857,11 @@ def sweep_funds_from_privkey(wallet_obj):
     verbose_print('Public Key List: %s' % pubkeyhex_list)
 
     # sign locally
-    tx_signatures = make_tx_signatures(
+    tx_signatures = sign_tx_digests(
             txs_to_sign=unsigned_tx['tosign'],
             privkey_list=privkeyhex_list,
             pubkey_list=pubkeyhex_list,
+            jobs=DERIVATION_JOBS,
             )
     verbose_print('TX Signatures: %s' % tx_signatures)
 
@@ -810,7 +1886,7 @@ def sweep_funds_from_privkey(wallet_obj):
     puts(colored.blue(tx_url))
 
     # Display updated wallet balance info
-    display_balance_info(wallet_obj=wallet_obj)
+    display_balance_info(wallet_ctx=wallet_ctx)
 
 
 def print_external_chain():
@@ -829,7 +1905,7 @@ def print_address_path_header():
     puts('path (address)')
 
 
-def print_path_info(address, path, coin_symbol, wif=None):
+def print_path_info(address, path, coin_symbol, wif=None, addr_balance=None):
 
     assert path, path
     assert coin_symbol, coin_symbol
@@ -841,10 +1917,11 @@ def print_path_info(address, path, coin_symbol, wif=None):
         address_formatted = address
 
     if USER_ONLINE:
-        addr_balance = get_total_balance(
-                address=address,
-                coin_symbol=coin_symbol,
-                )
+        if addr_balance is None:
+            addr_balance = get_total_balance(
+                    address=address,
+                    coin_symbol=coin_symbol,
+                    )
 
         with indent(2):
             puts(colored.green('%s (%s) - %s' % (
@@ -866,7 +1943,33 @@ def print_path_info(address, path, coin_symbol, wif=None):
                 )))
 
 
-def dump_all_keys_or_addrs(wallet_obj):
+def print_path_info_batch(path_rows, coin_symbol):
+    '''
+    Print a batch of (path, address, wif) rows
+
+    When online, balances for the whole batch are fetched in bulk instead of
+    with one API call per address.
+    '''
+    if USER_ONLINE:
+        balances = get_total_balances(
+                address_list=[address for _, address, _ in path_rows],
+                coin_symbol=coin_symbol,
+                api_key=BLOCKCYPHER_API_KEY,
+                )
+    else:
+        balances = {}
+
+    for path, address, wif in path_rows:
+        print_path_info(
+                address=address,
+                path=path,
+                wif=wif,
+                coin_symbol=coin_symbol,
+                addr_balance=balances.get(address),
+                )
+
+
+def dump_all_keys_or_addrs(wallet_ctx):
     '''
     Offline-enabled mechanism to dump addresses
     '''
@@ -878,15 +1981,13 @@ def dump_all_keys_or_addrs(wallet_obj):
         puts(colored.red('Dump Cancelled!'))
         return
 
-    mpub = wallet_obj.serialize_b58(private=False)
-
-    if wallet_obj.private_key:
+    if wallet_ctx.has_private_key:
         desc_str = 'private keys'
     else:
         desc_str = 'addresses'
         puts('Displaying Public Addresses Only')
         puts('For Private Keys, please open bcwallet with your Master Private Key:\n')
-        priv_to_display = '%s123...' % first4mprv_from_mpub(mpub=mpub)
+        priv_to_display = '%s123...' % first4mprv_from_mpub(mpub=wallet_ctx.mpub)
         print_bcwallet_basic_priv_opening(priv_to_display=priv_to_display)
 
     puts('How many %s (on each chain) do you want to dump?' % desc_str)
@@ -894,7 +1995,7 @@ def dump_all_keys_or_addrs(wallet_obj):
 
     num_keys = get_int(
             user_prompt=DEFAULT_PROMPT,
-            max_int=10**5,
+            max_int=BIP32_MAX_INDEX,
             default_input='5',
             show_default=True,
             quit_ok=True,
@@ -903,40 +2004,281 @@ def dump_all_keys_or_addrs(wallet_obj):
     if num_keys is False:
         return
 
-    if wallet_obj.private_key:
+    if wallet_ctx.has_private_key:
         print_childprivkey_warning()
 
+    coin_symbol = wallet_ctx.coin_symbol
+
     puts('-' * 70)
     for chain_int in (0, 1):
-        for current in range(0, num_keys):
-            path = "m/%d/%d" % (chain_int, current)
-            if current == 0:
-                if chain_int == 0:
-                    print_external_chain()
-                    print_key_path_header()
-                elif chain_int == 1:
-                    print_internal_chain()
-                    print_key_path_header()
-            child_wallet = wallet_obj.get_child_for_path(path)
-            if wallet_obj.private_key:
-                wif_to_use = child_wallet.export_to_wif()
-            else:
-                wif_to_use = None
-            print_path_info(
-                    address=child_wallet.to_address(),
-                    path=path,
-                    wif=wif_to_use,
-                    coin_symbol=coin_symbol_from_mkey(mpub),
+        if chain_int == 0:
+            print_external_chain()
+        elif chain_int == 1:
+            print_internal_chain()
+        print_key_path_header()
+        address_rows = derive_address_rows(
+                wallet_obj=wallet_ctx.wallet_obj,
+                chain_int=chain_int,
+                start=0,
+                stop=num_keys,
+                jobs=DERIVATION_JOBS,
+                )
+        path_rows = (("m/%d/%d" % (chain_int, current), address, wif)
+                for current, address, wif in address_rows)
+        for path_rows_chunk in chunk_iterable(path_rows, ADDRESS_BATCH_SIZE):
+            print_path_info_batch(
+                    path_rows=path_rows_chunk,
+                    coin_symbol=coin_symbol,
                     )
 
     puts(colored.blue('\nYou can compare this output to bip32.org'))
 
 
-def dump_selected_keys_or_addrs(wallet_obj, used=None, zero_balance=None):
+def display_discovered_addresses(wallet_ctx, gap_limit, chains=(0, 1)):
+    '''
+    Find (and print) every used address on chains with a gap-limit scan,
+    including those beyond BlockCypher's look-ahead
+
+    Returns False if the scan couldn't be done.
+    '''
+    if not USER_ONLINE:
+        puts(colored.red('BlockCypher connection needed to look up which addresses have been used.'))
+        return False
+
+    def print_progress(chain_int, num_scanned, highest_used_index):
+        if highest_used_index is None:
+            highest_used_str = 'none used yet'
+        else:
+            highest_used_str = 'highest used is m/%d/%d' % (chain_int, highest_used_index)
+        puts(colored.yellow('m/%d: scanned %s addresses (%s)' % (chain_int, num_scanned, highest_used_str)))
+
+    puts('Scanning until %s addresses in a row are unused on each chain...\n' % gap_limit)
+    results = discover_used_addresses(
+            wallet_obj=wallet_ctx.wallet_obj,
+            coin_symbol=wallet_ctx.coin_symbol,
+            api_key=BLOCKCYPHER_API_KEY,
+            chains=chains,
+            gap_limit=gap_limit,
+            jobs=DERIVATION_JOBS,
+            progress=print_progress,
+            )
+
+    puts('-' * 70)
+    for chain_int in chains:
+        result = results[chain_int]
+        if chain_int == 0:
+            print_external_chain()
+        elif chain_int == 1:
+            print_internal_chain()
+
+        if result['highest_used_index'] is None:
+            puts('No used addresses in the first %s\n' % result['num_scanned'])
+            continue
+
+        puts('Highest used index: %s (%s used addresses)' % (
+            result['highest_used_index'],
+            len(result['used_addresses']),
+            ))
+        print_key_path_header()
+        for used_address in result['used_addresses']:
+            print_path_info(
+                    address=used_address['address'],
+                    path=used_address['path'],
+                    wif=used_address['wif'],
+                    coin_symbol=wallet_ctx.coin_symbol,
+                    addr_balance=used_address['balance'],
+                    )
+        puts()
+
+    return True
+
+
+def get_registered_wallet_balance(wallet_ctx):
+    '''
+    get_wallet_balance (without the address list), registering the wallet
+    first if BlockCypher doesn't track it yet
+    '''
+    balance_kwargs = {
+            'wallet_name': wallet_ctx.wallet_name,
+            'api_key': BLOCKCYPHER_API_KEY,
+            'coin_symbol': wallet_ctx.coin_symbol,
+            'omit_addresses': True,
+            }
+    wallet_details = get_wallet_balance(**balance_kwargs)
+    if 'error' in wallet_details:
+        # first time this wallet is used, so it must be registered first
+        verbose_print(wallet_details)
+        verbose_print(create_hd_wallet(
+            wallet_name=wallet_ctx.wallet_name,
+            xpubkey=wallet_ctx.mpub,
+            api_key=BLOCKCYPHER_API_KEY,
+            coin_symbol=wallet_ctx.coin_symbol,
+            subchain_indices=[0, 1],
+            ))
+        wallet_details = get_wallet_balance(**balance_kwargs)
+
+    if 'error' in wallet_details:
+        raise ValueError(wallet_details['error'])
+    return wallet_details
+
+
+def print_table(header, rows):
+    '''
+    Columns left aligned (first) or right aligned (the rest) to their widest cell
+    '''
+    widths = [max(len(x) for x in column) for column in zip(header, *rows)]
+
+    def format_row(row):
+        cells = [row[0].ljust(widths[0])] + [x.rjust(w) for x, w in zip(row[1:], widths[1:])]
+        return '  '.join(cells)
+
+    puts(colored.cyan(format_row(header)))
+    for row in rows:
+        puts(format_row(row))
+
+
+def display_portfolio(filename, concurrency):
+    '''
+    Non-interactive: balance of every master key in a file, with totals per coin
+
+    Wallets are registered if need be and fetched concurrency at a time.
+
+    Returns True if every balance was fetched.
+    '''
+    if not USER_ONLINE:
+        puts(colored.red('BlockCypher connection needed to fetch wallet balances.'))
+        return False
+
+    try:
+        entries = read_portfolio_file(filename)
+    except (IOError, ValueError) as e:
+        puts(colored.red('Invalid portfolio file %s: %s' % (filename, e)))
+        return False
+
+    if not entries:
+        puts(colored.red('No master keys found in %s' % filename))
+        return False
+
+    wallet_ctxs = [wallet_ctx for _, wallet_ctx in entries]
+
+    puts('Fetching the balances of %s wallets, %s at a time...\n' % (
+        len(wallet_ctxs),
+        min(concurrency, len(wallet_ctxs)),
+        ))
+    results = fetch_portfolio(
+            wallet_ctxs=wallet_ctxs,
+            fetch_balance=get_registered_wallet_balance,
+            concurrency=concurrency,
+            )
+
+    def format_satoshis(satoshis, coin_symbol):
+        return format_crypto_units(
+                input_quantity=satoshis,
+                input_type='satoshi',
+                output_type=UNIT_CHOICE,
+                coin_symbol=coin_symbol,
+                print_cs=False,
+                )
+
+    header = ('wallet', 'coin', 'balance (%s)' % UNIT_CHOICE, 'unconfirmed', 'txs')
+    rows, failures = [], []
+    for (label, wallet_ctx), (wallet_details, error) in zip(entries, results):
+        wallet_str = label or '%s...%s' % (wallet_ctx.mpub[:8], wallet_ctx.mpub[-6:])
+        coin_str = COIN_SYMBOL_MAPPINGS[wallet_ctx.coin_symbol]['display_shortname']
+        if error:
+            verbose_print(error)
+            failures.append((wallet_str, wallet_ctx.mpub, error))
+            rows.append((wallet_str, coin_str, 'failed', '', ''))
+            continue
+        rows.append((
+            wallet_str,
+            coin_str,
+            format_satoshis(wallet_details['final_balance'], wallet_ctx.coin_symbol),
+            format_satoshis(wallet_details['unconfirmed_balance'], wallet_ctx.coin_symbol),
+            str(wallet_details['final_n_tx']),
+            ))
+
+    totals = get_portfolio_totals(wallet_ctxs=wallet_ctxs, results=results)
+    rows.append(('', '', '', '', ''))
+    for coin_symbol, coin_totals in totals.items():
+        total_str = 'total of %s wallets' % coin_totals['num_wallets']
+        if coin_totals['num_failed']:
+            total_str += ' (%s failed)' % coin_totals['num_failed']
+        rows.append((
+            total_str,
+            COIN_SYMBOL_MAPPINGS[coin_symbol]['display_shortname'],
+            format_satoshis(coin_totals['final_balance'], coin_symbol),
+            format_satoshis(coin_totals['unconfirmed_balance'], coin_symbol),
+            str(coin_totals['final_n_tx']),
+            ))
+
+    print_table(header=header, rows=rows)
+    puts()
+
+    for wallet_str, mpub, error in failures:
+        puts(colored.red('Could not fetch %s (%s): %s' % (wallet_str, mpub, error)))
+
+    return not failures
+
+
+def export_address_rows(wallet_ctx, out, output_format, chains, start, stop):
+    '''
+    Non-interactive: stream m/chain/start..stop-1 for each chain to out (a
+    filename or - for stdout) as csv or jsonl, with WIFs if the wallet has a
+    private key
+
+    Rows are written through a buffered file as they're derived, so memory
+    use doesn't depend on the size of the range.
+
+    Returns the number of rows written.
+    '''
+    assert output_format in ('csv', 'jsonl'), output_format
+
+    if out == '-':
+        f = sys.stdout
+    else:
+        f = open(out, 'wb', EXPORT_BUFFER_SIZE)
+
+    if wallet_ctx.has_private_key:
+        fieldnames = ('path', 'address', 'wif')
+    else:
+        fieldnames = ('path', 'address')
+
+    num_rows = 0
+    try:
+        if output_format == 'csv':
+            csv_writer = csv.writer(f)
+            csv_writer.writerow(fieldnames)
+
+        for chain_int in chains:
+            address_rows = derive_address_rows(
+                    wallet_obj=wallet_ctx.wallet_obj,
+                    chain_int=chain_int,
+                    start=start,
+                    stop=stop,
+                    jobs=DERIVATION_JOBS,
+                    )
+            for current, address, wif in address_rows:
+                row = ("m/%d/%d" % (chain_int, current), address, wif)[:len(fieldnames)]
+                if output_format == 'csv':
+                    csv_writer.writerow(row)
+                else:
+                    f.write(json.dumps(OrderedDict(zip(fieldnames, row)), separators=(',', ':')) + '\n')
+                num_rows += 1
+    finally:
+        if f is sys.stdout:
+            f.flush()
+        else:
+            f.close()
+
+    return num_rows
+
+
+def dump_selected_keys_or_addrs(wallet_ctx, used=None, zero_balance=None):
     '''
     Works for both public key only or private key access
     '''
-    if wallet_obj.private_key:
+    if wallet_ctx.has_private_key:
         content_str = 'private keys'
     else:
         content_str = 'addresses'
@@ -947,28 +2289,28 @@ def dump_selected_keys_or_addrs(wallet_obj, used=None, zero_balance=None):
             content_str,
             )))
         if confirm(user_prompt=DEFAULT_PROMPT, default=True):
-            dump_all_keys_or_addrs(wallet_obj=wallet_obj)
+            dump_all_keys_or_addrs(wallet_ctx=wallet_ctx)
         else:
             return
 
-    mpub = wallet_obj.serialize_b58(private=False)
-
-    if wallet_obj.private_key is None:
+    if not wallet_ctx.has_private_key:
         puts('Displaying Public Addresses Only')
         puts('For Private Keys, please open bcwallet with your Master Private Key:\n')
-        priv_to_display = '%s123...' % first4mprv_from_mpub(mpub=mpub)
+        priv_to_display = '%s123...' % first4mprv_from_mpub(mpub=wallet_ctx.mpub)
 
         print_bcwallet_basic_priv_opening(priv_to_display=priv_to_display)
 
     chain_address_objs = get_addresses_on_both_chains(
-            wallet_obj=wallet_obj,
+            wallet_ctx=wallet_ctx,
             used=used,
             zero_balance=zero_balance,
             )
 
-    if wallet_obj.private_key and chain_address_objs:
+    if wallet_ctx.has_private_key and chain_address_objs:
         print_childprivkey_warning()
 
+    coin_symbol = wallet_ctx.coin_symbol
+
     addr_cnt = 0
     for chain_address_obj in chain_address_objs:
         if chain_address_obj['index'] == 0:
@@ -976,16 +2318,15 @@ def dump_selected_keys_or_addrs(wallet_obj, used=None, zero_balance=None):
         elif chain_address_obj['index'] == 1:
             print_internal_chain()
         print_key_path_header()
-        for address_obj in chain_address_obj['chain_addresses']:
 
-            print_path_info(
-                    address=address_obj['pub_address'],
-                    wif=address_obj['wif'],
-                    path=address_obj['path'],
-                    coin_symbol=coin_symbol_from_mkey(mpub),
+        path_rows = [(x.path, x.address, x.wif) for x in chain_address_obj['chain_addresses']]
+        for path_rows_chunk in chunk_iterable(path_rows, ADDRESS_BATCH_SIZE):
+            print_path_info_batch(
+                    path_rows=path_rows_chunk,
+                    coin_symbol=coin_symbol,
                     )
 
-            addr_cnt += 1
+        addr_cnt += len(path_rows)
 
     if addr_cnt:
         puts(colored.blue('\nYou can compare this output to bip32.org'))
@@ -995,15 +2336,15 @@ def dump_selected_keys_or_addrs(wallet_obj, used=None, zero_balance=None):
             content_str,
             ))
         if confirm(user_prompt=DEFAULT_PROMPT, default=True):
-            dump_all_keys_or_addrs(wallet_obj=wallet_obj)
+            dump_all_keys_or_addrs(wallet_ctx=wallet_ctx)
 
 
-def dump_private_keys_or_addrs_chooser(wallet_obj):
+def dump_private_keys_or_addrs_chooser(wallet_ctx):
     '''
     Offline-enabled mechanism to dump everything
     '''
 
-    if wallet_obj.private_key:
+    if wallet_ctx.has_private_key:
         puts('Which private keys and addresses do you want?')
     else:
         puts('Which addresses do you want?')
@@ -1011,11 +2352,12 @@ def dump_private_keys_or_addrs_chooser(wallet_obj):
         puts(colored.cyan('1: Active - have funds to spend'))
         puts(colored.cyan('2: Spent - no funds to spend (because they have been spent)'))
         puts(colored.cyan('3: Unused - no funds to spend (because the address has never been used)'))
+        puts(colored.cyan('4: Discover - scan for every used address, even past the addresses BlockCypher tracks'))
         puts(colored.cyan('0: All (works offline) - regardless of whether they have funds to spend (super advanced users only)'))
         puts(colored.cyan('\nb: Go Back\n'))
     choice = choice_prompt(
             user_prompt=DEFAULT_PROMPT,
-            acceptable_responses=[0, 1, 2, 3],
+            acceptable_responses=[0, 1, 2, 3, 4],
             default_input='1',
             show_default=True,
             quit_ok=True,
@@ -1025,16 +2367,28 @@ def dump_private_keys_or_addrs_chooser(wallet_obj):
         return
 
     if choice == '1':
-        return dump_selected_keys_or_addrs(wallet_obj=wallet_obj, zero_balance=False, used=True)
+        return dump_selected_keys_or_addrs(wallet_ctx=wallet_ctx, zero_balance=False, used=True)
     elif choice == '2':
-        return dump_selected_keys_or_addrs(wallet_obj=wallet_obj, zero_balance=True, used=True)
+        return dump_selected_keys_or_addrs(wallet_ctx=wallet_ctx, zero_balance=True, used=True)
     elif choice == '3':
-        return dump_selected_keys_or_addrs(wallet_obj=wallet_obj, zero_balance=None, used=False)
+        return dump_selected_keys_or_addrs(wallet_ctx=wallet_ctx, zero_balance=None, used=False)
+    elif choice == '4':
+        puts('How many unused addresses in a row end the scan of a chain?')
+        gap_limit = get_int(
+                user_prompt=DEFAULT_PROMPT,
+                max_int=BIP32_MAX_INDEX,
+                default_input=str(DEFAULT_GAP_LIMIT),
+                show_default=True,
+                quit_ok=True,
+                )
+        if gap_limit is False:
+            return
+        return display_discovered_addresses(wallet_ctx=wallet_ctx, gap_limit=gap_limit)
     elif choice == '0':
-        return dump_all_keys_or_addrs(wallet_obj=wallet_obj)
+        return dump_all_keys_or_addrs(wallet_ctx=wallet_ctx)
 
 
-def offline_tx_chooser(wallet_obj):
+def offline_tx_chooser(wallet_ctx):
     puts('What do you want to do?:')
     puts(colored.cyan('1: Generate transaction for offline signing'))
     puts(colored.cyan('2: Sign transaction offline'))
@@ -1052,14 +2406,14 @@ def offline_tx_chooser(wallet_obj):
     if choice is False:
         return
     elif choice == '1':
-        return generate_offline_tx(wallet_obj=wallet_obj)
+        return generate_offline_tx(wallet_ctx=wallet_ctx)
     elif choice == '2':
-        return sign_tx_offline(wallet_obj=wallet_obj)
+        return sign_tx_offline(wallet_ctx=wallet_ctx)
     elif choice == '3':
-        return broadcast_signed_tx(wallet_obj=wallet_obj)
+        return broadcast_signed_tx(wallet_ctx=wallet_ctx)
 
 
-def send_chooser(wallet_obj):
+def send_chooser(wallet_ctx):
     puts('What do you want to do?:')
     if not USER_ONLINE:
         puts("(since you are NOT connected to BlockCypher, many choices are disabled)")
@@ -1067,6 +2421,7 @@ def send_chooser(wallet_obj):
         puts(colored.cyan('1: Basic send (generate transaction, sign, & broadcast)'))
         puts(colored.cyan('2: Sweep funds into bcwallet from a private key you hold'))
         puts(colored.cyan('3: Offline transaction signing (more here)'))
+        puts(colored.cyan('4: Payment queue (send several payments in one transaction for lower fees, %s queued)' % len(PAYMENT_QUEUE)))
         puts(colored.cyan('\nb: Go Back\n'))
 
     choice = choice_prompt(
@@ -1081,42 +2436,107 @@ def send_chooser(wallet_obj):
     if choice is False:
         return
     elif choice == '1':
-        return send_funds(wallet_obj=wallet_obj)
+        return send_funds(wallet_ctx=wallet_ctx)
     elif choice == '2':
-        return sweep_funds_from_privkey(wallet_obj=wallet_obj)
+        return sweep_funds_from_privkey(wallet_ctx=wallet_ctx)
     elif choice == '3':
-        offline_tx_chooser(wallet_obj=wallet_obj)
+        offline_tx_chooser(wallet_ctx=wallet_ctx)
+    elif choice == '4':
+        return payment_queue_chooser(wallet_ctx=wallet_ctx)
+
+
+def check_wallet_registration(registration_result):
+    '''
+    Wait for the background create_hd_wallet call and show any error (the
+    wallet already being registered is expected)
+
+    Returns True if the wallet is registered with BlockCypher.
+    '''
+    try:
+        registration = registration_result.get(timeout=STARTUP_TIMEOUT_IN_SECONDS)
+    except TimeoutError:
+        puts(colored.red('Timed out registering your wallet with BlockCypher.\n'))
+        return False
+    except Exception as e:
+        puts(colored.red('Could not register your wallet with BlockCypher:'))
+        puts(colored.red('%s\n' % e))
+        return False
+    verbose_print(registration)
+
+    errors = registration.get('errors', [])
+    if 'error' in registration and 'exists' not in registration['error']:
+        errors.append({'error': registration['error']})
+    if errors:
+        puts(colored.red('Could not register your wallet with BlockCypher:'))
+        for error in errors:
+            puts(colored.red(error['error']))
+        puts()
+        return False
+    return True
 
 
 def wallet_home(wallet_obj):
     '''
     Loaded on bootup (and stays in while loop until quitting)
     '''
-    mpub = wallet_obj.serialize_b58(private=False)
+    wallet_ctx = WalletContext(wallet_obj=wallet_obj)
+    mpub = wallet_ctx.mpub
+    wallet_name = wallet_ctx.wallet_name
+    coin_symbol = wallet_ctx.coin_symbol
 
-    if wallet_obj.private_key is None:
+    if not wallet_ctx.has_private_key:
         print_pubwallet_notice(mpub=mpub)
     else:
         print_bcwallet_basic_pub_opening(mpub=mpub)
 
-    coin_symbol = coin_symbol_from_mkey(mpub)
+    global PUB_CACHE
+    if PUB_CACHE_ENABLED:
+        if wallet_ctx.has_private_key:
+            puts(colored.red('The public data cache is only available in PUBLIC key (watch-only) mode, ignoring --cache.\n'))
+        else:
+            PUB_CACHE = PublicDataCache(mpub=mpub, wallet_name=wallet_name)
+            preload_verified_address_paths(
+                    master_key=mpub,
+                    address_paths=PUB_CACHE.load_address_paths(),
+                    )
+
     if USER_ONLINE:
-        wallet_name = get_blockcypher_walletname_from_mpub(
-                mpub=mpub,
-                subchain_indices=[0, 1],
-                )
+        # Register the wallet and fetch its balance concurrently
+        startup_pool = ThreadPool(processes=2)
 
         # Instruct blockcypher to track the wallet by pubkey
-        create_hd_wallet(
-                wallet_name=wallet_name,
-                xpubkey=mpub,
-                api_key=BLOCKCYPHER_API_KEY,
-                coin_symbol=coin_symbol,
-                subchain_indices=[0, 1],  # for internal and change addresses
-                )
+        registration_result = startup_pool.apply_async(create_hd_wallet, kwds={
+                'wallet_name': wallet_name,
+                'xpubkey': mpub,
+                'api_key': BLOCKCYPHER_API_KEY,
+                'coin_symbol': coin_symbol,
+                'subchain_indices': [0, 1],  # for internal and change addresses
+                })
+        balance_result = startup_pool.apply_async(get_wallet_balance, kwds={
+                'wallet_name': wallet_name,
+                'api_key': BLOCKCYPHER_API_KEY,
+                'coin_symbol': coin_symbol,
+                })
+        startup_pool.close()
+
+        # everything below needs the wallet registered
+        is_registered = check_wallet_registration(registration_result=registration_result)
 
-        # Display balance info
-        display_balance_info(wallet_obj=wallet_obj)
+        try:
+            wallet_details = balance_result.get(timeout=STARTUP_TIMEOUT_IN_SECONDS)
+            if 'error' in wallet_details:
+                # first time this wallet is used, so refetch now it's registered
+                verbose_print(wallet_details)
+                wallet_details = None
+
+            # Display balance info
+            if is_registered:
+                display_balance_info(wallet_ctx=wallet_ctx, wallet_details=wallet_details)
+        except TimeoutError:
+            puts(colored.red('Timed out fetching your balance from BlockCypher.\n'))
+        else:
+            if is_registered:
+                start_address_pool(wallet_ctx=wallet_ctx)
 
     # Go to home screen
     while True:
@@ -1144,7 +2564,7 @@ def wallet_home(wallet_obj):
             puts(colored.cyan('3: Send funds (more options here)'))
 
         with indent(2):
-            if wallet_obj.private_key:
+            if wallet_ctx.has_private_key:
                 puts(colored.cyan('0: Dump private keys and addresses (advanced users only)'))
             else:
                 puts(colored.cyan('0: Dump addresses (advanced users only)'))
@@ -1160,73 +2580,210 @@ def wallet_home(wallet_obj):
         verbose_print('Choice: %s' % choice)
 
         if choice is False:
+            if PUB_CACHE:
+                PUB_CACHE.store_address_paths(get_verified_address_paths(master_key=mpub))
+                PUB_CACHE.close()
             puts(colored.green('Thanks for using bcwallet!'))
             print_keys_not_saved()
             break
         elif choice == '1':
-            display_recent_txs(wallet_obj=wallet_obj)
+            display_recent_txs(wallet_ctx=wallet_ctx)
         elif choice == '2':
-            display_new_receiving_addresses(wallet_obj=wallet_obj)
+            display_new_receiving_addresses(wallet_ctx=wallet_ctx)
         elif choice == '3':
-            send_chooser(wallet_obj=wallet_obj)
+            send_chooser(wallet_ctx=wallet_ctx)
         elif choice == '0':
-            dump_private_keys_or_addrs_chooser(wallet_obj=wallet_obj)
+            dump_private_keys_or_addrs_chooser(wallet_ctx=wallet_ctx)
 
 
-def cli():
+def run_command(args, wallet):
+    '''
+    Run a non-interactive command (no prompts) and exit
+    '''
+    if args.command == 'portfolio':
+        # many master keys from --from-file instead of one
+        success = display_portfolio(
+                filename=args.from_file,
+                concurrency=args.concurrency,
+                )
+        sys.exit(0 if success else 1)
 
-    parser = argparse.ArgumentParser(
-            description='''Simple BIP32 HD cryptocurrecy command line wallet, with several unique features. ''' + ' '.join([x[1] for x in EXPLAINER_COPY]))
-    parser.add_argument('-w', '--wallet',
-            dest='wallet',
-            default='',
-            help='Master private or public key (starts with xprv and xpub for BTC). Can also be UNIX piped in (-w/--w not needed).',
-            )
-    parser.add_argument("-v", "--verbose",
-            dest='verbose',
-            default=False,
-            action='store_true',
-            help="Show detailed logging info",
-            )
-    parser.add_argument('-b', '--bc-api-key',
-            dest='bc_api_key',
-            # For all bcwallet users:
-            default='9c339f92713518492a4504c273d1d9f9',
-            help='BlockCypher API Key to use. If not supplied the default will be used.',
-            )
-    parser.add_argument('-u', '--units',
-            dest='units',
-            default='bit',
-            choices=UNIT_CHOICES,
-            help='Units to represent the currency in user display.',
-            )
-    parser.add_argument('--version',
-            dest='version',
-            default=False,
-            action='store_true',
-            help="Show version and quit",
-            )
-    args = parser.parse_args()
+    network = guess_network_from_mkey(wallet) if wallet else None
+    if not network:
+        puts(colored.red('A valid master key is required, supply it with -w/--wallet or pipe it in.'))
+        sys.exit(1)
+
+    try:
+        wallet_obj = Wallet.deserialize(wallet, network=network)
+    except IndexError:
+        puts(colored.red("Invalid entry: %s" % wallet))
+        sys.exit(1)
+
+    wallet_ctx = WalletContext(wallet_obj=wallet_obj)
+
+    if args.command == 'send':
+        success = batch_send_from_file(
+                wallet_ctx=wallet_ctx,
+                filename=args.from_file,
+                tx_preference=args.preference,
+                )
+    elif args.command == 'watch':
+        success = watch_wallet(
+                wallet_ctx=wallet_ctx,
+                interval=args.interval,
+                )
+    elif args.command == 'discover':
+        success = display_discovered_addresses(
+                wallet_ctx=wallet_ctx,
+                gap_limit=args.gap_limit,
+                chains=args.chains,
+                )
+    elif args.command == 'dump':
+        start, stop = args.index_range
+        try:
+            num_rows = export_address_rows(
+                    wallet_ctx=wallet_ctx,
+                    out=args.out,
+                    output_format=args.format,
+                    chains=args.chains,
+                    start=start,
+                    stop=stop,
+                    )
+        except IOError as e:
+            puts(colored.red('Could not write %s: %s' % (args.out, e)), stream=sys.stderr.write)
+            sys.exit(1)
+        if args.out != '-':
+            puts(colored.green('Wrote %s rows to %s' % (num_rows, args.out)))
+        success = True
+
+    sys.exit(0 if success else 1)
+
+
+def finish_session(profile_filename=None):
+    '''
+    Stop the address pool and print the timing summary (and write the
+    --profile trace) on quit
+    '''
+    if ADDRESS_POOL:
+        ADDRESS_POOL.close()
+    print_session_summary()
+    if profile_filename:
+        try:
+            write_profile(profile_filename)
+            puts('Wrote profile to %s' % profile_filename, stream=sys.stderr.write)
+        except IOError as e:
+            puts(colored.red('Could not write profile to %s: %s' % (profile_filename, e)), stream=sys.stderr.write)
+
+
+def configure_session(args):
+    '''
+    Set up the shared HTTP session, API server and instrumentation
+
+    Safe to call more than once.
+    '''
+    global SESSION_CONFIGURED
+    if SESSION_CONFIGURED:
+        return
+    SESSION_CONFIGURED = True
+
+    # keep-alive connections (and retries) for every BlockCypher call
+    install_shared_session()
+    if args.api_base:
+        set_api_base(args.api_base)
+
+    if args.profile:
+        enable_profile()
+    atexit.register(finish_session, profile_filename=args.profile)
+
+
+def backend_self_test():
+    '''
+    Check the secp256k1 backend against the pure-Python one and exit
+
+    Purely local, so it runs before the HTTP session and startup checks.
+    '''
+    puts('secp256k1 backend: %s' % get_backend_name())
+    passed, messages = run_self_test()
+    with indent(2):
+        for message in messages:
+            puts(message)
+    if passed:
+        puts(colored.green('Self-test passed\n'))
+        sys.exit()
+    puts(colored.red('Self-test FAILED\n'))
+    sys.exit(1)
+
+
+def cli(args=None):
+
+    if args is None:
+        args = get_arg_parser().parse_args()
+
+    if args.self_test:
+        backend_self_test()
+
+    configure_session(args=args)
 
     if args.verbose:
         global VERBOSE_MODE
         VERBOSE_MODE = True
     verbose_print('args: %s' % args)
+    verbose_print('secp256k1 backend: %s' % get_backend_name())
 
     global UNIT_CHOICE
     UNIT_CHOICE = args.units
 
+    if args.jobs < 1:
+        puts(colored.red('Invalid number of jobs: %s\n' % args.jobs))
+        sys.exit()
+    global DERIVATION_JOBS
+    DERIVATION_JOBS = args.jobs
+
+    if args.address_pool < 0:
+        puts(colored.red('Invalid address pool size: %s\n' % args.address_pool))
+        sys.exit(1)
+    if args.address_pool > MAX_ADDRESS_POOL_SIZE:
+        puts(colored.red('Address pool size %s is too large: addresses left in the pool on quit leave a gap on each chain, which must stay below the gap limit of %s. Use at most %s.\n' % (
+            args.address_pool,
+            DEFAULT_GAP_LIMIT,
+            MAX_ADDRESS_POOL_SIZE,
+            )))
+        sys.exit(1)
+    global ADDRESS_POOL_SIZE
+    ADDRESS_POOL_SIZE = args.address_pool
+
+    if args.cache:
+        global PUB_CACHE_ENABLED
+        PUB_CACHE_ENABLED = True
+
     if args.version:
-        puts(colored.green(str(pkg_resources.get_distribution("bcwallet"))))
+        puts(colored.green('bcwallet %s' % BCWALLET_VERSION))
         puts()
         sys.exit()
 
-    if sys.stdin.isatty():
+    if args.gap_limit < 1:
+        puts(colored.red('Invalid gap limit: %s\n' % args.gap_limit))
+        sys.exit(1)
+
+    if args.interval < 1:
+        puts(colored.red('Invalid interval: %s\n' % args.interval))
+        sys.exit(1)
+
+    if args.concurrency < 1:
+        puts(colored.red('Invalid concurrency: %s\n' % args.concurrency))
+        sys.exit(1)
+
+    if args.command in ('send', 'portfolio') and not args.from_file:
+        puts(colored.red('bcwallet %s requires --from-file\n' % args.command))
+        sys.exit(1)
+
+    if sys.stdin.isatty() or (args.command and args.wallet) or args.command == 'portfolio':
         wallet = args.wallet
         verbose_print('Wallet imported from args')
     else:
         wallet = sys.stdin.readline().strip()
-        sys.stdin = open('/dev/tty')
+        if not args.command:
+            sys.stdin = open('/dev/tty')
         verbose_print('Wallet imported from pipe')
     verbose_print('wallet %s' % wallet)
 
@@ -1239,6 +2796,9 @@ def cli():
             puts(colored.red('Invalid API Key: %s\n' % BLOCKCYPHER_API_KEY))
             sys.exit()
 
+    if args.command:
+        return run_command(args=args, wallet=wallet)
+
     puts("\nWelcome to bcwallet!")
 
     puts("\nHere's what makes bcwallet unique:")
@@ -1312,25 +2872,37 @@ def cli():
         sys.exit()
 
 
-def invoke_cli():
-    if sys.version_info[0] != 2 or sys.version_info[1] != 7:
-        puts(colored.red('Sorry, this app must be run with python 2.7 :('))
-        puts(colored.red('Your version: %s' % sys.version))
-        if sys.version_info[0] == 3:
-            puts(colored.red('Please uninstall bcwallet and reinstall like this:'))
-            with indent(4):
-                puts(colored.magenta('$ pip2 install bcwallet'))
+def startup_checks(args):
+    '''
+    Check if we're online and if this version of bcwallet is up to date
+    '''
+    # Probe blockcypher and look up the latest version concurrently
+    startup_pool = ThreadPool(processes=2)
+    connected_result = startup_pool.apply_async(is_connected_to_blockcypher)
+    if args.api_base:
+        # a local/stand-in API server, don't hit GitHub (or nag) for every run
+        version_result = None
+    else:
+        version_result = startup_pool.apply_async(get_latest_bcwallet_version)
+    startup_pool.close()
 
     # Check if blockcypher is up (basically if the user's machine is online)
     global USER_ONLINE
-    if is_connected_to_blockcypher():
+    try:
+        is_connected = connected_result.get(timeout=STARTUP_TIMEOUT_IN_SECONDS)
+    except TimeoutError:
+        verbose_print('Timed out connecting to BlockCypher')
+        is_connected = False
+
+    if is_connected:
         USER_ONLINE = True
 
-        current_bcwallet_version = str(pkg_resources.get_distribution("bcwallet")).split()[1]
+    if is_connected and version_result:
+        current_bcwallet_version = BCWALLET_VERSION
 
         latest_bcwallet_version = None
         try:
-            latest_bcwallet_version = get_latest_bcwallet_version()
+            latest_bcwallet_version = version_result.get(timeout=STARTUP_TIMEOUT_IN_SECONDS)
         except Exception as e:
             puts(colored.red('Unable to lookup latest version number for bcwallet on GitHub'))
             puts(colored.red('The error was:\n'))
@@ -1356,12 +2928,29 @@ def invoke_cli():
             with indent(4):
                 puts(colored.magenta('$ pip install --upgrade bcwallet \n'))
 
-            puts('Are you sure you want to continue using this old version of bcwallet?')
-            if not confirm(user_prompt=DEFAULT_PROMPT, default=False):
-                sys.exit()
+            if not args.command:
+                puts('Are you sure you want to continue using this old version of bcwallet?')
+                if not confirm(user_prompt=DEFAULT_PROMPT, default=False):
+                    sys.exit()
+
+
+def invoke_cli(args=None):
+    '''
+    Run bcwallet (args are usually parsed by launcher.invoke_cli)
+    '''
+    if args is None:
+        args = get_arg_parser().parse_args()
+
+    if args.self_test:
+        backend_self_test()
+
+    configure_session(args=args)
+
+    if args.command not in OFFLINE_COMMANDS:
+        startup_checks(args=args)
 
     try:
-        cli()
+        cli(args=args)
     except (KeyboardInterrupt, EOFError):
         puts(colored.red('\nQuitting bcwallet...'))
         print_keys_not_saved()
@@ -1376,6 +2965,9 @@ def invoke_cli():
         with indent(2):
             puts(colored.yellow(traceback.format_exc()))
         print_keys_not_saved()
+        if args.command:
+            # so scripts (cron jobs etc) see the failure
+            sys.exit(1)
         sys.exit()
 
 if __name__ == '__main__':
@@ -11,12 +11,16 @@ from blockcypher.utils import format_output
 from blockcypher.utils import UNIT_CHOICES
 
 from blockcypher.constants import COIN_SYMBOL_MAPPINGS, COIN_SYMBOL_LIST
+from blockcypher.constants import UNIT_MAPPINGS
 
 from bitmerchant.wallet.keys import PrivateKey
 
 from datetime import datetime
+from decimal import Decimal, InvalidOperation
 
+import csv
 import json
+import os
 
 
 DEFAULT_PROMPT = '฿'
@@ -25,16 +29,6 @@ BCWALLET_PRIVPIPE_EXPLANATION = "You can also pipe in your HD wallet:\n"
 BCWALLET_PRIVPIPE_CAT_EXPLANATION = "If you moved your seed to a file, you could hide your seed from your bash history:\n"
 BCWALLET_PIPE_ENCRYPTION_EXPLANATION = 'Even better, encrypt that file using gpg or opensll.'
 
-EXPLAINER_COPY = [
-        ['Multi-Currency', 'Supports Bitcoin (and Testnet), Litecoin, Dogecoin, and BlockCypher Testnet.'],
-        ['Nearly Trustless', 'Keys and signatures are generated locally for trustless use.'],
-        ['No Key Pool', 'The seed is not stored locally, the app is booted with the user supplying the master key so the filesystem is never used.'],
-        ['Hard to Mess Up', "As long as you don't lose or share your master private key, everything else is simple."],
-        ['Accurate Transaction Fees', 'Smart calculation lets user decide how long until their transaction will make it into a block.'],
-        ['Airgap Usage', 'Can be booted with the public key in watch-only mode, which is great for fetching transaction info to sign offline with a more secure machine.'],
-        ['Very Few LoC', 'Blockchain heavy lifting powered by BlockCypher, which leads to massive reduction in client-side code used for ease of auditing.'],
-        ]
-
 
 class DateTimeEncoder(json.JSONEncoder):
     # http://stackoverflow.com/a/27058505/1754586
@@ -233,6 +227,37 @@ def get_crypto_address(coin_symbol, user_prompt=DEFAULT_PROMPT, quit_ok=False):
                 )
 
 
+def get_file_path(user_prompt=DEFAULT_PROMPT, default_input=None,
+        must_exist=False, quit_ok=False):
+
+    if default_input:
+        prompt_to_use = '%s [%s]: ' % (user_prompt, default_input)
+    else:
+        prompt_to_use = '%s: ' % user_prompt
+
+    user_input = os.path.expanduser(raw_input(prompt_to_use).strip().strip('"'))
+
+    if default_input and not user_input:
+        user_input = default_input
+
+    if quit_ok and user_input in ['q', 'Q', 'b', 'B']:
+        return False
+
+    if not user_input:
+        puts(colored.red('No entry. Please enter something.'))
+    elif must_exist and not os.path.isfile(user_input):
+        puts(colored.red('No such file `%s`, please try again' % user_input))
+    else:
+        return user_input
+
+    return get_file_path(
+            user_prompt=user_prompt,
+            default_input=default_input,
+            must_exist=must_exist,
+            quit_ok=quit_ok,
+            )
+
+
 def get_wif_obj(network, user_prompt=DEFAULT_PROMPT, quit_ok=False):
 
     user_input = raw_input('%s: ' % user_prompt).strip().strip('"')
@@ -318,6 +343,83 @@ def confirm(user_prompt=DEFAULT_PROMPT, default=None):
         return confirm(user_prompt=user_prompt, default=default)
 
 
+def is_number(qty_str):
+    '''
+    Whether qty_str parses as a (possibly invalid, e.g. negative) quantity
+    '''
+    try:
+        Decimal(qty_str.replace(',', '').strip())
+    except InvalidOperation:
+        return False
+    return True
+
+
+def crypto_qty_to_satoshis(qty_str, input_type):
+    '''
+    Exact (non-float) conversion of a user supplied quantity to satoshis
+    '''
+    assert input_type in UNIT_CHOICES, input_type
+    try:
+        qty = Decimal(qty_str.replace(',', '').strip())
+    except InvalidOperation:
+        raise ValueError('%s is not a number' % qty_str)
+    if not qty.is_finite():
+        # inf/NaN/sNaN parse fine but can't be turned into satoshis
+        raise ValueError('%s is not a number' % qty_str)
+    if qty <= 0:
+        raise ValueError('%s <= 0' % qty_str)
+    try:
+        satoshis = qty * UNIT_MAPPINGS[input_type].get('satoshis_per', 1)
+        is_whole = satoshis == satoshis.to_integral_value()
+    except ArithmeticError:
+        # e.g. 1e999999999 overflows the decimal context
+        raise ValueError('%s is too large' % qty_str)
+    if not is_whole:
+        raise ValueError('%s %s is not a whole number of satoshis' % (qty_str, input_type))
+    return int(satoshis)
+
+
+def get_payouts_from_csv(filename, coin_symbol, input_type):
+    '''
+    Read (address, amount) rows from a CSV file for non-interactive sends
+
+    Amounts are in input_type units. Blank lines, lines starting with # and a
+    header row (a first line whose amount isn't a number) are skipped.
+
+    Returns a list of outputs of the following form:
+        [
+            {'address': '1abc123...', 'value': 10000},
+            ...,
+        ]
+
+    Raises ValueError (with the offending line number) on any invalid row.
+    '''
+    outputs = []
+    with open(filename, 'rb') as f:
+        for line_num, row in enumerate(csv.reader(f), 1):
+            row = [x.strip() for x in row]
+            if not row or not any(row) or row[0].startswith('#'):
+                continue
+            if len(row) != 2:
+                raise ValueError('Line %s: expected 2 columns (address, amount), got %s' % (line_num, len(row)))
+            address, qty_str = row
+            if line_num == 1 and not is_number(qty_str):
+                # header row
+                continue
+            if not is_valid_address_for_coinsymbol(address, coin_symbol=coin_symbol):
+                raise ValueError('Line %s: invalid %s address %s' % (
+                    line_num,
+                    COIN_SYMBOL_MAPPINGS[coin_symbol]['display_shortname'],
+                    address,
+                    ))
+            try:
+                satoshis = crypto_qty_to_satoshis(qty_str, input_type=input_type)
+            except ValueError as e:
+                raise ValueError('Line %s: %s' % (line_num, e))
+            outputs.append({'address': address, 'value': satoshis})
+    return outputs
+
+
 def get_public_wallet_url(mpub):
     # subchain indices set at 0 * 1
     return 'https://live.blockcypher.com/%s/xpub/%s/?subchain-indices=0-1' % (
@@ -373,6 +475,7 @@ def print_traversal_warning():
     puts("By default, BlockCypher will look 10 addresses ahead of the latest transaction (or requested receiving address) on each subchain.")
     puts("For example, if the transaction that has traversed furthest on the change address chain is at m/0/5, then BlockCypher will automatically detect any transactions sent to m/0/0-m/0/15.")
     puts("For normal bcwallet users you never have to think about this, but if you're in this section manually traversing keys then it's essential to understand.")
+    puts("To find funds past the look-ahead, use Discover (or `bcwallet discover`), which scans each subchain until a gap of unused addresses.")
     puts("This feature should primarily be considered a last resource to migrate away from bcwallet if BlockCypher is down.")
 
 
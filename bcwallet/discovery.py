@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+# Gap-limit discovery of used addresses, without relying on BlockCypher
+# tracking the wallet (and its 10 address look-ahead)
+#
+# Each chain is derived in batches, and each batch is looked up with one
+# batched /addrs/addr1;addr2;.../balance call. The next batch is derived while
+# the previous lookup is in flight. A chain is done once gap_limit addresses
+# in a row after the last used one have never been used.
+#
+# With jobs > 1, one process pool is shared by the whole discovery and jobs
+# batches are derived per call (one batch per process).
+
+from multiprocessing.pool import ThreadPool
+
+from .bc_utils import derive_address_rows
+from .bc_utils import make_derivation_pool
+from .bc_utils import get_addresses_overview
+from .bc_utils import ADDRESS_BATCH_SIZE
+
+from .launcher import DEFAULT_GAP_LIMIT
+
+
+def _lookup_rows(rows, coin_symbol, api_key):
+    overviews = get_addresses_overview(
+            address_list=[address for _, address, _ in rows],
+            coin_symbol=coin_symbol,
+            api_key=api_key,
+            )
+    return zip(rows, overviews)
+
+
+def discover_chain(wallet_obj, chain_int, coin_symbol, api_key, lookup_pool,
+        gap_limit=DEFAULT_GAP_LIMIT, batch_size=ADDRESS_BATCH_SIZE, jobs=1, derivation_pool=None, progress=None):
+    '''
+    Scan m/chain_int/0, 1, ... until gap_limit unused addresses in a row
+
+    Returns a dict of highest_used_index (None if nothing was ever used),
+    num_scanned and used_addresses, a list of {'index', 'path', 'address',
+    'wif', 'n_tx', 'balance'} dicts (wif is None without a private key).
+
+    progress(chain_int, num_scanned, highest_used_index) is called after
+    each batch. With jobs > 1, derivation_pool (from make_derivation_pool)
+    is used instead of starting a process pool per call.
+    '''
+    assert gap_limit > 0, gap_limit
+    assert 0 < batch_size <= ADDRESS_BATCH_SIZE, batch_size
+
+    def iter_batches():
+        start = 0
+        while True:
+            stop = start + batch_size * jobs
+            rows = list(derive_address_rows(
+                wallet_obj=wallet_obj,
+                chain_int=chain_int,
+                start=start,
+                stop=stop,
+                jobs=jobs,
+                chunk_size=batch_size,
+                pool=derivation_pool,
+                ))
+            for batch_start in range(0, len(rows), batch_size):
+                yield rows[batch_start:batch_start + batch_size]
+            start = stop
+
+    batches = iter_batches()
+
+    used_addresses = []
+    highest_used_index = None
+    num_scanned = 0
+
+    pending = lookup_pool.apply_async(_lookup_rows, (next(batches), coin_symbol, api_key))
+    while True:
+        # derive ahead while the lookup is in flight (wasted on the last batch)
+        next_rows = next(batches)
+
+        for (index, address, wif), overview in pending.get():
+            if overview.get('final_n_tx'):
+                highest_used_index = index
+                used_addresses.append({
+                    'index': index,
+                    'path': 'm/%d/%d' % (chain_int, index),
+                    'address': address,
+                    'wif': wif,
+                    'n_tx': overview['final_n_tx'],
+                    'balance': overview['final_balance'],
+                    })
+        num_scanned += batch_size
+
+        if progress:
+            progress(chain_int, num_scanned, highest_used_index)
+
+        if highest_used_index is None:
+            num_unused = num_scanned
+        else:
+            num_unused = num_scanned - highest_used_index - 1
+        if num_unused >= gap_limit:
+            break
+
+        pending = lookup_pool.apply_async(_lookup_rows, (next_rows, coin_symbol, api_key))
+
+    return {
+            'highest_used_index': highest_used_index,
+            'num_scanned': num_scanned,
+            'used_addresses': used_addresses,
+            }
+
+
+def discover_used_addresses(wallet_obj, coin_symbol, api_key, chains=(0, 1),
+        gap_limit=DEFAULT_GAP_LIMIT, batch_size=ADDRESS_BATCH_SIZE, jobs=1, progress=None):
+    '''
+    discover_chain for each of chains, returns a dict of chain_int -> result
+    '''
+    # one lookup in flight at a time, the main thread derives
+    lookup_pool = ThreadPool(processes=1)
+    derivation_pool = make_derivation_pool(jobs) if jobs > 1 else None
+    try:
+        results = {}
+        for chain_int in chains:
+            results[chain_int] = discover_chain(
+                    wallet_obj=wallet_obj,
+                    chain_int=chain_int,
+                    coin_symbol=coin_symbol,
+                    api_key=api_key,
+                    lookup_pool=lookup_pool,
+                    gap_limit=gap_limit,
+                    batch_size=batch_size,
+                    jobs=jobs,
+                    derivation_pool=derivation_pool,
+                    progress=progress,
+                    )
+        return results
+    finally:
+        lookup_pool.terminate()
+        if derivation_pool:
+            derivation_pool.terminate()
+            derivation_pool.join()
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+
+# secp256k1 backend for key derivation and signing
+#
+# Uses libsecp256k1 (via coincurve) when it's installed:
+#   $ pip install bcwallet[fast]
+# and otherwise falls back on the pure-Python code paths of bitmerchant
+# (derivation) and blockcypher/pybitcointools (signing).
+
+from binascii import hexlify
+from binascii import unhexlify
+from hashlib import sha256
+from hashlib import sha512
+
+from bitmerchant.network import BitcoinMainNet
+from bitmerchant.wallet import Wallet
+
+from blockcypher.api import make_tx_signatures as python_make_tx_signatures
+
+from .instrumentation import timed
+
+from .key_encoding import pubkeys_to_addresses
+from .key_encoding import privkeys_to_wifs
+
+import hmac
+import struct
+
+try:
+    import coincurve
+except ImportError:
+    coincurve = None
+
+
+# order of the secp256k1 generator
+CURVE_ORDER = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141
+
+# children derived (and digests signed) per chain when comparing backends
+SELF_TEST_VECTORS = 50
+SELF_TEST_SEED = 'bcwallet secp256k1 backend self-test'
+
+
+def get_backend_name():
+    if coincurve is None:
+        return 'python'
+    return 'coincurve'
+
+
+def wallet_to_child_info(child_wallet):
+    '''
+    Address, pubkeyhex (and wif/privkeyhex if private) for a bitmerchant Wallet
+    '''
+    child_info = {
+            'address': child_wallet.to_address(),
+            'pubkeyhex': child_wallet.get_public_key_hex(compressed=True),
+            }
+    if child_wallet.private_key:
+        child_info['wif'] = child_wallet.export_to_wif()
+        child_info['privkeyhex'] = child_wallet.get_private_key_hex()
+    return child_info
+
+
+def child_keys_to_infos(child_keys, network):
+    '''
+    Encode a list of (pubkey, privkey or None) byte strings as child info
+    dicts (address, pubkeyhex, plus wif and privkeyhex for private keys)
+
+    Addresses and WIFs are encoded in one batch.
+    '''
+    addresses = pubkeys_to_addresses([pubkey for pubkey, _ in child_keys], network)
+    child_infos = [{
+        'address': address,
+        'pubkeyhex': hexlify(pubkey),
+        } for address, (pubkey, _) in zip(addresses, child_keys)]
+
+    private_keys = [(cnt, privkey) for cnt, (_, privkey) in enumerate(child_keys) if privkey]
+    wifs = privkeys_to_wifs([privkey for _, privkey in private_keys], network)
+    for (cnt, privkey), wif in zip(private_keys, wifs):
+        child_infos[cnt]['wif'] = wif
+        child_infos[cnt]['privkeyhex'] = hexlify(privkey)
+    return child_infos
+
+
+def _python_derive_child_keys(chain_wallet, index):
+    child_wallet = chain_wallet.get_child(index, is_prime=False)
+    pubkey = unhexlify(child_wallet.get_public_key_hex(compressed=True))
+    if child_wallet.private_key:
+        return pubkey, unhexlify(child_wallet.get_private_key_hex())
+    return pubkey, None
+
+
+def _python_derive_child_info(chain_wallet, index):
+    return wallet_to_child_info(chain_wallet.get_child(index, is_prime=False))
+
+
+def _coincurve_derive_child_keys(chain_wallet, index):
+    # BIP32 non-hardened CKD, with the EC math done by libsecp256k1
+    parent_pubkey = unhexlify(chain_wallet.get_public_key_hex(compressed=True))
+    hmac_out = hmac.new(
+            unhexlify(chain_wallet.chain_code),
+            msg=parent_pubkey + struct.pack('>L', index),
+            digestmod=sha512).digest()
+    I_L = hmac_out[:32]
+    I_L_long = int(hexlify(I_L), 16)
+
+    if I_L_long >= CURVE_ORDER:
+        # invalid child (~1 in 2**127), let bitmerchant raise its usual error
+        return _python_derive_child_keys(chain_wallet, index)
+
+    if chain_wallet.private_key:
+        child_privkey_long = (I_L_long + int(chain_wallet.get_private_key_hex(), 16)) % CURVE_ORDER
+        if child_privkey_long == 0:
+            return _python_derive_child_keys(chain_wallet, index)
+        child_privkey = unhexlify('%064x' % child_privkey_long)
+        child_pubkey = coincurve.PublicKey.from_secret(child_privkey).format(compressed=True)
+        return child_pubkey, child_privkey
+
+    child_pubkey = coincurve.PublicKey(parent_pubkey).add(I_L).format(compressed=True)
+    return child_pubkey, None
+
+
+def _coincurve_derive_child_info(chain_wallet, index):
+    return child_keys_to_infos(
+            child_keys=[_coincurve_derive_child_keys(chain_wallet, index)],
+            network=chain_wallet.network,
+            )[0]
+
+
+def _derive_child_keys(chain_wallet, indices):
+    if coincurve is None:
+        derive_keys = _python_derive_child_keys
+    else:
+        derive_keys = _coincurve_derive_child_keys
+    return [derive_keys(chain_wallet, index) for index in indices]
+
+
+def _derive_child_infos(chain_wallet, indices):
+    return child_keys_to_infos(
+            child_keys=_derive_child_keys(chain_wallet, indices),
+            network=chain_wallet.network,
+            )
+
+
+def derive_child_info(chain_wallet, index):
+    '''
+    Derive chain_wallet's non-hardened child index
+
+    Returns a dict of address and pubkeyhex, plus wif and privkeyhex if
+    chain_wallet has a private key.
+    '''
+    with timed('crypto', 'derive_child_info'):
+        return _derive_child_infos(chain_wallet, [index])[0]
+
+
+def derive_child_infos(chain_wallet, indices):
+    '''
+    derive_child_info for each of indices (in order), with the addresses and
+    WIFs encoded in one batch
+    '''
+    with timed('crypto', 'derive_child_infos', args={'num_children': len(indices)}):
+        return _derive_child_infos(chain_wallet, indices)
+
+
+def derive_child_keys(chain_wallet, indices):
+    '''
+    Raw (compressed pubkey, privkey) bytes of each of chain_wallet's
+    non-hardened children indices (privkey is None without a private key)
+    '''
+    with timed('crypto', 'derive_child_keys', args={'num_children': len(indices)}):
+        return _derive_child_keys(chain_wallet, indices)
+
+
+def _coincurve_make_tx_signatures(txs_to_sign, privkey_list, pubkey_list):
+    assert len(privkey_list) == len(pubkey_list) == len(txs_to_sign)
+
+    signatures = []
+    for cnt, tx_to_sign in enumerate(txs_to_sign):
+        digest = unhexlify(tx_to_sign.rstrip(' \t\r\n\0'))
+        # deterministic (RFC6979) k and low-S, like pybitcointools
+        sig = coincurve.PrivateKey(unhexlify(privkey_list[cnt])).sign(digest, hasher=None)
+        err_msg = 'Bad Signature: sig %s for tx %s with pubkey %s' % (
+                hexlify(sig),
+                tx_to_sign,
+                pubkey_list[cnt],
+                )
+        assert coincurve.PublicKey(unhexlify(pubkey_list[cnt])).verify(sig, digest, hasher=None), err_msg
+        signatures.append(hexlify(sig))
+    return signatures
+
+
+def make_tx_signatures(txs_to_sign, privkey_list, pubkey_list):
+    '''
+    Drop-in replacement for blockcypher's make_tx_signatures
+    '''
+    if coincurve is None:
+        return python_make_tx_signatures(
+                txs_to_sign=txs_to_sign,
+                privkey_list=privkey_list,
+                pubkey_list=pubkey_list,
+                )
+    return _coincurve_make_tx_signatures(
+            txs_to_sign=txs_to_sign,
+            privkey_list=privkey_list,
+            pubkey_list=pubkey_list,
+            )
+
+
+def run_self_test(num_vectors=SELF_TEST_VECTORS):
+    '''
+    Check the batch address/WIF encoding against bitmerchant's, and the fast
+    backend against the pure-Python one
+
+    Derives num_vectors children on a private and a public chain and signs
+    num_vectors digests with both backends, which must be byte-identical.
+
+    Returns (passed, list of messages)
+    '''
+    messages = []
+    passed = True
+
+    master_wallet = Wallet.from_master_secret(SELF_TEST_SEED, network=BitcoinMainNet)
+    chain_wallet = master_wallet.get_child(0, is_prime=False)
+    public_chain_wallet = chain_wallet.public_copy()
+
+    for chain_name, wallet_obj in (('private', chain_wallet), ('public', public_chain_wallet)):
+        child_infos = child_keys_to_infos(
+                child_keys=[_python_derive_child_keys(wallet_obj, index) for index in range(num_vectors)],
+                network=wallet_obj.network,
+                )
+        mismatches = len([index for index, child_info in enumerate(child_infos)
+            if child_info != _python_derive_child_info(wallet_obj, index)])
+        if mismatches:
+            passed = False
+            messages.append('Encoding (%s): %s of %s children differ' % (chain_name, mismatches, num_vectors))
+        else:
+            messages.append('Encoding (%s): %s children identical' % (chain_name, num_vectors))
+
+    if coincurve is None:
+        messages.append('coincurve is not installed, using the pure-Python backend (nothing to compare).')
+        return passed, messages
+
+    privkey_list, pubkey_list = [], []
+    for chain_name, wallet_obj in (('private', chain_wallet), ('public', public_chain_wallet)):
+        mismatches = 0
+        for index in range(num_vectors):
+            expected = _python_derive_child_info(wallet_obj, index)
+            if _coincurve_derive_child_info(wallet_obj, index) != expected:
+                mismatches += 1
+            if 'privkeyhex' in expected:
+                privkey_list.append(expected['privkeyhex'])
+                pubkey_list.append(expected['pubkeyhex'])
+        if mismatches:
+            passed = False
+            messages.append('Derivation (%s): %s of %s children differ' % (chain_name, mismatches, num_vectors))
+        else:
+            messages.append('Derivation (%s): %s children identical' % (chain_name, num_vectors))
+
+    txs_to_sign = [sha256(str(x)).hexdigest() for x in range(num_vectors)]
+    expected_sigs = python_make_tx_signatures(
+            txs_to_sign=txs_to_sign,
+            privkey_list=privkey_list,
+            pubkey_list=pubkey_list,
+            )
+    fast_sigs = _coincurve_make_tx_signatures(
+            txs_to_sign=txs_to_sign,
+            privkey_list=privkey_list,
+            pubkey_list=pubkey_list,
+            )
+    mismatches = len([x for x, y in zip(expected_sigs, fast_sigs) if x != y])
+    if mismatches:
+        passed = False
+        messages.append('Signing: %s of %s signatures differ' % (mismatches, num_vectors))
+    else:
+        messages.append('Signing: %s signatures identical' % num_vectors)
+
+    return passed, messages
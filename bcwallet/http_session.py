@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+# One pooled, keep-alive HTTP session (with retries) shared by every request
+# bcwallet makes, including the ones made inside the blockcypher library
+
+from requests.adapters import HTTPAdapter
+
+from blockcypher import api as blockcypher_api
+
+from urlparse import urlparse
+
+from .instrumentation import add_to_current_span
+from .instrumentation import timed
+
+import re
+import requests
+import time
+
+
+# connections kept alive per host (should cover the most concurrent requests)
+HTTP_POOL_SIZE = 10
+
+# idempotent (GET) requests are retried with exponential backoff on
+# connection errors, timeouts and these (transient) status codes
+HTTP_RETRIES = 3
+HTTP_BACKOFF_SECONDS = 0.25
+HTTP_RETRY_STATUS_CODES = (502, 503, 504)
+
+SESSION = None
+
+# URL path segments kept as is in timing names (addresses, wallet names,
+# hashes etc become *)
+ENDPOINT_SEGMENT_RE = re.compile(r'^[a-z][a-z0-9_-]{0,11}$')
+
+
+def get_session():
+    '''
+    The shared requests.Session (created on first use)
+    '''
+    global SESSION
+    if SESSION is None:
+        SESSION = requests.Session()
+        for prefix in ('https://', 'http://'):
+            SESSION.mount(prefix, HTTPAdapter(
+                pool_connections=HTTP_POOL_SIZE,
+                pool_maxsize=HTTP_POOL_SIZE,
+                ))
+    return SESSION
+
+
+def get_endpoint_name(method, url):
+    '''
+    e.g. GET api.blockcypher.com/v1/btc/main/addrs/*/balance
+    '''
+    parsed_url = urlparse(url)
+    segments = [x if ENDPOINT_SEGMENT_RE.match(x) else '*' for x in parsed_url.path.split('/') if x]
+    return '%s %s/%s' % (method, parsed_url.netloc, '/'.join(segments))
+
+
+def _record_response(r, retries):
+    # credited to this request's span and the calls it was made from
+    add_to_current_span(
+            bytes_sent=len(r.request.body or ''),
+            bytes_received=len(r.content),
+            retries=retries,
+            )
+
+
+def session_get(url, **kwargs):
+    '''
+    requests.get through the shared session, with retries
+    '''
+    with timed('http', get_endpoint_name('GET', url)):
+        for attempt in range(HTTP_RETRIES + 1):
+            is_last_attempt = attempt == HTTP_RETRIES
+            try:
+                r = get_session().get(url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if is_last_attempt:
+                    add_to_current_span(retries=attempt)
+                    raise
+            else:
+                if r.status_code not in HTTP_RETRY_STATUS_CODES or is_last_attempt:
+                    _record_response(r=r, retries=attempt)
+                    return r
+                # hand the connection back to the pool before retrying
+                r.close()
+            time.sleep(HTTP_BACKOFF_SECONDS * 2**attempt)
+
+
+def session_post(url, **kwargs):
+    '''
+    requests.post through the shared session
+
+    Not retried, a POST (e.g. a broadcast) may have gone through even if we
+    didn't get the response.
+    '''
+    with timed('http', get_endpoint_name('POST', url)):
+        r = get_session().post(url, **kwargs)
+        _record_response(r=r, retries=0)
+        return r
+
+
+class SessionRequests(object):
+    '''
+    Stand-in for the requests module that sends get/post through the shared
+    session (everything else, e.g. requests.exceptions, is passed through)
+    '''
+
+    get = staticmethod(session_get)
+    post = staticmethod(session_post)
+
+    def __getattr__(self, name):
+        return getattr(requests, name)
+
+
+def set_api_base(api_base):
+    '''
+    Send every BlockCypher call to api_base (e.g. a local mock_server) instead
+    of https://api.blockcypher.com
+    '''
+    blockcypher_api.BLOCKCYPHER_DOMAIN = api_base.rstrip('/')
+
+
+def install_shared_session():
+    '''
+    Route the blockcypher library's HTTP calls through the shared session
+
+    Safe to call more than once.
+    '''
+    if not isinstance(blockcypher_api.requests, SessionRequests):
+        blockcypher_api.requests = SessionRequests()
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+# Wall time, bytes and retries for every BlockCypher call and crypto step
+#
+# Every instrumented call is added up per (category, name) for the summary
+# printed at the end of a session. With --profile FILE each call is also kept
+# as a Chrome trace event (open FILE in chrome://tracing or Perfetto).
+#
+# HTTP requests made inside an instrumented call (see http_session) add their
+# bytes and retries to that call, so e.g. create_unsigned_tx shows the
+# retries of the request it made.
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+
+from clint.textui import puts, indent
+
+import json
+import os
+import sys
+import threading
+import time
+
+
+SESSION_START = time.time()
+
+# (category, name) -> {'calls', 'seconds', 'max_seconds', 'bytes_sent', ...}
+STATS = OrderedDict()
+
+# Chrome trace events, only kept once enable_profile() is called
+PROFILE_ENABLED = False
+TRACE_EVENTS = []
+
+STATS_LOCK = threading.Lock()
+
+# per thread stack of open spans (HTTP bytes/retries are credited to all of them)
+SPAN_STACKS = threading.local()
+
+# thread ident -> small tid for the trace
+TRACE_TIDS = {}
+
+
+def enable_profile():
+    global PROFILE_ENABLED
+    PROFILE_ENABLED = True
+
+
+def _get_span_stack():
+    if not hasattr(SPAN_STACKS, 'stack'):
+        SPAN_STACKS.stack = []
+    return SPAN_STACKS.stack
+
+
+def add_to_current_span(bytes_sent=0, bytes_received=0, retries=0):
+    '''
+    Credit bytes/retries to every open span of this thread (e.g. an HTTP
+    request and the API call it was made from)
+    '''
+    for span in _get_span_stack():
+        span['bytes_sent'] += bytes_sent
+        span['bytes_received'] += bytes_received
+        span['retries'] += retries
+
+
+def record_span(span, start, seconds):
+    key = (span['category'], span['name'])
+    with STATS_LOCK:
+        if key not in STATS:
+            STATS[key] = {
+                    'calls': 0,
+                    'seconds': 0.0,
+                    'max_seconds': 0.0,
+                    'bytes_sent': 0,
+                    'bytes_received': 0,
+                    'retries': 0,
+                    'errors': 0,
+                    }
+        stats = STATS[key]
+        stats['calls'] += 1
+        stats['seconds'] += seconds
+        stats['max_seconds'] = max(stats['max_seconds'], seconds)
+        for field in ('bytes_sent', 'bytes_received', 'retries'):
+            stats[field] += span[field]
+        if span['error']:
+            stats['errors'] += 1
+
+        if PROFILE_ENABLED:
+            thread_ident = threading.current_thread().ident
+            if thread_ident not in TRACE_TIDS:
+                TRACE_TIDS[thread_ident] = len(TRACE_TIDS) + 1
+            TRACE_EVENTS.append({
+                'name': span['name'],
+                'cat': span['category'],
+                'ph': 'X',
+                'ts': int((start - SESSION_START) * 10**6),
+                'dur': int(seconds * 10**6),
+                'pid': os.getpid(),
+                'tid': TRACE_TIDS[thread_ident],
+                'args': dict((k, span[k]) for k in ('bytes_sent', 'bytes_received', 'retries', 'error', 'args') if span[k]),
+                })
+
+
+@contextmanager
+def timed(category, name, args=None):
+    '''
+    Time the enclosed block as one call of (category, name)
+
+    Yields the span dict, callers may add to its bytes_sent, bytes_received
+    and retries.
+    '''
+    span = {
+            'category': category,
+            'name': name,
+            'bytes_sent': 0,
+            'bytes_received': 0,
+            'retries': 0,
+            'error': False,
+            'args': args,
+            }
+    span_stack = _get_span_stack()
+    span_stack.append(span)
+    start = time.time()
+    try:
+        yield span
+    except Exception:
+        span['error'] = True
+        raise
+    finally:
+        seconds = time.time() - start
+        span_stack.pop()
+        record_span(span=span, start=start, seconds=seconds)
+
+
+def instrumented(category, func, name=None):
+    '''
+    Wrap func so each call is timed as (category, name or func.__name__)
+    '''
+    span_name = name or func.__name__
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with timed(category, span_name):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def print_session_summary(stream=sys.stderr.write):
+    '''
+    Table of every instrumented call this session (nothing if there were none)
+    '''
+    with STATS_LOCK:
+        rows = sorted(STATS.items(), key=lambda x: -x[1]['seconds'])
+    if not rows:
+        return
+
+    name_width = max([len(name) for (_, name), _ in rows])
+    puts('\nSession summary (%.1fs):' % (time.time() - SESSION_START), stream=stream)
+    with indent(2):
+        puts('%-8s %-*s %6s %9s %9s %9s %8s %8s %7s %6s' % (
+            'type', name_width, 'call', 'calls', 'total s', 'mean ms', 'max ms', 'KB out', 'KB in', 'retries', 'errors',
+            ), stream=stream)
+        for (category, name), stats in rows:
+            puts('%-8s %-*s %6s %9.3f %9.1f %9.1f %8.1f %8.1f %7s %6s' % (
+                category,
+                name_width,
+                name,
+                stats['calls'],
+                stats['seconds'],
+                stats['seconds'] / stats['calls'] * 1000,
+                stats['max_seconds'] * 1000,
+                stats['bytes_sent'] / 1024.0,
+                stats['bytes_received'] / 1024.0,
+                stats['retries'],
+                stats['errors'],
+                ), stream=stream)
+    puts(stream=stream)
+
+
+def write_profile(filename):
+    '''
+    Write the Chrome trace events (and the summary stats) to filename as JSON
+    '''
+    with STATS_LOCK:
+        profile = {
+                'traceEvents': list(TRACE_EVENTS),
+                'displayTimeUnit': 'ms',
+                'otherData': {
+                    'summary': [dict(stats, category=category, name=name) for (category, name), stats in STATS.items()],
+                    },
+                }
+    with open(filename, 'w') as f:
+        json.dump(profile, f, separators=(',', ':'))
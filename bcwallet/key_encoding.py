@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+# Batch hash160 and base58check encoding of derived keys
+#
+# Encoding many keys at once (e.g. for a dump) is a few times faster than
+# calling bitmerchant's to_address()/export_to_wif() (or the base58 module)
+# once per key: the hash objects are copied instead of looked up by name,
+# and base58 works on the whole payload as one integer, two digits per
+# divmod via a lookup table, instead of one byte and one digit at a time.
+# Output is identical to base58.b58encode_check.
+
+from binascii import hexlify
+from hashlib import sha256
+
+import hashlib
+
+
+B58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+
+# every two digit base58 string, indexed by its value (0 to 58**2 - 1)
+B58_PAIRS = [x + y for x in B58_ALPHABET for y in B58_ALPHABET]
+B58_PAIR_BASE = 58**2
+
+# copied for each key (hashlib.new('ripemd160') looks the algorithm up by
+# name), created on first use by get_ripemd160
+RIPEMD160 = None
+
+
+def get_ripemd160():
+    '''
+    An empty ripemd160 hash object to copy
+
+    OpenSSL 3 builds without the legacy provider don't have ripemd160, so
+    fall back to pybitcointools' pure-Python one there.
+    '''
+    global RIPEMD160
+    if RIPEMD160 is None:
+        try:
+            RIPEMD160 = hashlib.new('ripemd160')
+        except ValueError:
+            from bitcoin import ripemd
+            RIPEMD160 = ripemd.new()
+    return RIPEMD160
+
+
+def b58encode_check_batch(payloads):
+    '''
+    base58check (4 byte double sha256 checksum) for each payload (bytes)
+    '''
+    pairs = B58_PAIRS
+    pair_base = B58_PAIR_BASE
+
+    encoded = []
+    for payload in payloads:
+        payload += sha256(sha256(payload).digest()).digest()[:4]
+
+        num = int(hexlify(payload), 16)
+        digit_pairs = []
+        while num:
+            num, pair = divmod(num, pair_base)
+            digit_pairs.append(pair)
+        digits = ''.join([pairs[x] for x in reversed(digit_pairs)]).lstrip('1')
+
+        # leading zero bytes are encoded as 1s
+        num_leading_zeros = len(payload) - len(payload.lstrip('\0'))
+        encoded.append('1' * num_leading_zeros + digits)
+    return encoded
+
+
+def hash160_batch(data_list):
+    '''
+    ripemd160(sha256(data)) for each data (bytes)
+    '''
+    new_ripemd160 = get_ripemd160().copy
+    hashes = []
+    for data in data_list:
+        ripemd160 = new_ripemd160()
+        ripemd160.update(sha256(data).digest())
+        hashes.append(ripemd160.digest())
+    return hashes
+
+
+def pubkeys_to_addresses(pubkeys, network):
+    '''
+    P2PKH addresses for a list of SEC-encoded (e.g. compressed) public keys
+    '''
+    version_byte = chr(network.PUBKEY_ADDRESS)
+    return b58encode_check_batch([version_byte + x for x in hash160_batch(pubkeys)])
+
+
+def privkeys_to_wifs(privkeys, network):
+    '''
+    Compressed-pubkey WIFs for a list of 32 byte private keys (as BIP32
+    wallets export them)
+    '''
+    version_byte = chr(network.SECRET_KEY)
+    return b58encode_check_batch([version_byte + x + '\01' for x in privkeys])
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+
+# Entry points, command line arguments and the constants they need
+#
+# Only the standard library is imported here, so `bcwallet --help` and
+# `bcwallet --version` (e.g. from scripted health checks) return without
+# loading bitmerchant, blockcypher, requests or clint. Everything else is
+# loaded (from bcwallet.bcwallet) once the wallet actually runs.
+
+import argparse
+import os
+import sys
+
+
+# keep in sync with setup.py (whose version line older bcwallets read from
+# GitHub to check for updates)
+BCWALLET_VERSION = '1.2.4'
+
+# commands that run without any prompts (e.g. for cron jobs)
+NON_INTERACTIVE_COMMANDS = ('send', 'dump', 'discover', 'watch', 'portfolio')
+
+# commands that never need BlockCypher (and may write their output to stdout)
+OFFLINE_COMMANDS = ('dump', )
+
+# same as blockcypher.constants.UNIT_CHOICES (importing anything from
+# blockcypher loads its whole api module)
+UNIT_CHOICES = ('btc', 'mbtc', 'bit', 'satoshi')
+
+# non-hardened child indices are 0 <= index < BIP32_MAX_INDEX
+BIP32_MAX_INDEX = 2**31
+
+# unused addresses in a row that end a discovery scan of a chain (as in BIP44)
+DEFAULT_GAP_LIMIT = 20
+
+# pooled addresses left unused on quit leave a gap on each chain, which must
+# stay below the gap limit other BIP32 wallets (and `discover`) scan past
+MAX_ADDRESS_POOL_SIZE = DEFAULT_GAP_LIMIT - 1
+
+# seconds between `watch` polls (BlockCypher's free tier allows 200 requests an hour)
+DEFAULT_WATCH_INTERVAL = 30
+
+# wallets whose balances `portfolio` fetches at once (at most the keep-alive
+# connections in http_session.HTTP_POOL_SIZE are reused)
+DEFAULT_PORTFOLIO_CONCURRENCY = 8
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.bcwallet')
+
+EXPLAINER_COPY = [
+        ['Multi-Currency', 'Supports Bitcoin (and Testnet), Litecoin, Dogecoin, and BlockCypher Testnet.'],
+        ['Nearly Trustless', 'Keys and signatures are generated locally for trustless use.'],
+        ['No Key Pool', 'The seed is not stored locally, the app is booted with the user supplying the master key so keys never touch the filesystem (only the opt-in --cache of public wallet data is written to disk).'],
+        ['Hard to Mess Up', "As long as you don't lose or share your master private key, everything else is simple."],
+        ['Accurate Transaction Fees', 'Smart calculation lets user decide how long until their transaction will make it into a block.'],
+        ['Airgap Usage', 'Can be booted with the public key in watch-only mode, which is great for fetching transaction info to sign offline with a more secure machine.'],
+        ['Very Few LoC', 'Blockchain heavy lifting powered by BlockCypher, which leads to massive reduction in client-side code used for ease of auditing.'],
+        ]
+
+
+def index_range_arg(range_str):
+    '''
+    argparse type for START:STOP child index ranges (STOP excluded)
+    '''
+    try:
+        start, stop = [int(x) for x in range_str.split(':')]
+    except ValueError:
+        raise argparse.ArgumentTypeError('%s is not of the form START:STOP' % range_str)
+    if not 0 <= start < stop <= BIP32_MAX_INDEX:
+        raise argparse.ArgumentTypeError('%s must satisfy 0 <= START < STOP <= %s' % (range_str, BIP32_MAX_INDEX))
+    return start, stop
+
+
+def chain_list_arg(chain_str):
+    '''
+    argparse type for comma separated chains (0 is external, 1 is internal/change)
+    '''
+    try:
+        chains = [int(x) for x in chain_str.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError('%s is not a comma separated list of chains' % chain_str)
+    if not chains or any(x not in (0, 1) for x in chains):
+        raise argparse.ArgumentTypeError('chains must be 0 (external) and/or 1 (internal/change)')
+    return chains
+
+
+def get_arg_parser():
+    parser = argparse.ArgumentParser(
+            prog='bcwallet',
+            description='''Simple BIP32 HD cryptocurrecy command line wallet, with several unique features. ''' + ' '.join([x[1] for x in EXPLAINER_COPY]))
+    parser.add_argument('command',
+            nargs='?',
+            choices=NON_INTERACTIVE_COMMANDS,
+            help='Run a non-interactive command instead of the interactive wallet. send: pay every address,amount row of --from-file. dump: export derived addresses (and private keys in private key mode) to --out. discover: scan for used addresses until --gap-limit unused ones in a row. watch: print new transactions and confirmations as they happen, polling every --interval seconds. portfolio: show the balance of every master key in --from-file, with totals per coin.',
+            )
+    parser.add_argument('-w', '--wallet',
+            dest='wallet',
+            default='',
+            help='Master private or public key (starts with xprv and xpub for BTC). Can also be UNIX piped in (-w/--w not needed).',
+            )
+    parser.add_argument("-v", "--verbose",
+            dest='verbose',
+            default=False,
+            action='store_true',
+            help="Show detailed logging info",
+            )
+    parser.add_argument('-b', '--bc-api-key',
+            dest='bc_api_key',
+            # For all bcwallet users:
+            default='9c339f92713518492a4504c273d1d9f9',
+            help='BlockCypher API Key to use. If not supplied the default will be used.',
+            )
+    parser.add_argument('-u', '--units',
+            dest='units',
+            default='bit',
+            choices=UNIT_CHOICES,
+            help='Units to represent the currency in user display.',
+            )
+    parser.add_argument('-j', '--jobs',
+            dest='jobs',
+            default=1,
+            type=int,
+            help='Number of processes to use for deriving keys/addresses and signing transaction inputs in bulk (defaults to 1).',
+            )
+    parser.add_argument('--cache',
+            dest='cache',
+            default=False,
+            action='store_true',
+            help='Cache public wallet data (confirmed transactions and addresses) on disk in %s, obfuscated and integrity checked (not strongly encrypted). Watch-only mode only.' % DEFAULT_CACHE_DIR,
+            )
+    parser.add_argument('--from-file',
+            dest='from_file',
+            default='',
+            help='CSV file of address,amount rows to pay with `send` (amounts are in --units), or of master public key[,label] rows for `portfolio`.',
+            )
+    parser.add_argument('--preference',
+            dest='preference',
+            default='high',
+            choices=('high', 'medium', 'low'),
+            help='Miner fee preference for non-interactive sends.',
+            )
+    parser.add_argument('--format',
+            dest='format',
+            default='csv',
+            choices=('csv', 'jsonl'),
+            help='Output format for `dump` (defaults to csv).',
+            )
+    parser.add_argument('--out',
+            dest='out',
+            default='-',
+            help='File to write `dump` output to (defaults to - for stdout).',
+            )
+    parser.add_argument('--range',
+            dest='index_range',
+            default=(0, 20),
+            type=index_range_arg,
+            metavar='START:STOP',
+            help='Child indices to `dump` on each chain, STOP excluded (defaults to 0:20).',
+            )
+    parser.add_argument('--chain',
+            dest='chains',
+            default=[0, 1],
+            type=chain_list_arg,
+            metavar='0,1',
+            help='Chains to `dump` or `discover`: 0 (external), 1 (internal/change) or 0,1 (the default).',
+            )
+    parser.add_argument('--gap-limit',
+            dest='gap_limit',
+            default=DEFAULT_GAP_LIMIT,
+            type=int,
+            help='Unused addresses in a row that end the `discover` scan of a chain (defaults to %s).' % DEFAULT_GAP_LIMIT,
+            )
+    parser.add_argument('--interval',
+            dest='interval',
+            default=DEFAULT_WATCH_INTERVAL,
+            type=int,
+            help='Seconds between polls for `watch` (defaults to %s).' % DEFAULT_WATCH_INTERVAL,
+            )
+    parser.add_argument('--concurrency',
+            dest='concurrency',
+            default=DEFAULT_PORTFOLIO_CONCURRENCY,
+            type=int,
+            metavar='N',
+            help='Wallets whose balances `portfolio` fetches at once (defaults to %s).' % DEFAULT_PORTFOLIO_CONCURRENCY,
+            )
+    parser.add_argument('--address-pool',
+            dest='address_pool',
+            default=0,
+            type=int,
+            metavar='N',
+            help='Keep N registered and verified unused addresses per chain ready in memory, filled in the background once a chain is first used, so sends and new receiving addresses skip the round trip to BlockCypher (defaults to 0, off, and at most %s). Pooled addresses left on quit are skipped.' % MAX_ADDRESS_POOL_SIZE,
+            )
+    parser.add_argument('--api-base',
+            dest='api_base',
+            default='',
+            help='Use this BlockCypher API server instead of https://api.blockcypher.com (e.g. http://127.0.0.1:8765 for `python -m bcwallet.mock_server`).',
+            )
+    parser.add_argument('--profile',
+            dest='profile',
+            default='',
+            metavar='FILE',
+            help='Write a Chrome trace (JSON) of every BlockCypher call and crypto step to FILE on quit. Open it in chrome://tracing.',
+            )
+    parser.add_argument('--self-test',
+            dest='self_test',
+            default=False,
+            action='store_true',
+            help="Check the secp256k1 backend (see `pip install bcwallet[fast]`) against the pure-Python one and quit",
+            )
+    parser.add_argument('--version',
+            dest='version',
+            default=False,
+            action='store_true',
+            help="Show version and quit",
+            )
+    return parser
+
+
+def print_version():
+    sys.stdout.write('bcwallet %s\n\n' % BCWALLET_VERSION)
+
+
+def check_python_version():
+    if sys.version_info[0] != 2 or sys.version_info[1] != 7:
+        sys.stderr.write('Sorry, this app must be run with python 2.7 :(\n')
+        sys.stderr.write('Your version: %s\n' % sys.version)
+        if sys.version_info[0] == 3:
+            sys.stderr.write('Please uninstall bcwallet and reinstall like this:\n')
+            sys.stderr.write('    $ pip2 install bcwallet\n')
+
+
+def cli(args=None):
+    if args is None:
+        args = get_arg_parser().parse_args()
+
+    if args.version:
+        print_version()
+        sys.exit()
+
+    from .bcwallet import cli as wallet_cli
+    return wallet_cli(args=args)
+
+
+def invoke_cli():
+    check_python_version()
+
+    args = get_arg_parser().parse_args()
+
+    if args.version:
+        print_version()
+        sys.exit()
+
+    # only now load the wallet (and its crypto and HTTP libraries)
+    from .bcwallet import invoke_cli as wallet_invoke_cli
+    wallet_invoke_cli(args=args)
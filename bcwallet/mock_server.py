@@ -0,0 +1,777 @@
+# -*- coding: utf-8 -*-
+
+# Local stand-in for the parts of the BlockCypher API that bcwallet uses
+#
+# Every HD wallet registered with it gets a deterministic synthetic history
+# (of configurable size) on its external and change chains, and transactions
+# can be created, signed by bcwallet and "broadcast". Broadcast transactions
+# stay unconfirmed unless blocks are mined every --block-interval seconds.
+# Nothing here is persisted, restart the server to reset it.
+#
+#   $ python -m bcwallet.mock_server --port 8765 --addresses 1000 --latency-ms 50
+#   $ bcwallet --api-base http://127.0.0.1:8765 --wallet bpub...
+#
+# Implemented endpoints (under /v1/<coin>/<network>):
+#   GET  /                                 chain overview
+#   POST /wallets/hd                       register an HD wallet
+#   GET  /wallets/hd/<name>                wallet addresses (used/zerobalance filters)
+#   POST /wallets/hd/<name>/addresses/derive
+#   GET  /addrs/<name>                     wallet transactions (before/after/limit)
+#   GET  /addrs/<name>/balance             wallet balance
+#   GET  /addrs/<addr1;addr2;...>/balance  address balances
+#   POST /txs/new                          unsigned tx (with tosign_tx) from wallet inputs
+#   POST /txs/send                         verify signatures and "broadcast"
+
+from BaseHTTPServer import BaseHTTPRequestHandler
+from BaseHTTPServer import HTTPServer
+from SocketServer import ThreadingMixIn
+
+from bisect import bisect_left
+from bisect import bisect_right
+from datetime import datetime
+from datetime import timedelta
+from hashlib import sha256
+from urlparse import parse_qs
+from urlparse import urlparse
+
+from bitcoin import der_decode_sig
+from bitcoin import ecdsa_raw_verify
+from bitcoin import pubkey_to_address
+from bitcoin.transaction import mk_pubkey_script
+from bitcoin.transaction import mk_scripthash_script
+from bitcoin.transaction import serialize
+from bitcoin.transaction import serialize_script
+from bitcoin.transaction import signature_form
+from bitcoin.transaction import txhash
+
+from bitmerchant.wallet import Wallet
+
+from blockcypher.constants import COIN_SYMBOL_MAPPINGS
+from blockcypher.utils import double_sha256
+from blockcypher.utils import is_valid_address_for_coinsymbol
+
+from .bc_utils import COIN_SYMBOL_TO_BMERCHANT_NETWORK
+from .bc_utils import estimate_p2pkh_tx_size
+from .ec_backend import derive_child_info
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+
+
+DEFAULT_PORT = 8765
+
+# synthetic chain
+TIP_HEIGHT = 400000
+TIP_TIME = datetime(2016, 1, 1)
+BLOCK_INTERVAL = timedelta(minutes=10)
+SYNTHETIC_TXS_PER_BLOCK = 3
+
+# BlockCypher's default/max limits on /addrs/<name>
+DEFAULT_TXN_LIMIT = 50
+MAX_TXN_LIMIT = 2000
+
+# how far past the last used address /derive and the wallet addresses look
+GAP_LIMIT = 10
+
+FEE_PER_BYTE = {
+        'high': 60,
+        'medium': 40,
+        'low': 20,
+        'zero': 0,
+        }
+
+PATH_RE = re.compile(r'^/v1/(?P<code>[a-z]+)/(?P<network>[a-z0-9]+)(?P<rest>/.*)?$')
+
+
+class MockAPIError(Exception):
+
+    def __init__(self, status_code, error):
+        super(MockAPIError, self).__init__(error)
+        self.status_code = status_code
+        self.error = error
+
+
+def get_coin_symbol(code, network):
+    for coin_symbol, mapping in COIN_SYMBOL_MAPPINGS.items():
+        if (mapping['blockcypher_code'], mapping['blockcypher_network']) == (code, network):
+            return coin_symbol
+    raise MockAPIError(404, 'Unknown blockchain %s/%s' % (code, network))
+
+
+def block_time(block_height):
+    return TIP_TIME - (TIP_HEIGHT - block_height) * BLOCK_INTERVAL
+
+
+def isoformat(dt):
+    return dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def address_to_script(address, coin_symbol):
+    if address[0] in COIN_SYMBOL_MAPPINGS[coin_symbol]['multisig_prefix_list']:
+        return mk_scripthash_script(address)
+    return mk_pubkey_script(address)
+
+
+class MockWallet(object):
+    '''
+    A registered HD wallet, its derived addresses, txrefs and unspents
+    '''
+
+    def __init__(self, name, mpub, coin_symbol, subchain_indices):
+        self.name = name
+        self.mpub = mpub
+        self.coin_symbol = coin_symbol
+        self.subchain_indices = subchain_indices or [0]
+
+        wallet_obj = Wallet.deserialize(mpub, network=COIN_SYMBOL_TO_BMERCHANT_NETWORK[coin_symbol])
+        self.chain_wallets = dict([(x, wallet_obj.get_child(x, is_prime=False)) for x in self.subchain_indices])
+
+        # chain -> list of {'address', 'path', 'public'} (in index order)
+        self.chain_addresses = dict([(x, []) for x in self.subchain_indices])
+        # chain -> number of addresses with transactions
+        self.num_used = dict([(x, 0) for x in self.subchain_indices])
+        self.address_paths = {}
+
+        # confirmed txrefs (newest first) and their negated heights (for bisect)
+        self.txrefs = []
+        self.txref_neg_heights = []
+        self.unconfirmed_txrefs = []
+
+        # (tx_hash, output_n) -> {'address', 'path', 'value', 'txref'}
+        self.unspents = {}
+
+    def derive(self, chain_int, count):
+        addresses = self.chain_addresses[chain_int]
+        new_addresses = []
+        for index in range(len(addresses), len(addresses) + count):
+            child_info = derive_child_info(chain_wallet=self.chain_wallets[chain_int], index=index)
+            address_path = {
+                    'address': child_info['address'],
+                    'path': 'm/%d/%d' % (chain_int, index),
+                    'public': child_info['pubkeyhex'],
+                    }
+            addresses.append(address_path)
+            self.address_paths[address_path['address']] = address_path
+            new_addresses.append(address_path)
+        return new_addresses
+
+    def get_unused_address_paths(self, chain_int, count):
+        '''
+        Derive (and mark used) the next count addresses, like /derive
+        '''
+        start = self.num_used[chain_int]
+        missing = start + count - len(self.chain_addresses[chain_int])
+        if missing > 0:
+            self.derive(chain_int, missing)
+        self.num_used[chain_int] = start + count
+        return self.chain_addresses[chain_int][start:start + count]
+
+    def iter_address_paths(self):
+        for chain_int in self.subchain_indices:
+            for address_path in self.chain_addresses[chain_int]:
+                yield chain_int, address_path
+
+    def get_balances(self):
+        confirmed_balance, unconfirmed_balance = 0, 0
+        for unspent in self.unspents.values():
+            if unspent['txref'].get('block_height', -1) > 0:
+                confirmed_balance += unspent['value']
+            else:
+                unconfirmed_balance += unspent['value']
+        # unconfirmed spends of confirmed unspents
+        for txref in self.unconfirmed_txrefs:
+            if txref['tx_input_n'] >= 0 and txref.get('spends_confirmed'):
+                confirmed_balance += txref['value']
+                unconfirmed_balance -= txref['value']
+        total_received = sum(x['value'] for x in self.txrefs + self.unconfirmed_txrefs if x['tx_input_n'] < 0)
+        total_sent = sum(x['value'] for x in self.txrefs + self.unconfirmed_txrefs if x['tx_input_n'] >= 0)
+        return {
+                'balance': confirmed_balance,
+                'unconfirmed_balance': unconfirmed_balance,
+                'final_balance': confirmed_balance + unconfirmed_balance,
+                'total_received': total_received,
+                'total_sent': total_sent,
+                'n_tx': len(set(x['tx_hash'] for x in self.txrefs)),
+                'unconfirmed_n_tx': len(set(x['tx_hash'] for x in self.unconfirmed_txrefs)),
+                'final_n_tx': len(set(x['tx_hash'] for x in self.txrefs + self.unconfirmed_txrefs)),
+                }
+
+
+class MockBlockchain(object):
+    '''
+    All server state, guarded by one lock
+    '''
+
+    def __init__(self, num_addresses=20, txs_per_address=2, seed=0):
+        self.num_addresses = num_addresses
+        self.txs_per_address = txs_per_address
+        self.seed = seed
+        self.wallets = {}
+        # address -> MockWallet
+        self.address_wallets = {}
+        # unsigned tx hash -> (wallet, txobj, unspent keys)
+        self.pending_txs = {}
+        self.tip_height = TIP_HEIGHT
+        self.lock = threading.Lock()
+
+    def get_wallet(self, coin_symbol, wallet_name):
+        wallet = self.wallets.get((coin_symbol, wallet_name))
+        if wallet is None:
+            raise MockAPIError(404, 'Wallet %s not found' % wallet_name)
+        return wallet
+
+    def register_wallet(self, coin_symbol, data):
+        wallet_name = data.get('name')
+        mpub = data.get('extended_public_key')
+        if not wallet_name or not mpub:
+            raise MockAPIError(400, 'name and extended_public_key are required')
+        if (coin_symbol, wallet_name) in self.wallets:
+            raise MockAPIError(409, 'Error: wallet exists')
+
+        wallet = MockWallet(
+                name=wallet_name,
+                mpub=mpub,
+                coin_symbol=coin_symbol,
+                subchain_indices=data.get('subchain_indexes'),
+                )
+        self.add_synthetic_history(wallet)
+        self.wallets[(coin_symbol, wallet_name)] = wallet
+        for _, address_path in wallet.iter_address_paths():
+            self.address_wallets[address_path['address']] = wallet
+        return self.wallet_to_dict(wallet)
+
+    def add_synthetic_history(self, wallet):
+        '''
+        Deterministic (per wallet and seed) incoming transactions, num_addresses
+        on the external chain and a quarter as many on the change chain
+        '''
+        rng = random.Random('%s-%s' % (self.seed, wallet.mpub))
+        cnt = 0
+        for chain_int in wallet.subchain_indices:
+            if chain_int == 0:
+                num_used = self.num_addresses
+            else:
+                num_used = max(self.num_addresses // 4, 1) if self.num_addresses else 0
+            for address_path in wallet.get_unused_address_paths(chain_int, num_used):
+                for tx_cnt in range(self.txs_per_address):
+                    tx_hash = sha256('%s-%s-%s-%s' % (self.seed, wallet.mpub, address_path['path'], tx_cnt)).hexdigest()
+                    block_height = TIP_HEIGHT - 1 - cnt // SYNTHETIC_TXS_PER_BLOCK
+                    txref = {
+                            'address': address_path['address'],
+                            'tx_hash': tx_hash,
+                            'block_height': block_height,
+                            'tx_input_n': -1,
+                            'tx_output_n': 0,
+                            'value': rng.randint(10**4, 10**6),
+                            'spent': False,
+                            'confirmations': TIP_HEIGHT - block_height + 1,
+                            'confirmed': isoformat(block_time(block_height)),
+                            'double_spend': False,
+                            }
+                    wallet.unspents[(tx_hash, 0)] = {
+                            'address': address_path['address'],
+                            'path': address_path['path'],
+                            'value': txref['value'],
+                            'txref': txref,
+                            }
+                    wallet.txrefs.append(txref)
+                    cnt += 1
+            # lookahead past the last used address, like BlockCypher
+            wallet.derive(chain_int, GAP_LIMIT)
+        wallet.txrefs.sort(key=lambda x: -x['block_height'])
+        wallet.txref_neg_heights = [-x['block_height'] for x in wallet.txrefs]
+
+    def wallet_to_dict(self, wallet, address_paths_by_chain=None):
+        if address_paths_by_chain is None:
+            address_paths_by_chain = dict([(x, wallet.chain_addresses[x]) for x in wallet.subchain_indices])
+        return {
+                'name': wallet.name,
+                'extended_public_key': wallet.mpub,
+                'subchain_indexes': wallet.subchain_indices,
+                'hd': True,
+                'chains': [{
+                    'index': chain_int,
+                    'chain_addresses': address_paths_by_chain.get(chain_int, []),
+                    } for chain_int in wallet.subchain_indices],
+                }
+
+    def get_wallet_addresses(self, coin_symbol, wallet_name, params):
+        wallet = self.get_wallet(coin_symbol, wallet_name)
+        used = params.get('used')
+        zero_balance = params.get('zerobalance')
+
+        balances = {}
+        for unspent in wallet.unspents.values():
+            balances[unspent['address']] = balances.get(unspent['address'], 0) + unspent['value']
+
+        address_paths_by_chain = {}
+        for chain_int in wallet.subchain_indices:
+            address_paths = []
+            for index, address_path in enumerate(wallet.chain_addresses[chain_int]):
+                is_used = index < wallet.num_used[chain_int]
+                if used is not None and is_used != (used == 'true'):
+                    continue
+                has_zero_balance = not balances.get(address_path['address'])
+                if zero_balance is not None and has_zero_balance != (zero_balance == 'true'):
+                    continue
+                address_paths.append(address_path)
+            address_paths_by_chain[chain_int] = address_paths
+        return self.wallet_to_dict(wallet, address_paths_by_chain=address_paths_by_chain)
+
+    def derive_addresses(self, coin_symbol, wallet_name, params):
+        wallet = self.get_wallet(coin_symbol, wallet_name)
+        chain_int = int(params.get('subchain_index') or wallet.subchain_indices[0])
+        if chain_int not in wallet.subchain_indices:
+            raise MockAPIError(400, 'Wallet has no subchain %s' % chain_int)
+        count = int(params.get('count') or 1)
+
+        address_paths = wallet.get_unused_address_paths(chain_int, count)
+        # keep the lookahead
+        missing = wallet.num_used[chain_int] + GAP_LIMIT - len(wallet.chain_addresses[chain_int])
+        if missing > 0:
+            for address_path in wallet.derive(chain_int, missing):
+                self.address_wallets[address_path['address']] = wallet
+        for address_path in address_paths:
+            self.address_wallets[address_path['address']] = wallet
+        return {
+                'name': wallet.name,
+                'chains': [{
+                    'index': chain_int,
+                    'chain_addresses': address_paths,
+                    }],
+                }
+
+    def get_wallet_balance(self, coin_symbol, wallet_name, params):
+        wallet = self.get_wallet(coin_symbol, wallet_name)
+        balance_dict = wallet.get_balances()
+        balance_dict['address'] = wallet.name
+        if params.get('omitWalletAddresses') != 'true':
+            balance_dict['wallet'] = self.wallet_to_dict(wallet)
+        return balance_dict
+
+    def get_wallet_transactions(self, coin_symbol, wallet_name, params):
+        wallet = self.get_wallet(coin_symbol, wallet_name)
+        limit = min(int(params.get('limit') or DEFAULT_TXN_LIMIT), MAX_TXN_LIMIT)
+
+        # txrefs are sorted by descending height (ascending negated height)
+        start, stop = 0, len(wallet.txrefs)
+        if params.get('before'):
+            start = bisect_right(wallet.txref_neg_heights, -int(params['before']))
+        if params.get('after'):
+            stop = bisect_left(wallet.txref_neg_heights, -int(params['after']))
+        txrefs = [dict(x, confirmations=self.tip_height - x['block_height'] + 1)
+                for x in wallet.txrefs[start:max(start, stop)]]
+
+        response_dict = self.get_wallet_balance(coin_symbol, wallet_name, params)
+        response_dict['txrefs'] = txrefs[:limit]
+        response_dict['hasMore'] = len(txrefs) > limit
+        response_dict['unconfirmed_txrefs'] = list(reversed(wallet.unconfirmed_txrefs))
+        return response_dict
+
+    def get_address_balance(self, coin_symbol, address):
+        wallet = self.address_wallets.get(address)
+        balance_dict = {
+                'address': address,
+                'balance': 0,
+                'unconfirmed_balance': 0,
+                'final_balance': 0,
+                'total_received': 0,
+                'total_sent': 0,
+                'n_tx': 0,
+                'unconfirmed_n_tx': 0,
+                'final_n_tx': 0,
+                }
+        if wallet is None:
+            return balance_dict
+
+        for txref in wallet.txrefs + wallet.unconfirmed_txrefs:
+            if txref['address'] != address:
+                continue
+            is_confirmed = txref.get('block_height', -1) > 0
+            signed_value = -txref['value'] if txref['tx_input_n'] >= 0 else txref['value']
+            if is_confirmed:
+                balance_dict['balance'] += signed_value
+                balance_dict['n_tx'] += 1
+            else:
+                balance_dict['unconfirmed_balance'] += signed_value
+                balance_dict['unconfirmed_n_tx'] += 1
+            if signed_value > 0:
+                balance_dict['total_received'] += signed_value
+            else:
+                balance_dict['total_sent'] -= signed_value
+        balance_dict['final_balance'] = balance_dict['balance'] + balance_dict['unconfirmed_balance']
+        balance_dict['final_n_tx'] = balance_dict['n_tx'] + balance_dict['unconfirmed_n_tx']
+        return balance_dict
+
+    def create_unsigned_tx(self, coin_symbol, data, params):
+        inputs = data.get('inputs') or []
+        outputs = data.get('outputs') or []
+        if len(inputs) != 1 or 'wallet_name' not in inputs[0]:
+            raise MockAPIError(400, 'Only a single wallet input is supported by the mock server')
+        if not outputs:
+            raise MockAPIError(400, 'outputs are required')
+        wallet = self.get_wallet(coin_symbol, inputs[0]['wallet_name'])
+        fee_per_byte = FEE_PER_BYTE[data.get('preference', 'high')]
+        change_address = data.get('change_address')
+
+        sweep_funds = any(x['value'] == -1 for x in outputs)
+        total_out = sum(x['value'] for x in outputs if x['value'] != -1)
+
+        # largest unspents first
+        unspents = sorted(wallet.unspents.items(), key=lambda x: -x[1]['value'])
+        selected = []
+        total_in = 0
+        for unspent_key, unspent in unspents:
+            num_outputs = len(outputs) + (0 if sweep_funds else 1)
+            fees = estimate_p2pkh_tx_size(len(selected), num_outputs) * fee_per_byte
+            if not sweep_funds and selected and total_in >= total_out + fees:
+                break
+            selected.append((unspent_key, unspent))
+            total_in += unspent['value']
+
+        num_outputs = len(outputs) + (0 if sweep_funds else 1)
+        fees = estimate_p2pkh_tx_size(len(selected), num_outputs) * fee_per_byte
+        if sweep_funds:
+            tx_outputs = [{'addresses': outputs[0]['addresses'], 'value': total_in - fees}]
+        else:
+            tx_outputs = [{'addresses': x['addresses'], 'value': x['value']} for x in outputs]
+            change_value = total_in - total_out - fees
+            if change_value > 0 and change_address:
+                tx_outputs.append({'addresses': [change_address], 'value': change_value})
+
+        if not selected or total_in - fees < total_out or tx_outputs[0]['value'] <= 0:
+            return {'errors': [{
+                'error': 'Not enough funds after fees in %s inputs to pay for %s outputs, missing %s.' % (
+                    len(selected), len(outputs), total_out + fees - total_in),
+                }]}
+
+        txobj = {
+                'version': 1,
+                'locktime': 0,
+                'ins': [{
+                    'outpoint': {'hash': unspent_key[0], 'index': unspent_key[1]},
+                    'script': '',
+                    'sequence': 4294967295,
+                    } for unspent_key, _ in selected],
+                'outs': [{
+                    'script': address_to_script(x['addresses'][0], coin_symbol),
+                    'value': x['value'],
+                    } for x in tx_outputs],
+                }
+        unsigned_tx_hex = serialize(txobj)
+        tosign_tx = []
+        for cnt, (_, unspent) in enumerate(selected):
+            tosign_tx.append(serialize(signature_form(
+                txobj, cnt, mk_pubkey_script(unspent['address']))) + '01000000')
+
+        tx_hash = txhash(unsigned_tx_hex)
+        self.pending_txs[tx_hash] = (wallet, txobj, [x[0] for x in selected])
+
+        unsigned_tx = {
+                'tx': {
+                    'hash': tx_hash,
+                    'block_height': -1,
+                    'total': sum(x['value'] for x in tx_outputs),
+                    'fees': fees,
+                    'size': estimate_p2pkh_tx_size(len(selected), len(tx_outputs)),
+                    'preference': data.get('preference', 'high'),
+                    'inputs': [{
+                        'prev_hash': unspent_key[0],
+                        'output_index': unspent_key[1],
+                        'output_value': unspent['value'],
+                        'addresses': [unspent['address']],
+                        'hd_path': unspent['path'],
+                        'wallet_name': wallet.name,
+                        'script_type': 'pay-to-pubkey-hash',
+                        'sequence': 4294967295,
+                        } for unspent_key, unspent in selected],
+                    'outputs': [dict(x, script_type='pay-to-pubkey-hash') for x in tx_outputs],
+                    },
+                'tosign': [double_sha256(x) for x in tosign_tx],
+                }
+        if params.get('includeToSignTx') == 'true':
+            unsigned_tx['tosign_tx'] = tosign_tx
+        return unsigned_tx
+
+    def broadcast_tx(self, coin_symbol, data):
+        tx = data.get('tx') or {}
+        pending = self.pending_txs.pop(tx.get('hash'), None)
+        if pending is None:
+            raise MockAPIError(400, 'Unknown transaction %s, create it with /txs/new first' % tx.get('hash'))
+        wallet, txobj, unspent_keys = pending
+
+        signatures = data.get('signatures') or []
+        pubkeys = data.get('pubkeys') or []
+        tosign = data.get('tosign') or []
+        if not len(signatures) == len(pubkeys) == len(tosign) == len(unspent_keys):
+            self.pending_txs[tx['hash']] = pending
+            raise MockAPIError(400, 'Expected %s signatures and pubkeys' % len(unspent_keys))
+
+        vbyte = COIN_SYMBOL_MAPPINGS[coin_symbol]['vbyte_pubkey']
+        for cnt, unspent_key in enumerate(unspent_keys):
+            unspent = wallet.unspents.get(unspent_key)
+            if unspent is None:
+                raise MockAPIError(400, 'Input %s was already spent' % cnt)
+            if pubkey_to_address(pubkeys[cnt], vbyte) != unspent['address']:
+                self.pending_txs[tx['hash']] = pending
+                raise MockAPIError(400, 'Public key %s does not match input address %s' % (pubkeys[cnt], unspent['address']))
+            if not ecdsa_raw_verify(tosign[cnt], der_decode_sig(signatures[cnt]), pubkeys[cnt]):
+                self.pending_txs[tx['hash']] = pending
+                raise MockAPIError(400, 'Invalid signature for input %s' % cnt)
+
+        for cnt, signature in enumerate(signatures):
+            txobj['ins'][cnt]['script'] = serialize_script([signature + '01', pubkeys[cnt]])
+        signed_tx_hash = txhash(serialize(txobj))
+        received = isoformat(datetime.utcnow())
+
+        for cnt, unspent_key in enumerate(unspent_keys):
+            unspent = wallet.unspents.pop(unspent_key)
+            unspent['txref']['spent'] = True
+            wallet.unconfirmed_txrefs.append({
+                'address': unspent['address'],
+                'tx_hash': signed_tx_hash,
+                'block_height': -1,
+                'tx_input_n': cnt,
+                'tx_output_n': -1,
+                'value': unspent['value'],
+                'spent': False,
+                'spends_confirmed': unspent['txref'].get('block_height', -1) > 0,
+                'confirmations': 0,
+                'received': received,
+                'double_spend': False,
+                })
+
+        for cnt, output in enumerate(tx['outputs']):
+            address = output['addresses'][0]
+            receiving_wallet = self.address_wallets.get(address)
+            if receiving_wallet is None:
+                continue
+            txref = {
+                    'address': address,
+                    'tx_hash': signed_tx_hash,
+                    'block_height': -1,
+                    'tx_input_n': -1,
+                    'tx_output_n': cnt,
+                    'value': output['value'],
+                    'spent': False,
+                    'confirmations': 0,
+                    'received': received,
+                    'double_spend': False,
+                    }
+            receiving_wallet.unconfirmed_txrefs.append(txref)
+            receiving_wallet.unspents[(signed_tx_hash, cnt)] = {
+                    'address': address,
+                    'path': receiving_wallet.address_paths[address]['path'],
+                    'value': output['value'],
+                    'txref': txref,
+                    }
+
+        broadcasted_tx = dict(tx, hash=signed_tx_hash, received=received, confirmations=0)
+        return {'tx': broadcasted_tx}
+
+    def mine_block(self):
+        '''
+        Confirm every unconfirmed transaction in a new block
+        '''
+        self.tip_height += 1
+        confirmed = isoformat(datetime.utcnow())
+        for wallet in self.wallets.values():
+            if not wallet.unconfirmed_txrefs:
+                continue
+            for txref in wallet.unconfirmed_txrefs:
+                # also updates the txref of the unspent it created
+                txref['block_height'] = self.tip_height
+                txref['confirmed'] = confirmed
+            wallet.txrefs = list(reversed(wallet.unconfirmed_txrefs)) + wallet.txrefs
+            wallet.txref_neg_heights = [-x['block_height'] for x in wallet.txrefs]
+            wallet.unconfirmed_txrefs = []
+
+    def get_overview(self, coin_symbol):
+        return {
+                'name': '%s.%s' % (
+                    COIN_SYMBOL_MAPPINGS[coin_symbol]['currency_abbrev'],
+                    COIN_SYMBOL_MAPPINGS[coin_symbol]['blockcypher_network'],
+                    ),
+                'height': self.tip_height,
+                'hash': sha256(str(self.tip_height)).hexdigest(),
+                'time': isoformat(block_time(self.tip_height)),
+                'unconfirmed_count': 0,
+                }
+
+    def handle(self, method, path, params, data):
+        '''
+        Route a request, returns the JSON-able response (or raises MockAPIError)
+        '''
+        match = PATH_RE.match(path)
+        if not match:
+            raise MockAPIError(404, 'Not found')
+        coin_symbol = get_coin_symbol(match.group('code'), match.group('network'))
+        parts = [x for x in (match.group('rest') or '').split('/') if x]
+
+        with self.lock:
+            if method == 'GET' and not parts:
+                return self.get_overview(coin_symbol)
+            if method == 'POST' and parts == ['wallets', 'hd']:
+                return self.register_wallet(coin_symbol, data)
+            if method == 'GET' and len(parts) == 3 and parts[:2] == ['wallets', 'hd']:
+                return self.get_wallet_addresses(coin_symbol, parts[2], params)
+            if method == 'POST' and len(parts) == 5 and parts[:2] == ['wallets', 'hd'] and parts[3:] == ['addresses', 'derive']:
+                return self.derive_addresses(coin_symbol, parts[2], params)
+            if method == 'GET' and len(parts) == 3 and parts[0] == 'addrs' and parts[2] == 'balance':
+                is_single_address = is_valid_address_for_coinsymbol(parts[1], coin_symbol)
+                if (coin_symbol, parts[1]) in self.wallets or (';' not in parts[1] and not is_single_address):
+                    # unknown wallet names are a 404, as with BlockCypher
+                    return self.get_wallet_balance(coin_symbol, parts[1], params)
+                addresses = parts[1].split(';')
+                balances = [self.get_address_balance(coin_symbol, x) for x in addresses]
+                if len(balances) == 1:
+                    return balances[0]
+                return balances
+            if method == 'GET' and len(parts) == 2 and parts[0] == 'addrs':
+                return self.get_wallet_transactions(coin_symbol, parts[1], params)
+            if method == 'POST' and parts == ['txs', 'new']:
+                return self.create_unsigned_tx(coin_symbol, data, params)
+            if method == 'POST' and parts == ['txs', 'send']:
+                return self.broadcast_tx(coin_symbol, data)
+
+        raise MockAPIError(404, 'Not found')
+
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    # keep-alive, like the real API
+    protocol_version = 'HTTP/1.1'
+
+    def _respond(self, method):
+        url = urlparse(self.path)
+        params = dict([(k, v[-1]) for k, v in parse_qs(url.query).items()])
+
+        data = None
+        content_length = int(self.headers.getheader('Content-Length') or 0)
+        if content_length:
+            data = json.loads(self.rfile.read(content_length))
+
+        if self.server.latency_seconds:
+            time.sleep(self.server.latency_seconds)
+
+        try:
+            status_code = 201 if method == 'POST' else 200
+            response = self.server.blockchain.handle(method, url.path.rstrip('/'), params, data or {})
+        except MockAPIError as e:
+            status_code = e.status_code
+            response = {'error': e.error}
+
+        body = json.dumps(response)
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._respond('GET')
+
+    def do_POST(self):
+        self._respond('POST')
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class MockServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, server_address, blockchain, latency_seconds=0, verbose=False):
+        HTTPServer.__init__(self, server_address, MockRequestHandler)
+        self.blockchain = blockchain
+        self.latency_seconds = latency_seconds
+        self.verbose = verbose
+
+    @property
+    def api_base(self):
+        return 'http://%s:%s' % self.server_address[:2]
+
+
+def start_mining(blockchain, block_interval):
+    '''
+    Mine a block every block_interval seconds in a background thread
+    '''
+    def mine_forever():
+        while True:
+            time.sleep(block_interval)
+            with blockchain.lock:
+                blockchain.mine_block()
+
+    mining_thread = threading.Thread(target=mine_forever)
+    mining_thread.daemon = True
+    mining_thread.start()
+
+
+def start_mock_server(port=0, num_addresses=20, txs_per_address=2, latency_ms=0, seed=0, block_interval=0):
+    '''
+    Run a MockServer in a background thread (port=0 picks a free port)
+
+    Returns the server, use server.api_base for --api-base and
+    server.shutdown() to stop it.
+    '''
+    server = MockServer(
+            ('127.0.0.1', port),
+            blockchain=MockBlockchain(
+                num_addresses=num_addresses,
+                txs_per_address=txs_per_address,
+                seed=seed,
+                ),
+            latency_seconds=latency_ms / 1000.0,
+            )
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+    if block_interval:
+        start_mining(server.blockchain, block_interval)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(
+            description='Local stand-in for the BlockCypher API, point bcwallet at it with --api-base.')
+    parser.add_argument('-p', '--port', dest='port', type=int, default=DEFAULT_PORT,
+            help='Port to listen on (defaults to %s).' % DEFAULT_PORT)
+    parser.add_argument('-a', '--addresses', dest='num_addresses', type=int, default=20,
+            help='Used external addresses per registered wallet (a quarter as many change addresses).')
+    parser.add_argument('-t', '--txs-per-address', dest='txs_per_address', type=int, default=2,
+            help='Synthetic incoming transactions per used address.')
+    parser.add_argument('-l', '--latency-ms', dest='latency_ms', type=int, default=0,
+            help='Delay added to every response, in milliseconds.')
+    parser.add_argument('-s', '--seed', dest='seed', type=int, default=0,
+            help='Seed for the synthetic wallet histories.')
+    parser.add_argument('-b', '--block-interval', dest='block_interval', type=float, default=0,
+            help='Mine a block (confirming every broadcast transaction) every this many seconds (defaults to 0, never).')
+    parser.add_argument('-v', '--verbose', dest='verbose', default=False, action='store_true',
+            help='Log every request.')
+    args = parser.parse_args()
+
+    server = MockServer(
+            ('127.0.0.1', args.port),
+            blockchain=MockBlockchain(
+                num_addresses=args.num_addresses,
+                txs_per_address=args.txs_per_address,
+                seed=args.seed,
+                ),
+            latency_seconds=args.latency_ms / 1000.0,
+            verbose=args.verbose,
+            )
+    if args.block_interval:
+        start_mining(server.blockchain, args.block_interval)
+    print('Mock BlockCypher API listening on %s (use bcwallet --api-base %s)' % (server.api_base, server.api_base))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
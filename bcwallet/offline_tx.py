@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+# File format for moving transactions between an online (watch-only) and an
+# offline (signing) bcwallet
+#
+# One JSON object per line: a header line followed by one record per
+# transaction, so files of any size can be written and read as a stream.
+# Files ending in .gz are gzipped.
+#
+# Unsigned file (written online, signed offline):
+#   {"format": "bcwallet-offline-tx", "version": 2, "kind": "unsigned", "coin_symbol": "btc", "mpub": "xpub..."}
+#   {"tx": {...}, "tosign": [...], "tosign_tx": [...], "outputs": [{"address": "1def...", "value": 10000}],
+#    "change_address": "1ghi...", "change_path": "m/1/7", "sweep_funds": false}
+#
+# The offline instance re-derives change_path from its own key before signing,
+# so an online host can't redirect the change to an address it controls.
+# Each input is signed with the key at the hd_path the tx gives for it.
+#
+# Both sides must run the same version: version 1 files had no change_path.
+#
+# Signed file (written offline, broadcast online):
+#   {"format": "bcwallet-offline-tx", "version": 2, "kind": "signed", "coin_symbol": "btc", "mpub": "xpub..."}
+#   {"tx": {...}, "tosign": [...], "signatures": [...], "pubkeys": [...]}
+
+from .cl_utils import DateTimeEncoder
+
+import gzip
+import json
+
+
+OFFLINE_TX_FORMAT = 'bcwallet-offline-tx'
+OFFLINE_TX_VERSION = 2
+
+UNSIGNED_KIND = 'unsigned'
+SIGNED_KIND = 'signed'
+
+UNSIGNED_RECORD_FIELDS = ('tx', 'tosign', 'tosign_tx', 'outputs', 'change_address', 'change_path', 'sweep_funds')
+SIGNED_RECORD_FIELDS = ('tx', 'tosign', 'signatures', 'pubkeys')
+
+
+class OfflineTxFormatError(Exception):
+    pass
+
+
+def _open(filename, mode):
+    if filename.endswith('.gz'):
+        return gzip.open(filename, mode)
+    return open(filename, mode)
+
+
+def _dump_line(obj):
+    return json.dumps(obj, cls=DateTimeEncoder, separators=(',', ':'), sort_keys=True) + '\n'
+
+
+def make_unsigned_record(unsigned_tx, outputs, change_address, change_path, sweep_funds=False):
+    '''
+    Everything the offline instance needs to verify and sign unsigned_tx
+    (as returned by create_unsigned_tx with include_tosigntx=True)
+    '''
+    return {
+            'tx': unsigned_tx['tx'],
+            'tosign': unsigned_tx['tosign'],
+            'tosign_tx': unsigned_tx['tosign_tx'],
+            'outputs': outputs,
+            'change_address': change_address,
+            'change_path': change_path,
+            'sweep_funds': sweep_funds,
+            }
+
+
+def make_signed_record(unsigned_record, signatures, pubkeys):
+    return {
+            'tx': unsigned_record['tx'],
+            'tosign': unsigned_record['tosign'],
+            'signatures': signatures,
+            'pubkeys': pubkeys,
+            }
+
+
+def get_change_satoshis(record):
+    '''
+    Total value of the outputs of the record's tx paying its change address
+    '''
+    if not record['change_address']:
+        return 0
+    return sum(x['value'] for x in record['tx']['outputs'] if x['addresses'] == [record['change_address']])
+
+
+def record_to_unsigned_tx(record):
+    '''
+    Rebuild the create_unsigned_tx response a record was made from
+    '''
+    unsigned_tx = {
+            'tx': record['tx'],
+            'tosign': record['tosign'],
+            }
+    if 'tosign_tx' in record:
+        unsigned_tx['tosign_tx'] = record['tosign_tx']
+    return unsigned_tx
+
+
+def write_offline_txs(filename, kind, coin_symbol, mpub, records):
+    '''
+    Write a header and then each record (records may be a generator)
+
+    Returns the number of records written.
+    '''
+    assert kind in (UNSIGNED_KIND, SIGNED_KIND), kind
+    header = {
+            'format': OFFLINE_TX_FORMAT,
+            'version': OFFLINE_TX_VERSION,
+            'kind': kind,
+            'coin_symbol': coin_symbol,
+            'mpub': mpub,
+            }
+    cnt = 0
+    with _open(filename, 'wb') as f:
+        f.write(_dump_line(header))
+        for record in records:
+            f.write(_dump_line(record))
+            cnt += 1
+    return cnt
+
+
+def read_offline_tx_header(filename, kind):
+    '''
+    Read and validate the header of filename, which must be of kind
+    '''
+    with _open(filename, 'rb') as f:
+        first_line = f.readline()
+    try:
+        header = json.loads(first_line)
+    except ValueError:
+        raise OfflineTxFormatError('%s is not a bcwallet offline transaction file' % filename)
+
+    if type(header) is not dict or header.get('format') != OFFLINE_TX_FORMAT:
+        raise OfflineTxFormatError('%s is not a bcwallet offline transaction file' % filename)
+    if header.get('version') != OFFLINE_TX_VERSION:
+        raise OfflineTxFormatError('%s is version %s but this bcwallet only reads version %s, please run the same bcwallet version on both machines' % (
+            filename, header.get('version'), OFFLINE_TX_VERSION))
+    if header.get('kind') != kind:
+        raise OfflineTxFormatError('%s contains %s transactions, expected %s transactions' % (
+            filename, header.get('kind'), kind))
+    return header
+
+
+def iter_offline_tx_records(filename, kind):
+    '''
+    Yield the records of filename one at a time (after validating its header)
+    '''
+    read_offline_tx_header(filename=filename, kind=kind)
+    if kind == UNSIGNED_KIND:
+        required_fields = UNSIGNED_RECORD_FIELDS
+    else:
+        required_fields = SIGNED_RECORD_FIELDS
+
+    with _open(filename, 'rb') as f:
+        f.readline()  # header
+        for line_num, line in enumerate(f, 2):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise OfflineTxFormatError('Line %s: invalid JSON' % line_num)
+            missing_fields = [x for x in required_fields if x not in record]
+            if missing_fields:
+                raise OfflineTxFormatError('Line %s: missing %s' % (line_num, ', '.join(missing_fields)))
+            yield record
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+# Balances of many HD wallets at once, for `bcwallet portfolio`
+#
+# Master keys (of any supported coin, mixed freely) are read from a file and
+# their balances are fetched concurrently, a bounded number at a time, over
+# the shared keep-alive session. Balances are only ever added up per coin.
+
+from bitmerchant.wallet import Wallet
+
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+from .bc_utils import guess_network_from_mkey
+from .bc_utils import WalletContext
+
+from .launcher import DEFAULT_PORTFOLIO_CONCURRENCY
+
+import csv
+
+
+def read_portfolio_file(filename):
+    '''
+    Read (master key, optional label) rows from a CSV file for `portfolio`
+
+    Blank lines, lines starting with # and a header row are skipped, as are
+    repeated keys. Only the public half of a private key is kept.
+
+    Returns a list of (label, wallet_ctx) tuples (label is '' if not given).
+
+    Raises ValueError (with the offending line number) on any invalid row.
+    '''
+    entries = []
+    seen_mpubs = set()
+    with open(filename, 'rb') as f:
+        for line_num, row in enumerate(csv.reader(f), 1):
+            row = [x.strip() for x in row]
+            if not row or not any(row) or row[0].startswith('#'):
+                continue
+            if len(row) > 2:
+                raise ValueError('Line %s: expected 1 or 2 columns (master key, label), got %s' % (line_num, len(row)))
+            mkey = row[0]
+            label = row[1] if len(row) == 2 else ''
+
+            invalid_msg = 'Line %s: invalid master key %s' % (line_num, mkey)
+
+            network = guess_network_from_mkey(mkey)
+            if not network:
+                if not entries and line_num == 1:
+                    # header row
+                    continue
+                raise ValueError(invalid_msg)
+            try:
+                wallet_obj = Wallet.deserialize(mkey, network=network)
+            except (IndexError, ValueError):
+                raise ValueError(invalid_msg)
+
+            wallet_ctx = WalletContext(wallet_obj=wallet_obj.public_copy())
+            if wallet_ctx.mpub in seen_mpubs:
+                continue
+            seen_mpubs.add(wallet_ctx.mpub)
+            entries.append((label, wallet_ctx))
+    return entries
+
+
+def fetch_portfolio(wallet_ctxs, fetch_balance, concurrency=DEFAULT_PORTFOLIO_CONCURRENCY):
+    '''
+    fetch_balance(wallet_ctx) for every wallet, concurrency at a time
+
+    Returns a list of (wallet_details, error) tuples in the order of
+    wallet_ctxs. A fetch that raised has wallet_details None and the
+    exception as error, so one bad wallet doesn't sink the others.
+    '''
+    assert concurrency > 0, concurrency
+    if not wallet_ctxs:
+        return []
+
+    def fetch(wallet_ctx):
+        try:
+            return fetch_balance(wallet_ctx), None
+        except Exception as e:
+            return None, e
+
+    pool = ThreadPool(processes=min(concurrency, len(wallet_ctxs)))
+    try:
+        pending = pool.map_async(fetch, wallet_ctxs, chunksize=1)
+        # wait in short steps, a plain get() can't be interrupted with ctrl-c
+        while not pending.ready():
+            pending.wait(1)
+        return pending.get()
+    finally:
+        pool.terminate()
+
+
+def get_portfolio_totals(wallet_ctxs, results):
+    '''
+    Add up the fetch_portfolio results of each coin
+
+    Returns an OrderedDict (coins in order of first appearance) of
+    coin_symbol -> {'num_wallets', 'num_failed', 'final_balance',
+    'unconfirmed_balance', 'final_n_tx'}.
+    '''
+    totals = OrderedDict()
+    for wallet_ctx, (wallet_details, error) in zip(wallet_ctxs, results):
+        coin_totals = totals.setdefault(wallet_ctx.coin_symbol, {
+            'num_wallets': 0,
+            'num_failed': 0,
+            'final_balance': 0,
+            'unconfirmed_balance': 0,
+            'final_n_tx': 0,
+            })
+        coin_totals['num_wallets'] += 1
+        if error:
+            coin_totals['num_failed'] += 1
+            continue
+        for key in ('final_balance', 'unconfirmed_balance', 'final_n_tx'):
+            coin_totals[key] += wallet_details.get(key) or 0
+    return totals
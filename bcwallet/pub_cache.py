@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+
+# Opt-in on-disk cache of PUBLIC wallet data (for watch-only sessions)
+#
+# Only data that can be derived from the master public key is ever written
+# here (confirmed txrefs and address paths).
+#
+# Blobs are obfuscated, not strongly encrypted: a stdlib-only SHA256 keystream
+# (no vetted cipher is available without adding a dependency) keyed by the
+# master public key and pubcache.secret, which sits next to the database. So
+# anyone who can read the cache directory and knows the master public key can
+# read the cache; it only keeps the data from casual view.
+#
+# What is checked is integrity: each blob is HMAC'd together with the row it
+# was written to (wallet, table, path or block height), so a corrupted,
+# edited or swapped blob fails to load unless whoever changed it could also
+# read pubcache.secret.
+
+from binascii import hexlify
+from binascii import unhexlify
+from collections import OrderedDict
+from hashlib import sha256
+from struct import pack
+
+from dateutil import parser
+
+from .cl_utils import DateTimeEncoder
+from .launcher import DEFAULT_CACHE_DIR
+
+import hmac
+import json
+import os
+import sqlite3
+
+
+CACHE_DB_FILENAME = 'pubcache.sqlite3'
+CACHE_SECRET_FILENAME = 'pubcache.secret'
+
+# bumped whenever cached blobs can no longer be read (older caches are dropped)
+CACHE_SCHEMA_VERSION = 3
+
+# txrefs with fewer confirmations than this are always refetched
+CACHE_MIN_CONFIRMATIONS = 10
+
+NONCE_LENGTH = 16
+TAG_LENGTH = 16
+
+DROP_SCHEMA = '''
+DROP TABLE IF EXISTS wallets;
+DROP TABLE IF EXISTS txref_blocks;
+DROP TABLE IF EXISTS address_paths;
+'''
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS wallets (
+    wallet_name TEXT PRIMARY KEY,
+    cached_bh INTEGER
+);
+CREATE TABLE IF NOT EXISTS txref_blocks (
+    wallet_name TEXT NOT NULL,
+    block_height INTEGER NOT NULL,
+    blob BLOB NOT NULL,
+    PRIMARY KEY (wallet_name, block_height)
+);
+CREATE TABLE IF NOT EXISTS address_paths (
+    wallet_name TEXT NOT NULL,
+    path TEXT NOT NULL,
+    blob BLOB NOT NULL,
+    PRIMARY KEY (wallet_name, path)
+);
+'''
+
+
+class CacheIntegrityError(Exception):
+    pass
+
+
+def get_local_secret(cache_dir):
+    '''
+    Random per-machine secret, created on first use (readable only by the user)
+    '''
+    secret_path = os.path.join(cache_dir, CACHE_SECRET_FILENAME)
+    if not os.path.exists(secret_path):
+        fd = os.open(secret_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(os.urandom(32))
+    with open(secret_path, 'rb') as f:
+        return f.read()
+
+
+def derive_cache_keys(local_secret, mpub):
+    master = hmac.new(local_secret, mpub.encode('utf-8'), sha256).digest()
+    enc_key = hmac.new(master, b'bcwallet-pubcache-enc', sha256).digest()
+    mac_key = hmac.new(master, b'bcwallet-pubcache-mac', sha256).digest()
+    return enc_key, mac_key
+
+
+def _keystream_xor(enc_key, nonce, data):
+    # sha256(enc_key + nonce + counter) blocks XORed with data (obfuscation,
+    # see above). The hash of the fixed prefix is copied for each block.
+    if not data:
+        return b''
+    prefix_hash = sha256(enc_key + nonce)
+    blocks = []
+    for counter in range(0, (len(data) + 31) // 32):
+        block_hash = prefix_hash.copy()
+        block_hash.update(pack('>I', counter))
+        blocks.append(block_hash.digest())
+    keystream = b''.join(blocks)[:len(data)]
+    xored = int(hexlify(data), 16) ^ int(hexlify(keystream), 16)
+    return unhexlify('%0*x' % (len(data) * 2, xored))
+
+
+def make_associated_data(wallet_name, table, key):
+    '''
+    The row a blob belongs to, authenticated (but not obfuscated) with it
+    '''
+    return json.dumps([wallet_name, table, key], separators=(',', ':')).encode('utf-8')
+
+
+def _get_tag(mac_key, associated_data, nonce, ciphertext):
+    # length prefixed so associated data and ciphertext can't be shifted into each other
+    mac_input = b'%d:' % len(associated_data) + associated_data + nonce + ciphertext
+    return hmac.new(mac_key, mac_input, sha256).digest()[:TAG_LENGTH]
+
+
+def encrypt_blob(enc_key, mac_key, plaintext, associated_data):
+    nonce = os.urandom(NONCE_LENGTH)
+    ciphertext = _keystream_xor(enc_key, nonce, plaintext)
+    tag = _get_tag(mac_key, associated_data, nonce, ciphertext)
+    return nonce + ciphertext + tag
+
+
+def decrypt_blob(enc_key, mac_key, blob, associated_data):
+    blob = bytes(blob)
+    nonce, ciphertext, tag = blob[:NONCE_LENGTH], blob[NONCE_LENGTH:-TAG_LENGTH], blob[-TAG_LENGTH:]
+    expected_tag = _get_tag(mac_key, associated_data, nonce, ciphertext)
+    if not hmac.compare_digest(tag, expected_tag):
+        raise CacheIntegrityError('Cache entry failed authentication')
+    return _keystream_xor(enc_key, nonce, ciphertext)
+
+
+def is_cacheable_txref(txref):
+    '''
+    Confirmed txrefs deep enough in the chain are immutable and safe to cache
+    '''
+    return txref.get('block_height', -1) > 0 and txref.get('confirmations', 0) >= CACHE_MIN_CONFIRMATIONS
+
+
+class PublicDataCache(object):
+    '''
+    Obfuscated, integrity-checked SQLite cache of one wallet's public data,
+    keyed by wallet name
+    '''
+
+    def __init__(self, mpub, wallet_name, cache_dir=DEFAULT_CACHE_DIR):
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir, 0o700)
+        self.wallet_name = wallet_name
+        self.enc_key, self.mac_key = derive_cache_keys(
+                local_secret=get_local_secret(cache_dir),
+                mpub=mpub,
+                )
+        self.conn = sqlite3.connect(os.path.join(cache_dir, CACHE_DB_FILENAME))
+        schema_version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        if schema_version < CACHE_SCHEMA_VERSION:
+            # it's only a cache, so start over rather than migrate
+            self.conn.executescript(DROP_SCHEMA)
+            self.conn.execute('PRAGMA user_version = %d' % CACHE_SCHEMA_VERSION)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def _encrypt_json(self, obj, table, key):
+        plaintext = json.dumps(obj, cls=DateTimeEncoder, separators=(',', ':'))
+        associated_data = make_associated_data(self.wallet_name, table, key)
+        return sqlite3.Binary(encrypt_blob(self.enc_key, self.mac_key, plaintext, associated_data))
+
+    def _decrypt_json(self, blob, table, key):
+        associated_data = make_associated_data(self.wallet_name, table, key)
+        return json.loads(decrypt_blob(self.enc_key, self.mac_key, blob, associated_data))
+
+    def get_cached_block_height(self):
+        '''
+        Every cacheable txref at or below this height is stored (None if empty)
+        '''
+        row = self.conn.execute(
+                'SELECT cached_bh FROM wallets WHERE wallet_name = ?',
+                (self.wallet_name, )).fetchone()
+        return row[0] if row else None
+
+    def set_cached_block_height(self, block_height):
+        with self.conn:
+            self.conn.execute(
+                    'INSERT OR REPLACE INTO wallets (wallet_name, cached_bh) VALUES (?, ?)',
+                    (self.wallet_name, block_height))
+
+    def store_txrefs(self, txrefs):
+        '''
+        Store cacheable txrefs grouped by block and return the highest block stored
+        '''
+        txrefs_by_block = OrderedDict()
+        for txref in txrefs:
+            if is_cacheable_txref(txref):
+                txrefs_by_block.setdefault(txref['block_height'], []).append(txref)
+
+        with self.conn:
+            for block_height, block_txrefs in txrefs_by_block.items():
+                self.conn.execute(
+                        'INSERT OR REPLACE INTO txref_blocks (wallet_name, block_height, blob) VALUES (?, ?, ?)',
+                        (self.wallet_name, block_height, self._encrypt_json(block_txrefs, 'txref_blocks', block_height)))
+
+        if txrefs_by_block:
+            return max(txrefs_by_block.keys())
+        return None
+
+    def iter_txref_pages(self, page_size, max_bh=None):
+        '''
+        Yield lists of cached txrefs (newest first), about page_size at a time
+        '''
+        query = 'SELECT block_height, blob FROM txref_blocks WHERE wallet_name = ?'
+        params = [self.wallet_name]
+        if max_bh is not None:
+            query += ' AND block_height <= ?'
+            params.append(max_bh)
+        query += ' ORDER BY block_height DESC'
+
+        page = []
+        cursor = self.conn.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(page_size)
+            if not rows:
+                break
+            for block_height, blob in rows:
+                for txref in self._decrypt_json(blob, 'txref_blocks', block_height):
+                    txref['confirmed'] = parser.parse(txref['confirmed'])
+                    page.append(txref)
+            if len(page) >= page_size:
+                yield page
+                page = []
+        if page:
+            yield page
+
+    def store_address_paths(self, address_paths):
+        '''
+        Store public-only address path info: {'path', 'address', 'pubkeyhex'}
+        '''
+        with self.conn:
+            for address_path in address_paths:
+                to_store = {
+                        'address': address_path['address'],
+                        'pubkeyhex': address_path['pubkeyhex'],
+                        }
+                self.conn.execute(
+                        'INSERT OR REPLACE INTO address_paths (wallet_name, path, blob) VALUES (?, ?, ?)',
+                        (self.wallet_name, address_path['path'], self._encrypt_json(to_store, 'address_paths', address_path['path'])))
+
+    def load_address_paths(self):
+        address_paths = []
+        rows = self.conn.execute(
+                'SELECT path, blob FROM address_paths WHERE wallet_name = ?',
+                (self.wallet_name, ))
+        for path, blob in rows:
+            address_path = self._decrypt_json(blob, 'address_paths', path)
+            address_path['path'] = path
+            address_paths.append(address_path)
+        return address_paths
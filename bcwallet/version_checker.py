@@ -1,4 +1,5 @@
-import requests
+from .http_session import session_get
+
 import re
 
 
@@ -7,7 +8,7 @@ VERSION_URL = 'https://raw.githubusercontent.com/blockcypher/bcwallet/master/set
 
 
 def get_latest_bcwallet_version():
-    r = requests.get(VERSION_URL)
+    r = session_get(VERSION_URL)
     assert r.status_code == 200, 'Could Not Connect to GitHub (status code %s)' % r.status_code
     matches = re.findall("version='(.*?)\'", r.content)
     assert matches, 'bcwallet version not found on github'
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+# Incremental view of a wallet's recent transactions, for `bcwallet watch`
+#
+# Each poll only asks BlockCypher for unconfirmed transactions and the ones
+# above a block height (after_bh) that's just low enough to still see the
+# confirmations of every transaction being followed, instead of the whole
+# history. update() compares a poll with the previous one and returns only
+# what changed.
+
+from blockcypher.utils import flatten_txns_by_hash
+
+
+# transactions are followed until they have this many confirmations
+WATCH_CONFIRMATIONS = 6
+
+PENDING_EVENT = 'pending'
+NEW_EVENT = 'new'
+CONFIRMED_EVENT = 'confirmed'
+CONFIRMATION_EVENT = 'confirmation'
+DOUBLE_SPEND_EVENT = 'double_spend'
+DROPPED_EVENT = 'dropped'
+
+
+class WalletWatcher(object):
+    '''
+    Transactions of one wallet that aren't settled yet, updated poll by poll
+    '''
+
+    def __init__(self, tip_height, confirmations=WATCH_CONFIRMATIONS):
+        assert confirmations > 0, confirmations
+        self.tip_height = tip_height
+        self.confirmations = confirmations
+
+        # tx_hash -> tx object (see flatten_txns_by_hash) of followed transactions
+        self.followed = {}
+
+        # every tx_hash reported so far (settled ones can still be in a poll)
+        self.seen = set()
+
+        self.is_first_poll = True
+
+    def get_after_bh(self):
+        '''
+        Block height to poll above (new blocks are all above the tip)
+        '''
+        heights = [x['block_height'] for x in self.followed.values() if x['block_height'] > 0]
+        return min(heights + [self.tip_height + 1]) - 1
+
+    def update(self, txrefs):
+        '''
+        Take every txref of a poll (unconfirmed, and confirmed above
+        get_after_bh()) and return what changed as a list of (event,
+        tx_object) tuples
+
+        The first poll reports unsettled transactions as PENDING_EVENT.
+        After that, an event is one of NEW_EVENT, CONFIRMED_EVENT (first
+        confirmation), CONFIRMATION_EVENT, DOUBLE_SPEND_EVENT or DROPPED_EVENT
+        (no longer returned, e.g. double spent).
+        '''
+        tx_objects = flatten_txns_by_hash(txrefs, nesting=False)
+
+        for tx_object in tx_objects:
+            if tx_object['confirmations'] and tx_object['block_height'] > 0:
+                tx_tip_height = tx_object['block_height'] + tx_object['confirmations'] - 1
+                self.tip_height = max(self.tip_height, tx_tip_height)
+
+        events = []
+        polled_hashes = set()
+        for tx_object in tx_objects:
+            tx_hash = tx_object['tx_hash']
+            polled_hashes.add(tx_hash)
+            is_settled = tx_object['confirmations'] >= self.confirmations
+
+            previous = self.followed.get(tx_hash)
+            if previous is None:
+                if tx_hash in self.seen:
+                    continue
+                self.seen.add(tx_hash)
+                if self.is_first_poll:
+                    if not is_settled:
+                        events.append((PENDING_EVENT, tx_object))
+                else:
+                    events.append((NEW_EVENT, tx_object))
+            else:
+                if tx_object['double_spend'] and not previous['double_spend']:
+                    events.append((DOUBLE_SPEND_EVENT, tx_object))
+                if tx_object['confirmations'] > previous['confirmations']:
+                    if not previous['confirmations']:
+                        events.append((CONFIRMED_EVENT, tx_object))
+                    else:
+                        events.append((CONFIRMATION_EVENT, tx_object))
+
+            if is_settled:
+                self.followed.pop(tx_hash, None)
+            else:
+                self.followed[tx_hash] = tx_object
+
+        for tx_hash in list(self.followed):
+            if tx_hash not in polled_hashes:
+                events.append((DROPPED_EVENT, self.followed.pop(tx_hash)))
+
+        self.is_first_poll = False
+        return events
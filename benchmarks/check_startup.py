@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+# Startup-time regression check for `bcwallet --version` and `--help`
+#
+#   $ python benchmarks/check_startup.py
+#
+# Fails (exit code 1) if either loads a heavy dependency (see HEAVY_MODULES)
+# or takes more than --max-overhead-ms longer than starting a bare
+# interpreter. Prints the timings as JSON.
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from timeit import default_timer
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# must not be imported just to parse arguments or print the version
+HEAVY_MODULES = (
+        'bitcoin',
+        'bitmerchant',
+        'blockcypher',
+        'clint',
+        'coincurve',
+        'dateutil',
+        'pkg_resources',
+        'requests',
+        'sqlite3',
+        'tzlocal',
+        )
+
+DEFAULT_RUNS = 10
+DEFAULT_MAX_OVERHEAD_MS = 100
+
+# run in a fresh interpreter: print which heavy modules `bcwallet <arg>` loaded
+LOADED_MODULES_SNIPPET = '''
+import sys
+sys.argv = ['bcwallet', %r]
+import bcwallet
+try:
+    bcwallet.invoke_cli()
+except SystemExit:
+    pass
+sys.stderr.write(' '.join(sorted(set(m.split('.')[0] for m, module in sys.modules.items() if module))))
+'''
+
+
+def get_env():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([REPO_DIR] + [x for x in [env.get('PYTHONPATH')] if x])
+    return env
+
+
+def median_ms(cmd, runs):
+    timings = []
+    with open(os.devnull, 'w') as devnull:
+        for _ in range(runs):
+            start = default_timer()
+            subprocess.check_call(cmd, stdout=devnull, stderr=devnull, env=get_env())
+            timings.append((default_timer() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def get_heavy_modules_loaded(arg):
+    p = subprocess.Popen(
+            [sys.executable, '-c', LOADED_MODULES_SNIPPET % arg],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=get_env(),
+            )
+    _, loaded = p.communicate()
+    return [x for x in loaded.split() if x in HEAVY_MODULES]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that bcwallet --version and --help start fast.')
+    parser.add_argument('--runs', dest='runs', type=int, default=DEFAULT_RUNS,
+            help='Runs per command, the median is used (defaults to %s).' % DEFAULT_RUNS)
+    parser.add_argument('--max-overhead-ms', dest='max_overhead_ms', type=float, default=DEFAULT_MAX_OVERHEAD_MS,
+            help='Allowed time over a bare interpreter start, in ms (defaults to %s).' % DEFAULT_MAX_OVERHEAD_MS)
+    args = parser.parse_args()
+
+    baseline_ms = median_ms([sys.executable, '-c', 'pass'], runs=args.runs)
+
+    results = []
+    passed = True
+    for arg in ('--version', '--help'):
+        command_ms = median_ms([sys.executable, '-m', 'bcwallet', arg], runs=args.runs)
+        heavy_modules = get_heavy_modules_loaded(arg)
+        overhead_ms = command_ms - baseline_ms
+        result_passed = not heavy_modules and overhead_ms <= args.max_overhead_ms
+        passed = passed and result_passed
+        results.append({
+            'command': 'bcwallet %s' % arg,
+            'median_ms': command_ms,
+            'overhead_ms': overhead_ms,
+            'heavy_modules_loaded': heavy_modules,
+            'passed': result_passed,
+            })
+        print('%-20s %7.1fms (+%.1fms over python)%s%s' % (
+            'bcwallet %s' % arg,
+            command_ms,
+            overhead_ms,
+            ' loaded %s' % ', '.join(heavy_modules) if heavy_modules else '',
+            '' if result_passed else '  FAILED',
+            ), file=sys.stderr)
+
+    print(json.dumps({
+        'python_ms': baseline_ms,
+        'max_overhead_ms': args.max_overhead_ms,
+        'results': results,
+        'passed': passed,
+        }, indent=2, separators=(',', ': '), sort_keys=True))
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    main()
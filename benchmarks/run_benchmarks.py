@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+
+# Timings for bcwallet's hot paths at several sizes, as JSON for regression
+# tracking (e.g. before and after upgrading bitmerchant or blockcypher):
+#
+#   $ python benchmarks/run_benchmarks.py --out results.json
+#   $ python benchmarks/run_benchmarks.py --sizes 10,1000 --compare results.json
+#
+# The pure-Python backend needs about 1ms per derivation and 10ms per
+# signature, so the 100k sizes take a while (run with --sizes 10,1000 for a
+# quick check, or install bcwallet[fast]).
+
+from __future__ import print_function
+
+# benchmark this checkout rather than an installed bcwallet
+import use_checkout  # noqa: F401
+
+from contextlib import contextmanager
+from datetime import datetime
+from datetime import timedelta
+from binascii import unhexlify
+from hashlib import sha256
+from timeit import default_timer
+
+from bitmerchant.network import BitcoinMainNet
+from bitmerchant.wallet import Wallet
+
+from blockcypher.utils import flatten_txns_by_hash
+
+from dateutil.tz import tzutc
+
+from bcwallet import bc_utils
+from bcwallet import bcwallet
+from bcwallet.bc_utils import hexkeypair_list_to_dict
+from bcwallet.bc_utils import AddressPath
+from bcwallet.bc_utils import verify_and_fill_address_paths_from_bip32key
+from bcwallet.ec_backend import child_keys_to_infos
+from bcwallet.ec_backend import derive_child_info
+from bcwallet.ec_backend import get_backend_name
+from bcwallet.ec_backend import make_tx_signatures
+
+import argparse
+import json
+import os
+import pkg_resources
+import platform
+import sys
+
+
+DEFAULT_SIZES = (10, 1000, 100000)
+
+# sizes above this are only timed once by default
+REPEAT_THRESHOLD = 1000
+DEFAULT_REPEAT = 3
+
+BENCHMARK_SEED = 'bcwallet benchmarks'
+
+# txrefs per synthetic transaction (e.g. an input and a change output)
+TXREFS_PER_TX = 2
+
+# size -> list of child_info dicts for m/0/0 ... m/0/size-1
+FIXTURES = {}
+
+
+def get_master_wallet():
+    # a new object each time, so bitmerchant's per-object child cache is cold
+    return Wallet.from_master_secret(BENCHMARK_SEED, network=BitcoinMainNet)
+
+
+def get_child_infos(size):
+    '''
+    Derived (private) children of m/0, shared by the benchmarks of a size
+    '''
+    for cached_size, child_infos in FIXTURES.items():
+        if cached_size >= size:
+            return child_infos[:size]
+    chain_wallet = get_master_wallet().get_child(0, is_prime=False)
+    FIXTURES[size] = [derive_child_info(chain_wallet=chain_wallet, index=x) for x in range(size)]
+    return FIXTURES[size]
+
+
+def clear_session_caches():
+    bc_utils.CHAIN_WALLET_CACHE.clear()
+    bc_utils.MASTER_WALLET_CACHE.clear()
+    bc_utils.VERIFIED_ADDRESS_CACHE.clear()
+
+
+@contextmanager
+def stdout_to_devnull():
+    '''
+    Discard everything written to stdout (clint's puts holds on to the
+    original sys.stdout, so redirect the file descriptor)
+    '''
+    sys.stdout.flush()
+    saved_fd = os.dup(1)
+    devnull_fd = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull_fd, 1)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        os.dup2(saved_fd, 1)
+        os.close(saved_fd)
+        os.close(devnull_fd)
+
+
+def setup_get_child_for_path(size):
+    paths = ['m/0/%d' % x for x in range(size)]
+    master_wallet = get_master_wallet()
+
+    def run():
+        for path in paths:
+            master_wallet.get_child_for_path(path)
+    return run
+
+
+def setup_verify_and_fill(size):
+    master_key = get_master_wallet().serialize_b58(private=True)
+    address_paths = [{
+        'path': 'm/0/%d' % cnt,
+        'address': child_info['address'],
+        'public': child_info['pubkeyhex'],
+        } for cnt, child_info in enumerate(get_child_infos(size))]
+    clear_session_caches()
+
+    def run():
+        verify_and_fill_address_paths_from_bip32key(
+                address_paths=address_paths,
+                master_key=master_key,
+                network=BitcoinMainNet,
+                )
+    return run
+
+
+def setup_key_encoding(size):
+    child_keys = [(unhexlify(x['pubkeyhex']), unhexlify(x['privkeyhex'])) for x in get_child_infos(size)]
+
+    def run():
+        # addresses and WIFs only, the EC math is not included
+        child_keys_to_infos(child_keys=child_keys, network=BitcoinMainNet)
+    return run
+
+
+def setup_hexkeypair_list_to_dict(size):
+    address_paths = [AddressPath(
+        path='m/0/%d' % cnt,
+        address=child_info['address'],
+        pubkey=unhexlify(child_info['pubkeyhex']),
+        privkey=unhexlify(child_info['privkeyhex']),
+        network=BitcoinMainNet,
+        ) for cnt, child_info in enumerate(get_child_infos(size))]
+
+    def run():
+        hexkeypair_list_to_dict(address_paths)
+    return run
+
+
+def setup_make_tx_signatures(size):
+    child_infos = get_child_infos(size)
+    txs_to_sign = [sha256(str(x)).hexdigest() for x in range(size)]
+    privkey_list = [x['privkeyhex'] for x in child_infos]
+    pubkey_list = [x['pubkeyhex'] for x in child_infos]
+
+    def run():
+        make_tx_signatures(
+                txs_to_sign=txs_to_sign,
+                privkey_list=privkey_list,
+                pubkey_list=pubkey_list,
+                )
+    return run
+
+
+def get_synthetic_txrefs(size):
+    '''
+    size txrefs (as returned by get_wallet_transactions), newest first
+    '''
+    tip_time = datetime(2016, 1, 1, tzinfo=tzutc())
+    txrefs = []
+    for cnt in range(size):
+        tx_num = cnt // TXREFS_PER_TX
+        is_spend = cnt % TXREFS_PER_TX == 0 and tx_num % 2 == 0
+        txrefs.append({
+            'address': 'address%d' % cnt,
+            'tx_hash': sha256(str(tx_num)).hexdigest(),
+            'block_height': 400000 - tx_num,
+            'tx_input_n': 0 if is_spend else -1,
+            'tx_output_n': -1 if is_spend else 0,
+            'value': 10000 + cnt,
+            'confirmations': tx_num + 1,
+            'confirmed': tip_time - timedelta(minutes=10 * tx_num),
+            'double_spend': False,
+            })
+    return txrefs
+
+
+def setup_display_recent_txs(size):
+    txrefs = get_synthetic_txrefs(size)
+    local_tz = tzutc()
+
+    def run():
+        # the rendering loop of display_recent_txs
+        with stdout_to_devnull():
+            for tx_object in flatten_txns_by_hash(txrefs, nesting=False):
+                bcwallet.print_tx_object(
+                        tx_object=tx_object,
+                        coin_symbol='btc',
+                        local_tz=local_tz,
+                        )
+    return run
+
+
+def setup_print_path_info(size):
+    path_rows = [('m/0/%d' % cnt, x['address'], x['wif']) for cnt, x in enumerate(get_child_infos(size))]
+
+    def run():
+        # the loop of print_path_info_batch (with balances already fetched)
+        user_online = bcwallet.USER_ONLINE
+        bcwallet.USER_ONLINE = True
+        try:
+            with stdout_to_devnull():
+                for cnt, (path, address, wif) in enumerate(path_rows):
+                    bcwallet.print_path_info(
+                            address=address,
+                            path=path,
+                            wif=wif,
+                            coin_symbol='btc',
+                            addr_balance=cnt * 1000,
+                            )
+        finally:
+            bcwallet.USER_ONLINE = user_online
+    return run
+
+
+BENCHMARKS = (
+        ('get_child_for_path', setup_get_child_for_path),
+        ('verify_and_fill_address_paths_from_bip32key', setup_verify_and_fill),
+        ('key_encoding', setup_key_encoding),
+        ('hexkeypair_list_to_dict', setup_hexkeypair_list_to_dict),
+        ('make_tx_signatures', setup_make_tx_signatures),
+        ('display_recent_txs', setup_display_recent_txs),
+        ('print_path_info', setup_print_path_info),
+        )
+
+
+def time_benchmark(setup, size, repeat):
+    '''
+    Returns the seconds each of repeat runs took (setup is not timed)
+    '''
+    timings = []
+    for _ in range(repeat):
+        run = setup(size)
+        start = default_timer()
+        run()
+        timings.append(default_timer() - start)
+    return timings
+
+
+def get_versions():
+    versions = {}
+    for package_name in ('bitmerchant', 'blockcypher', 'clint'):
+        try:
+            versions[package_name] = pkg_resources.get_distribution(package_name).version
+        except pkg_resources.DistributionNotFound:
+            versions[package_name] = None
+    return versions
+
+
+def compare_results(results, baseline_filename):
+    with open(baseline_filename) as f:
+        baseline = json.load(f)
+    baseline_seconds = dict([((x['benchmark'], x['size']), x['best_seconds']) for x in baseline['results']])
+
+    print('\nCompared to %s:' % baseline_filename, file=sys.stderr)
+    for result in results:
+        key = (result['benchmark'], result['size'])
+        if not baseline_seconds.get(key):
+            continue
+        print('  %-45s %8s  %.2fx' % (
+            result['benchmark'],
+            result['size'],
+            result['best_seconds'] / baseline_seconds[key],
+            ), file=sys.stderr)
+
+
+def size_list_arg(value):
+    try:
+        sizes = [int(x) for x in value.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError('%s is not a comma-separated list of sizes' % value)
+    if not sizes or min(sizes) < 1:
+        raise argparse.ArgumentTypeError('Sizes must be positive')
+    return sizes
+
+
+def main():
+    benchmark_names = [x[0] for x in BENCHMARKS]
+    parser = argparse.ArgumentParser(description='Time bcwallet hot paths and write the results as JSON.')
+    parser.add_argument('--sizes', dest='sizes', default=list(DEFAULT_SIZES), type=size_list_arg,
+            help='Comma-separated sizes (defaults to %s).' % ','.join([str(x) for x in DEFAULT_SIZES]))
+    parser.add_argument('--only', dest='only', action='append', choices=benchmark_names,
+            help='Run only this benchmark (may be repeated).')
+    parser.add_argument('--repeat', dest='repeat', type=int, default=None,
+            help='Runs per benchmark and size, the best is reported (defaults to %s, or 1 above size %s).' % (
+                DEFAULT_REPEAT, REPEAT_THRESHOLD))
+    parser.add_argument('--out', dest='out', default='-',
+            help='File to write the JSON results to (defaults to - for stdout).')
+    parser.add_argument('--compare', dest='compare', default='',
+            help='Previous results file to compare against (ratios are printed to stderr).')
+    args = parser.parse_args()
+
+    # normally set from --units
+    bcwallet.UNIT_CHOICE = 'bit'
+
+    results = []
+    for benchmark_name, setup in BENCHMARKS:
+        if args.only and benchmark_name not in args.only:
+            continue
+        for size in args.sizes:
+            if args.repeat:
+                repeat = args.repeat
+            else:
+                repeat = DEFAULT_REPEAT if size <= REPEAT_THRESHOLD else 1
+            timings = time_benchmark(setup=setup, size=size, repeat=repeat)
+            result = {
+                    'benchmark': benchmark_name,
+                    'size': size,
+                    'repeat': repeat,
+                    'best_seconds': min(timings),
+                    'mean_seconds': sum(timings) / len(timings),
+                    'per_item_us': min(timings) / size * 10**6,
+                    }
+            results.append(result)
+            print('%-45s %8s  %10.4fs  %10.1fus/item' % (
+                benchmark_name, size, result['best_seconds'], result['per_item_us']), file=sys.stderr)
+
+    output = {
+            'created_at': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'secp256k1_backend': get_backend_name(),
+            'versions': get_versions(),
+            'results': results,
+            }
+    output_json = json.dumps(output, indent=2, separators=(',', ': '), sort_keys=True)
+    if args.out == '-':
+        print(output_json)
+    else:
+        with open(args.out, 'w') as f:
+            f.write(output_json + '\n')
+
+    if args.compare:
+        compare_results(results=results, baseline_filename=args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+
+# Imported first by the benchmarks so they run against this checkout rather
+# than an installed bcwallet (kept out of the benchmark scripts so their
+# imports stay at the top of the file)
+
+import os
+import sys
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
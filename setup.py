@@ -4,6 +4,7 @@ from setuptools import setup
 
 setup(
         name='bcwallet',
+        # keep in sync with BCWALLET_VERSION in bcwallet/launcher.py
         version='1.2.4',
         description='Simple BIP32 HD cryptocurrecy command line wallet',
         author='Michael Flaxman',
@@ -13,12 +14,21 @@ setup(
         install_requires=[
             'clint==0.4.1',
             'blockcypher==1.0.69',
+            # pure-Python ripemd160 where OpenSSL lacks it (also a blockcypher dependency)
+            'bitcoin==1.1.39',
             'bitmerchant==0.1.8',
             'tzlocal==1.2',
+            # used directly by the pub cache (also a blockcypher dependency)
+            'python-dateutil==2.2',
             ],
+        extras_require={
+            # libsecp256k1 for much faster key derivation and signing
+            'fast': ['coincurve'],
+            },
         entry_points='''
             [console_scripts]
             bcwallet=bcwallet:invoke_cli
+            bcwallet-mock-server=bcwallet.mock_server:main
         ''',
         packages=['bcwallet'],
         )